@@ -0,0 +1,33 @@
+# Tiny CPU-only run of the distillation recipe to check that config, dataset, teacher loading and losses fit together.
+# Run it with CUDA hidden, e.g.: CUDA_VISIBLE_DEVICES= python scripts/training/train-mosaic-restoration-basicvsrpp.py configs/basicvsrpp/mosaic_restoration_fast_distill_cpu_smoke_test.py
+from mmengine.config import read_base
+
+with read_base():
+    from .mosaic_restoration_fast_distill import *
+
+experiment_name = 'mosaic_restoration_fast_distill_cpu_smoke_test'
+work_dir = f'./experiments/basicvsrpp/{experiment_name}'
+
+model.update(train_cfg=dict(fix_iter=1))
+
+train_dataloader.update(num_workers=0, batch_size=1)
+train_dataloader['dataset'].update(num_frame=4)
+val_dataloader.update(num_workers=0)
+val_dataloader['dataset'].update(num_frame=4)
+
+train_cfg = dict(
+    type='IterBasedTrainLoop', max_iters=4, val_interval=2)
+
+env_cfg = dict(
+    cudnn_benchmark=False,
+    mp_cfg=dict(mp_start_method='fork', opencv_num_threads=1),
+    dist_cfg=dict(backend='gloo'),
+)
+
+vis_backends = [dict(type='LocalVisBackend')]
+visualizer.update(vis_backends=vis_backends)
+custom_hooks = []
+
+default_hooks = dict(
+    checkpoint=dict(type='CheckpointHook', by_epoch=False, interval=4, out_dir=work_dir, max_keep_ckpts=1, save_best=None),
+    logger=dict(type='LoggerHook', interval=1, log_metric_by_epoch=False))
@@ -10,3 +10,14 @@ os.environ["NO_ALBUMENTATIONS_UPDATE"] = "1"
 VERSION = '0.7.0-dev'
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING")
+
+# 0: FFmpeg chooses number of decoding threads based on available CPU cores
+DECODE_THREADS = int(os.environ.get("LADA_DECODE_THREADS", "0"))
+
+if "LADA_CACHE_DIR" in os.environ:
+  CACHE_DIR = os.environ["LADA_CACHE_DIR"]
+else:
+  CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "lada")
+
+# also cache video metadata on disk (in CACHE_DIR), helpful if the same (large number of) files are processed repeatedly
+PROBE_DISK_CACHE = os.environ.get("LADA_PROBE_DISK_CACHE", "0") == "1"
@@ -0,0 +1,101 @@
+import logging
+
+import torch
+
+from lada.basicvsrpp.mmagic.registry import MODELS
+from lada.basicvsrpp.mmagic.basicvsr import BasicVSR
+from lada.basicvsrpp.inference import load_generator_state_dict
+
+logger = logging.getLogger(__name__)
+
+
+@MODELS.register_module()
+class BasicVSRPlusPlusDistill(BasicVSR):
+    """Knowledge distillation of a (smaller) BasicVSR++ student generator from a frozen, pretrained BasicVSR++ GAN teacher.
+
+    The student is trained to reproduce the outputs of the teacher generator. The pixel loss against the ground truth
+    is kept as an additional (usually down-weighted) regularizer so the student doesn't pick up teacher artifacts.
+
+    Args:
+        generator (dict): Config for the student generator.
+        teacher (dict): Config for the teacher generator.
+        teacher_pretrained (str): Path to the teacher checkpoint (exported inference weights or training checkpoint).
+        distill_loss (dict): Config for the loss between student and teacher outputs.
+        pixel_loss (dict): Config for the loss between student output and ground truth.
+        train_cfg (dict): Config for training. Default: None.
+        test_cfg (dict): Config for testing. Default: None.
+        init_cfg (dict, optional): The weight initialized config for
+            :class:`BaseModule`.
+        data_preprocessor (dict, optional): The pre-process config of
+            :class:`BaseDataPreprocessor`.
+    """
+
+    def __init__(self,
+                 generator,
+                 teacher,
+                 teacher_pretrained,
+                 distill_loss,
+                 pixel_loss,
+                 train_cfg=None,
+                 test_cfg=None,
+                 init_cfg=None,
+                 data_preprocessor=None):
+        super().__init__(
+            generator=generator,
+            pixel_loss=pixel_loss,
+            train_cfg=train_cfg,
+            test_cfg=test_cfg,
+            init_cfg=init_cfg,
+            data_preprocessor=data_preprocessor)
+
+        self.teacher = MODELS.build(teacher)
+        if teacher_pretrained:
+            self.teacher.load_state_dict(load_generator_state_dict(teacher_pretrained), strict=True)
+            logger.info(f"loaded teacher weights from {teacher_pretrained}")
+        self.teacher.requires_grad_(False)
+        self.teacher.eval()
+
+        self.distill_loss = MODELS.build(distill_loss)
+
+    def train(self, mode=True):
+        super().train(mode)
+        # teacher stays in eval mode at all times
+        self.teacher.eval()
+        return self
+
+    def forward_train(self, inputs, data_samples=None, **kwargs):
+        """Forward training. Returns dict of losses of training.
+
+        Args:
+            inputs (torch.Tensor): batch input tensor collated by
+                :attr:`data_preprocessor`.
+            data_samples (List[BaseDataElement], optional):
+                data samples collated by :attr:`data_preprocessor`.
+
+        Returns:
+            dict: Dict of losses.
+        """
+
+        # fix SPyNet at the beginning
+        if self.step_counter < self.fix_iter:
+            if not self.is_weight_fixed:
+                self.is_weight_fixed = True
+                for k, v in self.generator.named_parameters():
+                    if 'spynet' in k:
+                        v.requires_grad_(False)
+        elif self.step_counter == self.fix_iter:
+            # train all the parameters
+            self.generator.requires_grad_(True)
+
+        with torch.no_grad():
+            teacher_feats = self.teacher(inputs)
+
+        feats = self.forward_tensor(inputs, data_samples, **kwargs)
+        batch_gt_data = data_samples.gt_img
+
+        losses = dict()
+        losses['loss_distill'] = self.distill_loss(feats, teacher_feats)
+        losses['loss_pix'] = self.pixel_loss(feats, batch_gt_data)
+        self.step_counter += 1
+
+        return losses
@@ -1,33 +1,11 @@
 from lada.basicvsrpp.mmagic.registry import MODELS
 from lada.basicvsrpp.mmagic.basicvsr_plusplus_net import BasicVSRPlusPlusNet
 from lada.basicvsrpp.mmagic.real_basicvsr import RealBasicVSR
+from lada.basicvsrpp.basicvsrpp_net import BasicVSRPlusPlusGanNet
 
-@MODELS.register_module()
-class BasicVSRPlusPlusGanNet(BasicVSRPlusPlusNet):
-    def __init__(self,
-                **kwargs):
-
-        super().__init__(**kwargs)
-        self.spynet.requires_grad_(False)
-
-
-    def forward(self, lqs, return_lqs=False):
-        """Forward function for BasicVSR++.
-
-        Args:
-            lqs (tensor): Input low quality (LQ) sequence with
-                shape (n, t, c, h, w).
-            return_lqs (bool): Whether to return LQ sequence. Default: False.
-
-        Returns:
-            Tensor: Output HR sequence.
-        """
-        outputs = super().forward(lqs)
-
-        if return_lqs:
-            return outputs, lqs
-        else:
-            return outputs
+# networks are defined without mmengine dependency (see basicvsrpp_net.py) so we have to register them here
+MODELS.register_module(module=BasicVSRPlusPlusNet)
+MODELS.register_module(module=BasicVSRPlusPlusGanNet)
 
 @MODELS.register_module()
 class BasicVSRPlusPlusGan(RealBasicVSR):
@@ -0,0 +1,27 @@
+from lada.basicvsrpp.mmagic.basicvsr_plusplus_net import BasicVSRPlusPlusNet
+
+class BasicVSRPlusPlusGanNet(BasicVSRPlusPlusNet):
+    def __init__(self,
+                **kwargs):
+
+        super().__init__(**kwargs)
+        self.spynet.requires_grad_(False)
+
+
+    def forward(self, lqs, return_lqs=False):
+        """Forward function for BasicVSR++.
+
+        Args:
+            lqs (tensor): Input low quality (LQ) sequence with
+                shape (n, t, c, h, w).
+            return_lqs (bool): Whether to return LQ sequence. Default: False.
+
+        Returns:
+            Tensor: Output HR sequence.
+        """
+        outputs = super().forward(lqs)
+
+        if return_lqs:
+            return outputs, lqs
+        else:
+            return outputs
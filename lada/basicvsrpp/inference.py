@@ -3,22 +3,28 @@ import os.path
 
 import numpy as np
 import torch
-from lada.basicvsrpp.mmagic.registry import MODELS
-from lada.basicvsrpp import register_all_modules
-from mmengine.config import Config
-from mmengine.runner import load_checkpoint
 
+from lada.basicvsrpp.basicvsrpp_net import BasicVSRPlusPlusGanNet
+from lada.basicvsrpp.mmagic.basicvsr_plusplus_net import BasicVSRPlusPlusNet
 from lada.lib.image_utils import img2tensor, tensor2img
+from lada.lib.safetensors_utils import is_safetensors_file, load_safetensors
 
 logger = logging.getLogger(__name__)
 
-def get_default_gan_inference_config() -> dict:
+# Inference only needs the generator network. It's built directly (without mmengine registry / config) so that
+# mmengine, which is only needed for training, is not imported at runtime.
+GENERATORS = {
+    'BasicVSRPlusPlusNet': BasicVSRPlusPlusNet,
+    'BasicVSRPlusPlusGanNet': BasicVSRPlusPlusGanNet,
+}
+
+def get_default_gan_inference_config(mid_channels=64, num_blocks=15) -> dict:
     return dict(
         type='BasicVSRPlusPlusGan',
         generator=dict(
             type='BasicVSRPlusPlusGanNet',
-            mid_channels=64,
-            num_blocks=15,
+            mid_channels=mid_channels,
+            num_blocks=num_blocks,
             spynet_pretrained=None),
         pixel_loss=dict(type='CharbonnierLoss', loss_weight=1.0, reduction='mean'),
         is_use_ema=True,
@@ -28,20 +34,55 @@ def get_default_gan_inference_config() -> dict:
             std=[255., 255., 255.],
         ))
 
+def get_default_fast_gan_inference_config() -> dict:
+    # distilled student model, see configs/basicvsrpp/mosaic_restoration_fast_distill.py
+    return get_default_gan_inference_config(mid_channels=32, num_blocks=7)
+
+
+def load_generator_state_dict(checkpoint_path, prefix='generator_ema.') -> dict:
+    """Extracts the weights of a single generator from a (exported or training) BasicVSRPlusPlusGan checkpoint.
+
+    Falls back to the non-EMA generator weights if the checkpoint does not contain EMA weights.
+    """
+    checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=True)
+    state_dict = checkpoint.get('state_dict', checkpoint)
+    if not any(k.startswith(prefix) for k in state_dict):
+        prefix = 'generator.'
+    return {k[len(prefix):]: v for k, v in state_dict.items() if k.startswith(prefix)}
+
+
+def build_generator(config: dict) -> torch.nn.Module:
+    generator_config = dict(config['generator'])
+    generator_type = generator_config.pop('type')
+    if generator_type not in GENERATORS:
+        raise NotImplementedError(f"unsupported generator type: {generator_type}")
+    # weights of the whole generator incl. SPyNet will be loaded from the checkpoint
+    generator_config['spynet_pretrained'] = None
+    return GENERATORS[generator_type](**generator_config)
+
 
 def load_model(config: str | dict | None, checkpoint_path, device):
-    register_all_modules()
     if device and type(device) == str:
         device = torch.device(device)
     if type(config) == str:
-        config = Config.fromfile(config).model
+        # training config files are mmengine config files so we need mmengine to parse them
+        from mmengine.config import Config
+        config = Config.fromfile(config).model.to_dict()
     elif type(config) == dict:
         pass
     else:
         raise Exception("unsupported value for 'config', Must be either a file path to a config file or a dict definition of the model")
-    model = MODELS.build(config)
-    load_checkpoint(model, checkpoint_path, map_location='cpu', logger=logger)
-    model.cfg = config
+    if is_safetensors_file(checkpoint_path):
+        # generator-only weights (see scripts/training/export-weights-safetensors.py). Skip random weight init by building the
+        # model on the meta device and let it use the memory-mapped weights directly
+        with torch.device('meta'):
+            model = build_generator(config)
+        state_dict, _ = load_safetensors(checkpoint_path, device=device if device else 'cpu')
+        model.load_state_dict(state_dict, strict=True, assign=True)
+    else:
+        model = build_generator(config)
+        prefix = 'generator_ema.' if config.get('is_use_ema', False) else 'generator.'
+        model.load_state_dict(load_generator_state_dict(checkpoint_path, prefix), strict=True)
     model.to(device)
     model.eval()
     return model
@@ -58,11 +99,11 @@ def inference(model, video: list, device, max_frames=-1):
         input = torch.unsqueeze(input, dim=0)  # TCHW -> BTCHW
         if max_frames > 0:
             for i in range(0, input.shape[1], max_frames):
-                output = model(inputs=input[:, i:i + max_frames].to(device))
+                output = model(input[:, i:i + max_frames].to(device))
                 result.append(output)
             result = torch.cat(result, dim=1)
         else:
-            result = model(inputs=input.to(device))
+            result = model(input.to(device))
         result = torch.squeeze(result, dim=0)  # BTCHW -> TCHW
         result = list(torch.unbind(result, 0))
         output = tensor2img(result, rgb2bgr=False, out_type=np.uint8, min_max=(0, 1))
@@ -1,8 +1,7 @@
-from mmengine import DefaultScope
-
 SCOPE = 'lada.basicvsrpp.mmagic'
 
 def register_all_modules():
+    from mmengine import DefaultScope
     from .base_edit_model import BaseEditModel
     from .basicvsr_plusplus_net import BasicVSRPlusPlusNet
     from .basicvsr import BasicVSR
@@ -3,21 +3,19 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torchvision
-from mmengine import MMLogger
-from mmengine.model import BaseModule
-from mmengine.model.weight_init import constant_init, kaiming_init
-from mmengine.runner import load_checkpoint
 from torch import Tensor
 
 from lada.basicvsrpp.deformconv import ModulatedDeformConv2d
 from .flow_warp import flow_warp
+from .model_utils import constant_init, kaiming_init
 from .model_utils import default_init_weights
 from .model_utils import make_layer
-from .registry import MODELS
 
+# Note: The network definition is kept free of mmengine imports so it can be used for inference without the training
+# framework. It is registered to the mmengine model registry in lada.basicvsrpp.basicvsrpp_gan.
 
-@MODELS.register_module()
-class BasicVSRPlusPlusNet(BaseModule):
+
+class BasicVSRPlusPlusNet(nn.Module):
     """BasicVSR++ network structure.
 
     Support either x4 upsampling or same size output.
@@ -325,7 +323,7 @@ class SecondOrderDeformableAlignment(ModulatedDeformConv2d):
                                              self.stride, self.padding,
                                              self.dilation, mask)
 
-class ResidualBlocksWithInputConv(BaseModule):
+class ResidualBlocksWithInputConv(nn.Module):
     """Residual blocks with a convolution in front.
 
     Args:
@@ -363,7 +361,7 @@ class ResidualBlocksWithInputConv(BaseModule):
         return self.main(feat)
 
 
-class SPyNet(BaseModule):
+class SPyNet(nn.Module):
     """SPyNet network structure.
 
     The difference to the SPyNet in [tof.py] is that
@@ -384,6 +382,8 @@ class SPyNet(BaseModule):
             [SPyNetBasicModule() for _ in range(6)])
 
         if isinstance(pretrained, str):
+            from mmengine import MMLogger
+            from mmengine.runner import load_checkpoint
             logger = MMLogger.get_current_instance()
             load_checkpoint(self, pretrained, strict=True, logger=logger)
         elif pretrained is not None:
@@ -511,7 +511,7 @@ class SPyNetConvModule(nn.Module):
             x = self.activate(x)
         return x
 
-class SPyNetBasicModule(BaseModule):
+class SPyNetBasicModule(nn.Module):
     """Basic Module for SPyNet.
 
     Paper:
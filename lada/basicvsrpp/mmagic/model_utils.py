@@ -1,14 +1,43 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import logging
-from typing import Any, Dict, List, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
 import torch
 import torch.nn as nn
-from mmengine.model.weight_init import (constant_init, kaiming_init,
-                                        normal_init, update_init_info,
-                                        xavier_init)
-from mmengine.registry import Registry
-from mmengine.utils.dl_utils.parrots_wrapper import _BatchNorm
+from torch.nn.modules.batchnorm import _BatchNorm
+
+if TYPE_CHECKING:
+    from mmengine.registry import Registry
+
+# Note: This module must not import mmengine at runtime. It's used by the network definition of BasicVSR++ which is
+# also used for inference where we don't want to pull in the training framework.
+
+
+def constant_init(module: nn.Module, val: float, bias: float = 0) -> None:
+    """Same as mmengine.model.weight_init.constant_init."""
+    if hasattr(module, 'weight') and module.weight is not None:
+        nn.init.constant_(module.weight, val)
+    if hasattr(module, 'bias') and module.bias is not None:
+        nn.init.constant_(module.bias, bias)
+
+
+def kaiming_init(module: nn.Module,
+                 a: float = 0,
+                 mode: str = 'fan_out',
+                 nonlinearity: str = 'relu',
+                 bias: float = 0,
+                 distribution: str = 'normal') -> None:
+    """Same as mmengine.model.weight_init.kaiming_init."""
+    assert distribution in ['uniform', 'normal']
+    if hasattr(module, 'weight') and module.weight is not None:
+        if distribution == 'uniform':
+            nn.init.kaiming_uniform_(
+                module.weight, a=a, mode=mode, nonlinearity=nonlinearity)
+        else:
+            nn.init.kaiming_normal_(
+                module.weight, a=a, mode=mode, nonlinearity=nonlinearity)
+    if hasattr(module, 'bias') and module.bias is not None:
+        nn.init.constant_(module.bias, bias)
 
 
 def default_init_weights(module, scale=1):
@@ -82,7 +111,7 @@ def set_requires_grad(nets, requires_grad=False):
                 param.requires_grad = requires_grad
 
 
-def build_module(module: Union[dict, nn.Module], builder: Registry, *args,
+def build_module(module: Union[dict, nn.Module], builder: 'Registry', *args,
                  **kwargs) -> Any:
     """Build module from config or return the module itself.
 
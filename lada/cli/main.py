@@ -1,37 +1,53 @@
 import argparse
+import glob
 import pathlib
+import shutil
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
 
-import av
-import torch
-from tqdm import tqdm
 import os
 import tempfile
 from lada import MODEL_WEIGHTS_DIR, VERSION
-from lada.lib.frame_restorer import load_models, FrameRestorer
-from lada.lib.video_utils import get_video_meta_data, VideoWriter
-from lada.lib import audio_utils
+
+# Heavy dependencies (torch, ultralytics, cv2, av, ...) are imported lazily so that argument parsing, --help and --version
+# return instantly. See scripts/evaluation/benchmark-cli-startup.py
 
 def parse_args():
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(epilog='To find out which parts of a video contain mosaics without restoring it, use "lada-cli scan". See "lada-cli scan --help"')
 
-    parser.add_argument('--input', type=str, help='Path to pixelated video file')
-    parser.add_argument('--output', type=str, help='Path to save restored video')
+    parser.add_argument('--input', type=str, nargs='+', help='Path to pixelated video file. To restore multiple files at once you can also pass multiple paths, directories, glob patterns (e.g. "videos/**/*.mp4") or text files (.txt) containing one path per line. Use "-" to read a single video from stdin, it needs to be in a streamable container format like MPEG-TS or Matroska')
+    parser.add_argument('--output', type=str, help='Path to save restored video. If multiple input files are given this is the output directory, restored files will be named <input name>.restored.mp4. Use "-" to write a fragmented MP4 to stdout')
+    parser.add_argument('--skip-existing', default=None, action=argparse.BooleanOptionalAction, help="Don't restore files whose output file already exists. Output files will only be created once restoration finished successfully (a --streaming-output hls playlist is only considered finished once it has its end tag) so this allows resuming an interrupted batch (default: enabled if multiple input files are given, a single output file will be overwritten)")
     parser.add_argument('--device', type=str, default="cuda:0", help='torch device to run the models on. Use "cpu" or "cuda". If you have multiple GPUs you can select a specific one via index e.g. "cuda:0" (default: %(default)s)')
     parser.add_argument('--max-clip-length', type=int, default=180, help='number of consecutive frames that will be fed to mosaic restoration model. Lower values reduce RAM and VRAM usage. If set too low quality will reduce / flickering (default: %(default)s)')
     parser.add_argument('--preserve-relative-scale',  default=True, action=argparse.BooleanOptionalAction, help="(default: %(default)s)")
     parser.add_argument('--version', action='store_true', help="Shows version")
+    parser.add_argument('--server', type=str, nargs='?', const="http://127.0.0.1:8421", help="Don't load models in this process but submit the restoration jobs to a running lada-server (default URL if no value is given: %(const)s). Model options are ignored in this mode, the server decides which models to use")
+    parser.add_argument('--frame-format', type=str, default='bgr24', choices=['bgr24', 'yuv420p'], help="'yuv420p' keeps decoded frames in YUV until they're encoded. Only restored regions are converted, which saves two full-frame color conversions per frame and a third of the memory of buffered frames. Needs even video width and height, otherwise bgr24 will be used (default: %(default)s)")
+    parser.add_argument('--pipeline-executor', type=str, default='thread', choices=['thread', 'process'], help="'process' runs mosaic detection (decoding, detection and clip creation) in a separate process so it doesn't compete with restoration and encoding for the GIL. Can be faster on CPUs with many cores but loads the detection model twice and needs enough shared memory (/dev/shm) (default: %(default)s)")
+    parser.add_argument('--detection-stride', type=int, default=1, help="Run mosaic detection only on every n-th frame and interpolate detections for the frames in between. Frames will still be detected if detections can't be tracked reliably. Values like 2 or 3 reduce detection cost, use scripts/evaluation/evaluate-detection-stride.py to check accuracy on your files (default: %(default)s)")
+    parser.add_argument('--streams', type=int, default=1, help="Number of files restored at the same time if multiple input files are given. Streams share the models and batch their inference together to make better use of the device (default: %(default)s)")
+    parser.add_argument('--priority', type=int, default=0, help="Priority of the jobs submitted to lada-server. Jobs with higher priority will be processed first (default: %(default)s)")
 
     export = parser.add_argument_group('Video export (Encoder settings)')
     export.add_argument('--codec', type=str, default="h264", help='FFmpeg video codec. E.g. "h264, "hevc" or "hevc_nvenc". Use "--list-available-codecs" to see whats available. (default: %(default)s)')
     export.add_argument('--crf', type=int, default=None, help='Constant rate factor (quality setting for video encoder). The lower the better with the caveat of producing larger files size and increased compute resources. Note: If you have selected GPU codecs "h264_nvenc" or "hevc_nvenc" then the option "qp" will be used instead as those encoders do not support the option "crf". (default: %(default)s)')
     export.add_argument('--preset', type=str, default=None, help='Encoder preset. Mostly affects file-size and speed. (default: %(default)s)')
+    export.add_argument('--encoder-governor', default=False, action=argparse.BooleanOptionalAction, help="Adapt the encoder preset to the restoration speed if multiple input files are given: If the encoder couldn't keep up with restoration the next file will use a faster preset, if it was mostly idle a slower one (better compression). --preset is the initial preset. Only for x264, x265 and NVENC codecs, not used with --server (default: %(default)s)")
+    export.add_argument('--encoder-governor-fastest-preset', type=str, default=None, help="Fastest preset the encoder governor may choose (default: veryfast for x264/x265, p1 for NVENC)")
+    export.add_argument('--encoder-governor-slowest-preset', type=str, default=None, help="Slowest preset the encoder governor may choose (default: --preset or the encoder's default preset)")
     export.add_argument('--moov-front',  default=False, action=argparse.BooleanOptionalAction, help="sets ffmpeg mov flags 'frag_keyframe+empty_moov+faststart'. Enables playing the output video while it's being written (default: %(default)s)")
+    export.add_argument('--streaming-output', type=str, default=None, choices=['fmp4', 'hls'], help="Write the output progressively instead of finalizing it at the end so it can be watched (or ingested) while it's being restored. 'fmp4' writes a fragmented MP4 file (named <output>.part until it's finished), 'hls' a HLS playlist (.m3u8) with MPEG-TS segments next to it (an interrupted playlist lacks its end tag and won't be skipped by --skip-existing). Audio is interleaved while writing. Not used with --server (default: %(default)s)")
+    export.add_argument('--ranges', type=str, default=None, help="Restore only the given time ranges, e.g. \"00:10:00-00:12:30,01:02:03.5-01:04:00\" (times as [[hh:]mm:]ss[.fff]). Ranges are extended to the surrounding keyframes of closed GOPs (open GOP encodes, e.g. x265 with default settings, can only be split at few of their keyframes), the rest of the video is copied without re-encoding. Restored parts are encoded with the codec of the input file (h264 or hevc) with its pixel format, profile and level, --codec is ignored (default: whole video)")
     export.add_argument('--list-codecs', action='store_true', help="List available Codecs and hardware devices / GPUs for hardware-accelerated video encoding. Uses FFmpeg wrapper library PyAV which is used for encoding the restored video.")
     export.add_argument('--custom-encoder-options', type=str, help="Pass arbitrary encoder options. Pass it like you'd specify them using ffmpeg cli. e.g --custom-encoder-options \"-rc-lookahead 32 -rc vbr_hq\".")
 
     group_restoration = parser.add_argument_group('Mosaic restoration')
-    group_restoration.add_argument('--mosaic-restoration-model', type=str, default="basicvsrpp-generic", help="Model used to restore mosaic clips (default: %(default)s)")
-    group_restoration.add_argument('--mosaic-restoration-model-path', type=str, default=os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_generic_v1.2.pth'), help="(default: %(default)s)")
+    group_restoration.add_argument('--mosaic-restoration-model', type=str, default="basicvsrpp-generic", help="Model used to restore mosaic clips. Use \"basicvsrpp-fast\" for the smaller, distilled model which trades some quality for speed (default: %(default)s)")
+    group_restoration.add_argument('--mosaic-restoration-model-path', type=str, help="(default: model weights file of the selected --mosaic-restoration-model in %s)" % MODEL_WEIGHTS_DIR)
     group_restoration.add_argument('--mosaic-restoration-config-path', type=str)
 
     group_detection = parser.add_argument_group('Mosaic detection')
@@ -39,7 +55,16 @@ def parse_args():
 
     return parser.parse_args()
 
+def get_default_mosaic_restoration_model_path(mosaic_restoration_model_name):
+    if mosaic_restoration_model_name.startswith("basicvsrpp-fast"):
+        return os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_fast_v1.0.pth')
+    elif mosaic_restoration_model_name.startswith("deepmosaics"):
+        return os.path.join(MODEL_WEIGHTS_DIR, '3rd_party', 'clean_youknow_video.pth')
+    else:
+        return os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_generic_v1.2.pth')
+
 def dump_pyav_codecs():
+    import av
     print(f"PyAV version: {av.__version__}")
 
     from av.codec.codec import dump_codecs
@@ -59,63 +84,572 @@ def dump_pyav_codecs():
     except ImportError:
         print("Unable to list hwdevice configs, ImportError")
 
-def main():
-    args = parse_args()
-    if args.version:
-        print("Lada: ", VERSION)
-        exit(0)
-    if args.list_codecs:
-        dump_pyav_codecs()
-        exit(0)
-    if not (args.input and args.output):
-        print("Arguments --input and --output are required. Use --help to find out more.")
-        exit(1)
-    if args.device.startswith("cuda") and not torch.cuda.is_available():
-        print(f"GPU {args.device} selected but CUDA is not available")
-        exit(1)
+def collect_input_files(inputs: list[str]) -> list[str]:
+    """
+    Expands the given --input values into a list of video files. Each value can be a video file, a directory
+    (video files directly inside of it), a glob pattern or a text file (.txt) listing one path per line.
+    """
+    from lada.lib.video_utils import is_video_file
+    input_files = []
+    for path in inputs:
+        if path == '-':
+            input_files.append(path)
+        elif os.path.isdir(path):
+            input_files.extend(sorted(os.path.join(path, f) for f in os.listdir(path) if is_video_file(f) and os.path.isfile(os.path.join(path, f))))
+        elif os.path.isfile(path) and os.path.splitext(path)[1].lower() == '.txt':
+            with open(path, 'r') as file_list:
+                lines = [line.strip() for line in file_list]
+            input_files.extend(line for line in lines if line and not line.startswith('#'))
+        elif os.path.isfile(path):
+            input_files.append(path)
+        elif any(c in path for c in '*?['):
+            input_files.extend(sorted(f for f in glob.glob(path, recursive=True) if is_video_file(f) and os.path.isfile(f)))
+        else:
+            print(f"Input {path} does not exist, ignoring it")
+    # remove duplicates but keep order
+    return list(dict.fromkeys(input_files))
 
-    mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode = load_models(
-        args.device, args.mosaic_restoration_model, args.mosaic_restoration_model_path, args.mosaic_restoration_config_path,
-        args.mosaic_detection_model_path
-    )
+def get_input_root(input_files: list[str]) -> str:
+    """
+    Common directory of all input files. Output files keep their path relative to it so files of the same name in
+    different directories don't end up at the same output path.
+    """
+    return os.path.commonpath([os.path.dirname(os.path.abspath(input_path)) for input_path in input_files])
+
+def get_output_path(input_path: str, output: str, batch_mode: bool, extension: str = '.mp4', input_root: str | None = None) -> str:
+    if batch_mode or os.path.isdir(output):
+        relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(input_path)), input_root) if input_root else ''
+        return os.path.normpath(os.path.join(output, relative_dir, f"{os.path.splitext(os.path.basename(input_path))[0]}.restored{extension}"))
+    return output
+
+def get_streaming_part_path(output_path: str) -> str:
+    stem, extension = os.path.splitext(output_path)
+    return f"{stem}.part{extension}"
+
+def is_output_finished(output_path: str, streaming_format: str | None) -> bool:
+    if not os.path.exists(output_path):
+        return False
+    if streaming_format == 'hls':
+        # the playlist is written while restoring, the end tag is only added once it's finished
+        with open(output_path, 'r', errors='replace') as f:
+            return '#EXT-X-ENDLIST' in f.read()
+    return True
+
+def remove_video_output(output_path: str, streaming_format: str | None):
+    from lada.lib.video_utils import get_hls_segment_filename
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    if streaming_format == 'hls':
+        segment_pattern = glob.escape(get_hls_segment_filename(output_path)).replace('%05d', '*')
+        for segment_path in glob.glob(segment_pattern):
+            os.remove(segment_path)
+
+@dataclass
+class Job:
+    input_path: str
+    output_path: str
+    status: str = "queued"
+    frames_count: int = 0
+    duration: float = 0.
+    encoder_preset: str | None = None
+    encoder_load: float | None = None
+
+def restore_video(args, job: Job, mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, video_metadata=None,
+                  cancel_event: threading.Event | None = None, progress_position: int = 0, encoder_governor=None,
+                  progress_callback: Callable[[int], None] | None = None) -> bool:
+    """
+    progress_callback is called with the number of frames written so far after each frame
+    """
+    from tqdm import tqdm
+    from lada.lib.frame_restorer import FrameRestorer
+    from lada.lib.video_utils import get_video_meta_data, VideoWriter
+    from lada.lib import audio_utils
+    from lada.lib.frame_source import open_frame_source
 
-    video_metadata = get_video_meta_data(args.input)
+    if args.ranges:
+        return restore_video_ranges(args, job, mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, video_metadata,
+                                    cancel_event=cancel_event, progress_position=progress_position)
 
-    frame_restorer = FrameRestorer(args.device, args.input, args.preserve_relative_scale, args.max_clip_length, args.mosaic_restoration_model,
-                 mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode)
+    if job.input_path == '-':
+        video = open_frame_source('-')
+        video_metadata = video.video_meta_data
+    else:
+        video = job.input_path
+        if video_metadata is None:
+            video_metadata = get_video_meta_data(job.input_path)
+
+    frame_restorer = FrameRestorer(args.device, video, args.preserve_relative_scale, args.max_clip_length, args.mosaic_restoration_model,
+                 mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, pipeline_executor=args.pipeline_executor,
+                 detection_stride=args.detection_stride, frame_format=args.frame_format)
+    preset = encoder_governor.preset if encoder_governor else args.preset
+    encoder_stats = None
+    wait_duration = 0.
     success = True
-    video_tmp_file_output_path = os.path.join(tempfile.gettempdir(), f"{os.path.basename(os.path.splitext(args.output)[0])}.tmp{os.path.splitext(args.output)[1]}")
-    pathlib.Path(args.output).parent.mkdir(exist_ok=True, parents=True)
+    interrupted = False
+    streaming_format = args.streaming_output or ('fmp4' if job.output_path == '-' else None)
+    # audio of a pipe can't be read a second time
+    audio_source = job.input_path if streaming_format and job.input_path != '-' else None
+    if job.output_path == '-':
+        video_tmp_file_output_path = args.output_stream
+    elif streaming_format == 'hls':
+        # written progressively including audio, the playlist references its segments by name so it can't be renamed
+        video_tmp_file_output_path = job.output_path
+    elif streaming_format:
+        # written progressively including audio, renamed once finished so an interrupted file isn't taken as finished
+        video_tmp_file_output_path = get_streaming_part_path(job.output_path)
+    else:
+        # unique name, other streams or lada-cli processes may restore files of the same name
+        fd, video_tmp_file_output_path = tempfile.mkstemp(prefix=f"{os.path.basename(os.path.splitext(job.output_path)[0])}.", suffix=f".tmp{os.path.splitext(job.output_path)[1]}")
+        os.close(fd)
+    if job.output_path != '-':
+        pathlib.Path(job.output_path).parent.mkdir(exist_ok=True, parents=True)
     try:
         frame_restorer.start()
 
         with VideoWriter(video_tmp_file_output_path, video_metadata.video_width, video_metadata.video_height,
                          video_metadata.video_fps_exact, codec=args.codec, crf=args.crf, moov_front=args.moov_front,
-                         time_base=video_metadata.time_base, preset=args.preset,
-                         custom_encoder_options=args.custom_encoder_options) as video_writer:
-            for elem in tqdm(frame_restorer, total=video_metadata.frames_count, desc="Processing frames"):
+                         time_base=video_metadata.time_base, preset=preset,
+                         custom_encoder_options=args.custom_encoder_options, streaming_format=streaming_format,
+                         audio_source=audio_source) as video_writer:
+            encoder_stats = video_writer.stats
+            wait_start = None
+            for elem in tqdm(frame_restorer, total=video_metadata.frames_count or None, desc="Processing frames", position=progress_position):
+                # time until the first frame arrives is mostly pipeline startup, don't count it as waiting for restoration
+                if wait_start is not None:
+                    wait_duration += time.time() - wait_start
+                if cancel_event is not None and cancel_event.is_set():
+                    success = False
+                    break
                 if elem is None:
                     success = False
                     print("Error on export: frame restorer stopped prematurely")
                     break
                 (restored_frame, restored_frame_pts) = elem
-                video_writer.write(restored_frame, restored_frame_pts, bgr2rgb=True)
+                if frame_restorer.frame_format == 'yuv420p':
+                    video_writer.write_yuv420p(restored_frame, restored_frame_pts)
+                else:
+                    video_writer.write(restored_frame, restored_frame_pts, bgr2rgb=True)
+                # the encoder has its own copy of the frame
+                frame_restorer.release_frame(restored_frame)
+                job.frames_count += 1
+                if progress_callback:
+                    progress_callback(job.frames_count)
+                wait_start = time.time()
     except (Exception, KeyboardInterrupt) as e:
         success = False
         if isinstance(e, KeyboardInterrupt):
+            interrupted = True
             print("Ctrl-C, stop currently running restore")
         else:
             print("Error on export", e)
     finally:
         frame_restorer.stop()
 
+    if success and encoder_governor:
+        decision = encoder_governor.update(video_writer.preset, encoder_stats["encode_duration"], wait_duration, encoder_stats["frames"])
+        if decision:
+            job.encoder_preset, job.encoder_load = decision["preset"], decision["encoder_load"]
+            print(f"Encoder governor: encoder load {decision['encoder_load']:.2f} with preset {decision['preset']} "
+                  f"({decision['encode_fps']:.1f} fps encoding, {decision['fps']:.1f} fps overall), next preset: {decision['next_preset']}")
+
+    if success:
+        try:
+            if not streaming_format:
+                print("Processing audio")
+                audio_utils.combine_audio_video_files(video_metadata, video_tmp_file_output_path, job.output_path)
+            elif video_tmp_file_output_path != job.output_path and job.output_path != '-':
+                os.replace(video_tmp_file_output_path, job.output_path)
+        except Exception as e:
+            success = False
+            print("Error on export", e)
+    if not success and job.output_path != '-':
+        remove_video_output(video_tmp_file_output_path, streaming_format)
+    if interrupted:
+        raise KeyboardInterrupt()
+    return success
+
+def restore_video_ranges(args, job: Job, mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, video_metadata=None,
+                         cancel_event: threading.Event | None = None, progress_position: int = 0) -> bool:
+    """
+    Restores only the time ranges given by --ranges. The video is split at keyframes into segments which are either
+    restored or stream-copied, those are joined afterward.
+    """
+    from tqdm import tqdm
+    from lada.lib.frame_restorer import FrameRestorer
+    from lada.lib.video_utils import get_video_meta_data, VideoWriter
+    from lada.lib import audio_utils, range_restoration
+    from lada.lib.keyframe_index import get_keyframe_index
+
+    if video_metadata is None:
+        video_metadata = get_video_meta_data(job.input_path)
+    if video_metadata.codec_name not in range_restoration.SUPPORTED_CODECS:
+        print(f"Error: --ranges only supports videos encoded with {', '.join(range_restoration.SUPPORTED_CODECS)}, {job.input_path} is {video_metadata.codec_name}")
+        return False
+    try:
+        # restored segments are joined with stream-copied ones, their encoder needs to produce the same kind of stream
+        pix_fmt, encoder_options = range_restoration.get_encoder_format(job.input_path)
+    except ValueError as e:
+        print(f"Error: --ranges can't be used for {job.input_path}, {e}")
+        return False
+    keyframe_index = get_keyframe_index(job.input_path)
+    if keyframe_index is None:
+        print(f"Error: --ranges can't be used for {job.input_path}, keyframes could not be indexed")
+        return False
+    segments = range_restoration.plan_segments(keyframe_index, range_restoration.parse_time_ranges(args.ranges))
+    restore_segments = [segment for segment in segments if segment.restore]
+    for segment in restore_segments:
+        print(f"Restoring {range_restoration.format_time(keyframe_index.frame_offset_ns(segment.frame_start))} - "
+              f"{range_restoration.format_time(keyframe_index.frame_offset_ns(segment.frame_end - 1))} (frames {segment.frame_start}-{segment.frame_end - 1})")
+
+    frame_restorer = FrameRestorer(args.device, job.input_path, args.preserve_relative_scale, args.max_clip_length, args.mosaic_restoration_model,
+                 mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, pipeline_executor=args.pipeline_executor,
+                 detection_stride=args.detection_stride, frame_format=args.frame_format)
+    tmp_dir = tempfile.mkdtemp(prefix="lada-segments.")
+    segment_paths = [os.path.join(tmp_dir, f"{idx:05d}.ts") for idx in range(len(segments))]
+    video_tmp_file_output_path = os.path.join(tmp_dir, f"video{os.path.splitext(job.output_path)[1]}")
+    pathlib.Path(job.output_path).parent.mkdir(exist_ok=True, parents=True)
+    success = True
+    interrupted = False
+    try:
+        with tqdm(total=sum(segment.frames_count for segment in restore_segments), desc="Processing frames", position=progress_position) as progress:
+            for segment, segment_path in zip(segments, segment_paths):
+                if not segment.restore:
+                    range_restoration.copy_segment(job.input_path, segment_path, keyframe_index, segment)
+                    continue
+                frame_restorer.start(start_ns=keyframe_index.frame_offset_ns(segment.frame_start))
+                try:
+                    with VideoWriter(segment_path, video_metadata.video_width, video_metadata.video_height,
+                                     video_metadata.video_fps_exact, codec=video_metadata.codec_name, crf=args.crf,
+                                     time_base=video_metadata.time_base, preset=args.preset,
+                                     custom_encoder_options=args.custom_encoder_options, pix_fmt=pix_fmt,
+                                     extra_encoder_options=encoder_options) as video_writer:
+                        for _ in range(segment.frames_count):
+                            elem = next(frame_restorer, None)
+                            if (cancel_event is not None and cancel_event.is_set()) or elem is None:
+                                success = False
+                                break
+                            (restored_frame, restored_frame_pts) = elem
+                            if frame_restorer.frame_format == 'yuv420p':
+                                video_writer.write_yuv420p(restored_frame, restored_frame_pts)
+                            else:
+                                video_writer.write(restored_frame, restored_frame_pts, bgr2rgb=True)
+                            frame_restorer.release_frame(restored_frame)
+                            job.frames_count += 1
+                            progress.update(1)
+                finally:
+                    frame_restorer.stop()
+                if not success:
+                    print("Error on export: frame restorer stopped prematurely")
+                    break
+        if success:
+            range_restoration.concat_segments(segment_paths, video_tmp_file_output_path)
+    except (Exception, KeyboardInterrupt) as e:
+        success = False
+        if isinstance(e, KeyboardInterrupt):
+            interrupted = True
+            print("Ctrl-C, stop currently running restore")
+        else:
+            print("Error on export", e)
+
     if success:
         print("Processing audio")
-        audio_utils.combine_audio_video_files(video_metadata, video_tmp_file_output_path, args.output)
-    else:
-        if os.path.exists(video_tmp_file_output_path):
-            os.remove(video_tmp_file_output_path)
+        audio_utils.combine_audio_video_files(video_metadata, video_tmp_file_output_path, job.output_path)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if interrupted:
+        raise KeyboardInterrupt()
+    return success
+
+def run_jobs_on_server(args, jobs: list[Job]):
+    """
+    Submits jobs to lada-server and shows their progress. Ctrl-C cancels the submitted jobs.
+    """
+    from tqdm import tqdm
+    from lada.server import client
+    from lada.server.main import JOB_FINAL_STATES
+
+    options = dict(codec=args.codec, crf=args.crf, preset=args.preset, moov_front=args.moov_front, custom_encoder_options=args.custom_encoder_options,
+                   max_clip_length=args.max_clip_length, preserve_relative_scale=args.preserve_relative_scale,
+                   pipeline_executor=args.pipeline_executor, detection_stride=args.detection_stride, frame_format=args.frame_format)
+    job_ids = {}
+    try:
+        for job in jobs:
+            # server may run in a different working directory
+            server_job = client.submit_job(args.server, os.path.abspath(job.input_path), os.path.abspath(job.output_path), args.priority, options)
+            job_ids[job.input_path] = server_job["id"]
+        for idx, job in enumerate(jobs):
+            print(f"[{idx + 1}/{len(jobs)}] Restoring {job.input_path} on {args.server}")
+            event = None
+            with tqdm(desc="Processing frames") as progress:
+                for event in client.stream_job_events(args.server, job_ids[job.input_path]):
+                    progress.total = event["frames_count"] or None
+                    progress.update(event["frames_processed"] - progress.n)
+                    if event["status"] == "queued":
+                        progress.set_postfix_str("queued")
+                    elif event["status"] == "running":
+                        progress.set_postfix_str("")
+            if event is None or event["status"] not in JOB_FINAL_STATES:
+                job.status = "failed"
+                print(f"Error on restoring {job.input_path}: lada-server closed the connection before the job finished")
+                continue
+            job.status = "restored" if event["status"] == "finished" else event["status"]
+            job.frames_count = event["frames_processed"]
+            if event["started"] and event["finished"]:
+                job.duration = event["finished"] - event["started"]
+            if event["error"]:
+                print(f"Error on restoring {job.input_path}", event["error"])
+    except KeyboardInterrupt:
+        print("Ctrl-C, cancelling submitted jobs")
+        for job in jobs:
+            if job.input_path in job_ids and job.status == "queued":
+                client.cancel_job(args.server, job_ids[job.input_path])
+                job.status = "cancelled"
+    except client.ServerError as e:
+        print("Error:", e)
+        for job in jobs:
+            if job.status == "queued":
+                job.status = "failed"
+
+def run_jobs_in_parallel(args, jobs: list[Job], mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, encoder_governor=None):
+    """
+    Restores up to args.streams files at the same time. Streams share the models and their inference requests are
+    batched together which gives better device utilization than running multiple lada-cli processes.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from lada.lib.multi_stream_engine import MultiStreamEngine
 
+    engine = MultiStreamEngine(args.device, args.mosaic_restoration_model, mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode)
+    cancel_event = threading.Event()
+    free_progress_positions = list(range(args.streams))
+    lock = threading.Lock()
+
+    def run(job: Job):
+        if cancel_event.is_set():
+            return
+        with lock:
+            progress_position = free_progress_positions.pop(0)
+        job.status = "running"
+        s = time.time()
+        try:
+            success = restore_video(args, job, engine.mosaic_detection_model, engine.mosaic_restoration_model, preferred_pad_mode,
+                                    cancel_event=cancel_event, progress_position=progress_position, encoder_governor=encoder_governor)
+        except Exception as e:
+            print(f"Error on restoring {job.input_path}", e)
+            success = False
+        job.duration = time.time() - s
+        job.status = "cancelled" if cancel_event.is_set() else "restored" if success else "failed"
+        with lock:
+            free_progress_positions.append(progress_position)
+
+    executor = ThreadPoolExecutor(max_workers=args.streams)
+    futures = [executor.submit(run, job) for job in jobs]
+    try:
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        print("Ctrl-C, stop currently running restores")
+        cancel_event.set()
+    finally:
+        executor.shutdown(wait=True)
+        engine.stop()
+
+def print_summary(jobs: list[Job]):
+    print("Summary:")
+    for job in jobs:
+        if job.status == "restored":
+            fps = job.frames_count / job.duration if job.duration > 0 else 0.
+            encoder_info = f", preset {job.encoder_preset} (encoder load {job.encoder_load:.2f})" if job.encoder_preset else ""
+            print(f"  {job.status:<10} {job.input_path} -> {job.output_path}: {job.frames_count} frames in {job.duration:.1f}s ({fps:.1f} fps){encoder_info}")
+        else:
+            print(f"  {job.status:<10} {job.input_path}")
+    total_frames = sum(job.frames_count for job in jobs if job.status == "restored")
+    total_duration = sum(job.duration for job in jobs if job.status == "restored")
+    counts = {status: sum(1 for job in jobs if job.status == status) for status in ("restored", "skipped", "failed", "cancelled", "queued")}
+    print("  " + ", ".join(f"{count} {status}" for status, count in counts.items() if count > 0) +
+          (f". Restored {total_frames} frames in {total_duration:.1f}s ({total_frames / total_duration:.1f} fps)" if total_duration > 0 else ""))
+
+def parse_scan_args(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="lada-cli scan", description="Quickly finds the parts of videos containing mosaics: Only keyframes are run through the mosaic detection model, "
+                                                                       "start and end of each part are then narrowed down by binary search. Mosaics shorter than the keyframe interval can be missed.")
+    parser.add_argument('--input', type=str, nargs='+', required=True, help='Path to video file. Like for restoration, you can also pass multiple paths, directories, glob patterns or text files')
+    parser.add_argument('--output', type=str, help='Save the found time ranges (in seconds) of all files in this JSON file')
+    parser.add_argument('--device', type=str, default="cuda:0", help='torch device to run the detection model on (default: %(default)s)')
+    parser.add_argument('--sample-interval', type=float, default=0., help="Minimum time between sampled keyframes in seconds. 0 samples every keyframe (default: %(default)s)")
+    parser.add_argument('--precision', type=float, default=0.5, help="Start and end of mosaic ranges will be searched down to this precision in seconds (default: %(default)s)")
+    parser.add_argument('--mosaic-detection-model-path', type=str, default=os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_detection_model_v3.pt'), help="(default: %(default)s)")
+    return parser.parse_args(argv)
+
+def scan(argv: list[str]):
+    """
+    lada-cli scan: prints the mosaic timeline of each input file, ranges can be passed to --ranges
+    """
+    import json
+    import torch
+    from lada.lib.mosaic_detection_model import MosaicDetectionModel
+    from lada.lib.mosaic_scanner import MosaicScanner
+    from lada.lib.range_restoration import format_time
+    from lada.lib.safetensors_utils import prefer_safetensors_file
+
+    args = parse_scan_args(argv)
+    input_files = collect_input_files(args.input)
+    if len(input_files) == 0:
+        print("No input video files found")
+        exit(1)
+    if args.device.startswith("cuda") and not torch.cuda.is_available():
+        print(f"GPU {args.device} selected but CUDA is not available")
+        exit(1)
+    model = MosaicDetectionModel(prefer_safetensors_file(args.mosaic_detection_model_path), args.device, classes=[0], conf=0.2)
+
+    scan_results = {}
+    failed = False
+    for input_file in input_files:
+        try:
+            result = MosaicScanner(model, input_file, sample_interval=args.sample_interval, precision=args.precision).scan()
+        except Exception as e:
+            print(f"Error on scanning {input_file}", e)
+            failed = True
+            continue
+        scan_results[input_file] = result.to_dict()
+        print(f"{input_file}: {len(result.ranges)} mosaic ranges, detection on {result.frames_detected}/{result.frames_count} frames "
+              f"in {result.duration:.1f}s ({result.compute_seconds_per_hour:.1f}s of compute per hour of video)")
+        for start_ns, end_ns in result.ranges:
+            print(f"  {format_time(start_ns)} - {format_time(end_ns)}")
+        if len(result.ranges) > 0:
+            print("  --ranges " + ",".join(f"{format_time(start_ns)}-{format_time(end_ns)}" for start_ns, end_ns in result.ranges))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(scan_results, f, indent=2)
+    if failed:
+        exit(1)
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'scan':
+        scan(sys.argv[2:])
+        exit(0)
+    args = parse_args()
+    if args.version:
+        print("Lada: ", VERSION)
+        exit(0)
+    if args.list_codecs:
+        dump_pyav_codecs()
+        exit(0)
+    if not (args.input and args.output):
+        print("Arguments --input and --output are required. Use --help to find out more.")
+        exit(1)
+
+    if args.ranges:
+        from lada.lib.range_restoration import parse_time_ranges
+        try:
+            parse_time_ranges(args.ranges)
+        except ValueError as e:
+            print("Error:", e)
+            exit(1)
+        if args.streaming_output or args.server or args.output == '-' or '-' in args.input:
+            print("--ranges can't be used with --streaming-output, --server or stdin/stdout")
+            exit(1)
+    if args.output == '-':
+        if args.streaming_output == 'hls':
+            print("HLS output can't be written to stdout")
+            exit(1)
+        # stdout is used for the video, show all messages on stderr instead
+        args.output_stream = sys.stdout.buffer
+        sys.stdout = sys.stderr
+
+    input_files = collect_input_files(args.input)
+    if len(input_files) == 0:
+        print("No input video files found")
+        exit(1)
+    batch_mode = len(input_files) > 1 or len(args.input) > 1 or not (os.path.isfile(args.input[0]) or args.input[0] == '-')
+    if '-' in input_files and (batch_mode or args.server):
+        print("Input - (stdin) can only be used as the only input and not with --server")
+        exit(1)
+    if args.output == '-' and (batch_mode or args.server):
+        print("Output - (stdout) can only be used with a single input file and not with --server")
+        exit(1)
+    if args.skip_existing is None:
+        args.skip_existing = batch_mode
+    if batch_mode and os.path.isfile(args.output):
+        print("Argument --output must be a directory if multiple input files are given")
+        exit(1)
+
+    output_extension = '.m3u8' if args.streaming_output == 'hls' else '.mp4'
+    input_root = get_input_root(input_files) if batch_mode else None
+    jobs = [Job(input_path, get_output_path(input_path, args.output, batch_mode, output_extension, input_root)) for input_path in input_files]
+    output_paths = {}
+    for job in jobs:
+        if job.output_path in output_paths:
+            print(f"Input files {output_paths[job.output_path]} and {job.input_path} would both be restored to {job.output_path}")
+            exit(1)
+        output_paths[job.output_path] = job.input_path
+    for job in jobs:
+        if args.skip_existing and job.output_path != '-' and is_output_finished(job.output_path, args.streaming_output):
+            print(f"Skipping {job.input_path}, output file {job.output_path} already exists. Use --no-skip-existing to overwrite it")
+            job.status = "skipped"
+    queued_jobs = [job for job in jobs if job.status == "queued"]
+    if len(queued_jobs) == 0:
+        exit(0)
+
+    if args.server:
+        run_jobs_on_server(args, queued_jobs)
+        if batch_mode:
+            print_summary(jobs)
+        exit(1 if any(job.status in ("failed", "cancelled") for job in jobs) else 0)
+
+    encoder_governor = None
+    if args.encoder_governor:
+        from lada.lib.encoder_governor import EncoderGovernor
+        try:
+            encoder_governor = EncoderGovernor(args.codec, args.preset, args.encoder_governor_fastest_preset, args.encoder_governor_slowest_preset)
+        except ValueError as e:
+            print("Error:", e)
+            exit(1)
+
+    from lada.lib.video_utils import get_video_meta_data
+    # stdin can only be read once, metadata will be read when restoring it
+    first_video_metadata = get_video_meta_data(queued_jobs[0].input_path) if queued_jobs[0].input_path != '-' else None
+
+    import torch
+    from lada.lib.frame_restorer import load_models
+
+    if args.device.startswith("cuda") and not torch.cuda.is_available():
+        print(f"GPU {args.device} selected but CUDA is not available")
+        exit(1)
+    if not args.mosaic_restoration_model_path:
+        args.mosaic_restoration_model_path = get_default_mosaic_restoration_model_path(args.mosaic_restoration_model)
+
+    # models are loaded only once and shared by all jobs
+    mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode = load_models(
+        args.device, args.mosaic_restoration_model, args.mosaic_restoration_model_path, args.mosaic_restoration_config_path,
+        args.mosaic_detection_model_path
+    )
+
+    if args.streams > 1:
+        run_jobs_in_parallel(args, queued_jobs, mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, encoder_governor=encoder_governor)
+        queued_jobs = []
+
+    try:
+        for idx, job in enumerate(queued_jobs):
+            if batch_mode:
+                print(f"[{idx + 1}/{len(queued_jobs)}] Restoring {job.input_path}")
+            s = time.time()
+            try:
+                success = restore_video(args, job, mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode,
+                                        video_metadata=first_video_metadata if idx == 0 else None, encoder_governor=encoder_governor)
+            except KeyboardInterrupt:
+                job.status = "cancelled"
+                raise
+            except Exception as e:
+                print(f"Error on restoring {job.input_path}", e)
+                success = False
+            job.duration = time.time() - s
+            job.status = "restored" if success else "failed"
+    except KeyboardInterrupt:
+        pass
+
+    if batch_mode:
+        print_summary(jobs)
+    if any(job.status in ("failed", "cancelled") for job in jobs):
+        exit(1)
 
 if __name__ == '__main__':
     main()
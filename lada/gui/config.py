@@ -13,6 +13,7 @@ MODEL_FILES_TO_NAMES = {
     os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_generic.pth'): 'basicvsrpp-generic-1.0',
     os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_generic_v1.1.pth'): 'basicvsrpp-generic-1.1',
     os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_generic_v1.2.pth'): 'basicvsrpp-generic-1.2',
+    os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_fast_v1.0.pth'): 'basicvsrpp-fast-1.0',
     os.path.join(MODEL_WEIGHTS_DIR, '3rd_party', 'clean_youknow_video.pth'): 'deepmosaics-clean-youknow',
 }
 
@@ -58,6 +58,7 @@ class ConfigSidebar(QWidget):
         self.model_combo = QComboBox()
         self.model_combo.addItems([
             "BasicVSR++ Generic v1.2",
+            "BasicVSR++ Fast v1.0",
             "DeepMosaics Clean Youknow"
         ])
         model_layout.addWidget(self.model_combo)
@@ -160,6 +161,7 @@ class ConfigSidebar(QWidget):
     def on_model_changed(self, text):
         model_map = {
             "BasicVSR++ Generic v1.2": "basicvsrpp-generic-1.2",
+            "BasicVSR++ Fast v1.0": "basicvsrpp-fast-1.0",
             "DeepMosaics Clean Youknow": "deepmosaics-clean-youknow"
         }
         self.restoration_model_changed.emit(model_map[text])
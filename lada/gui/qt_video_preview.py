@@ -21,6 +21,7 @@ from lada.gui.config import MODEL_NAMES_TO_FILES
 from lada.gui.qt_timeline import Timeline
 from lada.lib import audio_utils, video_utils, threading_utils
 from lada.lib.frame_restorer import load_models, FrameRestorer, PassthroughFrameRestorer
+from lada.lib.safetensors_utils import prefer_safetensors_file
 from lada import MODEL_WEIGHTS_DIR, LOG_LEVEL
 
 logger = logging.getLogger(__name__)
@@ -244,12 +245,12 @@ class VideoPreview(QWidget):
         try:
             mosaic_restoration_model_path = MODEL_NAMES_TO_FILES[self._mosaic_restoration_model_name]
             logger.info(f"Loading mosaic restoration model from: {mosaic_restoration_model_path}")
-            if not os.path.exists(mosaic_restoration_model_path):
+            if not os.path.exists(prefer_safetensors_file(mosaic_restoration_model_path)):
                 raise FileNotFoundError(f"Mosaic restoration model not found at: {mosaic_restoration_model_path}")
             
             mosaic_detection_model_path = os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_detection_model_v3.pt')
             logger.info(f"Loading mosaic detection model from: {mosaic_detection_model_path}")
-            if not os.path.exists(mosaic_detection_model_path):
+            if not os.path.exists(prefer_safetensors_file(mosaic_detection_model_path)):
                 raise FileNotFoundError(f"Mosaic detection model not found at: {mosaic_detection_model_path}")
             
             mosaic_detection_model, mosaic_restoration_model, mosaic_restoration_model_preferred_pad_mode = load_models(
@@ -3,6 +3,7 @@ import os
 import torch
 
 from lada.gui.config import MODEL_FILES_TO_NAMES
+from lada.lib.safetensors_utils import prefer_safetensors_file
 
 
 def is_device_available(device: str) -> bool:
@@ -35,6 +36,6 @@ def get_available_gpus():
 def get_available_models():
     available_models = []
     for file_path in MODEL_FILES_TO_NAMES:
-        if os.path.exists(file_path):
+        if os.path.exists(prefer_safetensors_file(file_path)):
             available_models.append(MODEL_FILES_TO_NAMES[file_path])
     return available_models
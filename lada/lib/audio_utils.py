@@ -35,11 +35,7 @@ def combine_audio_video_files(av_video_metadata: video_utils.VideoMetadata, tmp_
     os.remove(tmp_v_video_input_path)
 
 def get_audio_codec(file_path: str) -> Optional[str]:
-    cmd = f"ffprobe -loglevel error -select_streams a:0 -show_entries stream=codec_name -of default=nw=1:nk=1"
-    cmd = cmd.split() + [file_path]
-    cmd_result = subprocess.run(cmd, stdout=subprocess.PIPE)
-    audio_codec = cmd_result.stdout.decode('utf-8').strip().lower()
-    return audio_codec if len(audio_codec) > 0 else None
+    return video_utils.probe_video_file(file_path).audio_codec
 
 def is_output_container_compatible_with_input_audio_codec(audio_codec: str, output_path: str) -> bool:
     file_extension = os.path.splitext(output_path)[1]
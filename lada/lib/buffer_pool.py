@@ -0,0 +1,79 @@
+import threading
+import weakref
+
+import numpy as np
+
+class BufferPool:
+    """
+    Reusable numpy arrays for per-frame buffers of the same shape and dtype (decoded frames, blending temporaries).
+    Buffers which are not released will just be garbage collected, so consumers which keep frames don't need to care.
+    Only arrays allocated by the pool will be taken back, releasing other arrays (e.g. views of decoder memory) is a no-op.
+    """
+    def __init__(self, max_buffers_per_key: int = 32, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_buffers_per_key = max_buffers_per_key
+        self.max_bytes = max_bytes
+        self._free: dict[tuple, list[np.ndarray]] = {}
+        self._free_bytes = 0
+        self._owned: dict[int, weakref.ref] = {}
+        self._lock = threading.Lock()
+
+        self.stats = {}
+        self.stats["acquired"] = 0
+        self.stats["allocated"] = 0
+        self.stats["allocated_bytes"] = 0
+        self.stats["released"] = 0
+        self.stats["dropped"] = 0
+
+    def acquire(self, shape: tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """
+        Returns an uninitialized array
+        """
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            self.stats["acquired"] += 1
+            free_buffers = self._free.get(key)
+            if free_buffers:
+                buffer = free_buffers.pop()
+                self._free_bytes -= buffer.nbytes
+                return buffer
+            buffer = np.empty(shape, dtype=dtype)
+            self.stats["allocated"] += 1
+            self.stats["allocated_bytes"] += buffer.nbytes
+            buffer_id = id(buffer)
+            self._owned[buffer_id] = weakref.ref(buffer, lambda _: self._owned.pop(buffer_id, None))
+            return buffer
+
+    def release(self, buffer: np.ndarray):
+        """
+        The caller must not use the buffer afterward
+        """
+        with self._lock:
+            ref = self._owned.get(id(buffer))
+            if ref is None or ref() is not buffer:
+                return
+            key = (buffer.shape, buffer.dtype.str)
+            free_buffers = self._free.setdefault(key, [])
+            if len(free_buffers) >= self.max_buffers_per_key or self._free_bytes + buffer.nbytes > self.max_bytes:
+                self.stats["dropped"] += 1
+                return
+            free_buffers.append(buffer)
+            self._free_bytes += buffer.nbytes
+            self.stats["released"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+
+_buffer_pool: BufferPool | None = None
+_buffer_pool_lock = threading.Lock()
+
+def get_buffer_pool() -> BufferPool:
+    """
+    Buffer pool shared by all pipeline stages of this process
+    """
+    global _buffer_pool
+    with _buffer_pool_lock:
+        if _buffer_pool is None:
+            _buffer_pool = BufferPool()
+        return _buffer_pool
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import logging
+import os
+
+from lada import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+"""
+Identifies the content of a file without reading it: absolute path, modification time (ns) and size
+"""
+type FileKey = tuple[str, int, int]
+
+def get_file_key(path: str) -> FileKey:
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+def _get_cache_file_path(cache_dir: str, file_key: FileKey) -> str:
+    return os.path.join(cache_dir, hashlib.sha1(file_key[0].encode('utf-8')).hexdigest() + ".json")
+
+def load_cached_json(cache_dir: str, file_key: FileKey, version: int) -> dict | None:
+    """
+    Returns data stored by save_cached_json() for the given file. None if there is no data or if it's outdated
+    (the file has been modified since or data was saved by another version)
+    """
+    cache_file_path = _get_cache_file_path(cache_dir, file_key)
+    if not os.path.exists(cache_file_path):
+        return None
+    try:
+        with open(cache_file_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get('version') != version or tuple(cached.get('file')) != file_key:
+            return None
+        return cached['data']
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"ignoring invalid cache file {cache_file_path}: {e}")
+        return None
+
+def save_cached_json(cache_dir: str, file_key: FileKey, version: int, data: dict):
+    cache_file_path = _get_cache_file_path(cache_dir, file_key)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so concurrent readers never see a partially written file
+        tmp_path = f"{cache_file_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(version=version, file=list(file_key), data=data), f)
+        os.replace(tmp_path, cache_file_path)
+    except OSError as e:
+        logger.warning(f"could not save cache file {cache_file_path}: {e}")
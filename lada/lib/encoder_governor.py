@@ -0,0 +1,92 @@
+import logging
+import threading
+
+from lada import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+# ordered from fastest to slowest (best compression)
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+NVENC_PRESETS = ('p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7')
+
+ENCODER_PRESETS = {
+    'libx264': X264_PRESETS,
+    'h264': X264_PRESETS,
+    'libx265': X264_PRESETS,
+    'hevc': X264_PRESETS,
+    'h264_nvenc': NVENC_PRESETS,
+    'hevc_nvenc': NVENC_PRESETS,
+}
+
+# (fastest, slowest) preset used if the user didn't set bounds
+DEFAULT_PRESET_BOUNDS = {
+    X264_PRESETS: ('veryfast', 'medium'),
+    NVENC_PRESETS: ('p1', 'p4'),
+}
+
+class EncoderGovernor:
+    """
+    Chooses the encoder preset so that encoding doesn't become the bottleneck of the pipeline.
+
+    Encoder load is the share of time the writing loop spends encoding instead of waiting for the next restored frame.
+    If it's close to 1 restored frames were piling up in front of the encoder and the next preset will be a faster one,
+    if it's low the encoder has headroom and the next preset will be a slower one with better compression.
+    Presets stay within fastest_preset and slowest_preset.
+
+    The preset of an open encoder can't be changed (libx264/libx265 only reconfigure rate control while encoding), so a
+    decision applies to the files started afterward.
+    """
+    def __init__(self, codec: str, preset: str | None = None, fastest_preset: str | None = None, slowest_preset: str | None = None,
+                 high_load: float = 0.8, low_load: float = 0.4):
+        if codec not in ENCODER_PRESETS:
+            raise ValueError(f"encoder governor doesn't support codec {codec}, supported: {', '.join(ENCODER_PRESETS)}")
+        self.codec = codec
+        self.presets = ENCODER_PRESETS[codec]
+        default_fastest_preset, default_slowest_preset = DEFAULT_PRESET_BOUNDS[self.presets]
+        start_idx = self._get_preset_idx(preset or default_slowest_preset)
+        self.min_idx = self._get_preset_idx(fastest_preset) if fastest_preset else min(start_idx, self._get_preset_idx(default_fastest_preset))
+        self.max_idx = self._get_preset_idx(slowest_preset) if slowest_preset else start_idx
+        if self.min_idx > self.max_idx:
+            raise ValueError(f"fastest preset {self.presets[self.min_idx]} is slower than slowest preset {self.presets[self.max_idx]}")
+        self.high_load = high_load
+        self.low_load = low_load
+        self.idx = min(self.max_idx, max(self.min_idx, start_idx))
+        self.decisions: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _get_preset_idx(self, preset: str) -> int:
+        if preset not in self.presets:
+            raise ValueError(f"unknown preset {preset} for codec {self.codec}, available: {', '.join(self.presets)}")
+        return self.presets.index(preset)
+
+    @property
+    def preset(self) -> str:
+        with self._lock:
+            return self.presets[self.idx]
+
+    def update(self, preset: str, encode_duration: float, wait_duration: float, frames_count: int) -> dict | None:
+        """
+        Reports the time spent encoding and waiting for frames of a file encoded with the given preset.
+        Returns the decision which is also recorded in decisions, None if there wasn't enough data.
+        """
+        total_duration = encode_duration + wait_duration
+        if frames_count == 0 or total_duration <= 0:
+            return None
+        load = encode_duration / total_duration
+        with self._lock:
+            if load > self.high_load:
+                step = -1
+            elif load < self.low_load:
+                step = 1
+            else:
+                step = 0
+            # with multiple streams another file may have changed the preset meanwhile, its measurement is outdated then
+            if preset == self.presets[self.idx]:
+                self.idx = min(self.max_idx, max(self.min_idx, self.idx + step))
+            decision = dict(preset=preset, next_preset=self.presets[self.idx], encoder_load=load,
+                            encode_fps=frames_count / encode_duration if encode_duration > 0 else 0.,
+                            fps=frames_count / total_duration)
+            self.decisions.append(decision)
+        logger.info(f"encoder governor: load {load:.2f} with preset {preset}, next preset {decision['next_preset']}")
+        return decision
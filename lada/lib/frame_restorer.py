@@ -9,26 +9,39 @@ import cv2
 import numpy as np
 
 from lada import LOG_LEVEL
-from lada.lib import image_utils, video_utils, threading_utils, mask_utils
-from lada.lib import visualization_utils
-from lada.lib.mosaic_detector import MosaicDetector
+from lada.lib import image_utils, threading_utils, mask_utils, keyframe_index, frame_source
+from lada.lib import visualization_utils, yuv_utils
+from lada.lib.pipeline_executor import create_mosaic_detector
 from lada.lib.mosaic_detection_model import MosaicDetectionModel
+from lada.lib.safetensors_utils import prefer_safetensors_file
+from lada.lib.buffer_pool import get_buffer_pool
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=LOG_LEVEL)
 
+"""
+bgr24: FrameRestorer returns frames as BGR images.
+yuv420p: Frames stay in the decoder's planar YUV 4:2:0 format (see yuv_utils.YUV420Image) and can be passed as is to
+VideoWriter.write_yuv420p(). Only restored regions are converted. Needs even video width and height.
+"""
+FRAME_FORMATS = ('bgr24', 'yuv420p')
+
 def load_models(device, mosaic_restoration_model_name, mosaic_restoration_model_path, mosaic_restoration_config_path, mosaic_detection_model_path):
+    # weights exported in safetensors format are memory-mapped and only contain what's needed for inference so prefer them if available
+    mosaic_detection_model_path = prefer_safetensors_file(mosaic_detection_model_path)
     if mosaic_restoration_model_name.startswith("deepmosaics"):
         from lada.deepmosaics.models import loadmodel, model_util
         mosaic_restoration_model = loadmodel.video(model_util.device_to_gpu_id(device), mosaic_restoration_model_path)
         pad_mode = 'reflect'
     elif mosaic_restoration_model_name.startswith("basicvsrpp"):
-        from lada.basicvsrpp.inference import load_model, get_default_gan_inference_config
+        from lada.basicvsrpp.inference import load_model, get_default_gan_inference_config, get_default_fast_gan_inference_config
         if mosaic_restoration_config_path:
             config = mosaic_restoration_config_path
+        elif mosaic_restoration_model_name.startswith("basicvsrpp-fast"):
+            config = get_default_fast_gan_inference_config()
         else:
             config = get_default_gan_inference_config()
-        mosaic_restoration_model = load_model(config, mosaic_restoration_model_path, device)
+        mosaic_restoration_model = load_model(config, prefer_safetensors_file(mosaic_restoration_model_path), device)
         pad_mode = 'zero'
     else:
         raise NotImplementedError()
@@ -40,24 +53,35 @@ def load_models(device, mosaic_restoration_model_name, mosaic_restoration_model_
 class FrameRestorer:
     def __init__(self, device, video_file, preserve_relative_scale, max_clip_length, mosaic_restoration_model_name,
                  mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode,
-                 mosaic_detection=False):
+                 mosaic_detection=False, pipeline_executor='thread', detection_stride=1, frame_format='bgr24'):
         self.device = device
         self.mosaic_restoration_model_name = mosaic_restoration_model_name
         self.max_clip_length = max_clip_length
         self.preserve_relative_scale = preserve_relative_scale
-        self.video_meta_data = video_utils.get_video_meta_data(video_file)
+        self.video_file = video_file
+        # a FrameSource (pipe or iterator of frames) can only be read once
+        self.frame_source = video_file if isinstance(video_file, frame_source.FrameSource) else None
+        self.video_meta_data = frame_source.get_video_meta_data(video_file)
         self.mosaic_detection_model = mosaic_detection_model
         self.mosaic_restoration_model = mosaic_restoration_model
         self.preferred_pad_mode = preferred_pad_mode
         self.start_ns = 0
         self.start_frame = 0
+        self.keyframe_index: keyframe_index.KeyframeIndex | None = None
         self.mosaic_detection = mosaic_detection
         self.eof = False
         self.stop_requested = False
+        assert frame_format in FRAME_FORMATS
+        if frame_format == 'yuv420p' and (self.video_meta_data.video_width % 2 != 0 or self.video_meta_data.video_height % 2 != 0):
+            logger.warning(f"frame format yuv420p needs even video dimensions, using bgr24 for {self.video_meta_data.video_file}")
+            frame_format = 'bgr24'
+        self.frame_format = frame_format
+        self.buffer_pool = get_buffer_pool()
 
         # limit queue size to approx 512MB
         self.frame_restoration_queue = queue.Queue()
-        max_frames_in_frame_restoration_queue = (512 * 1024 * 1024) // (self.video_meta_data.video_width * self.video_meta_data.video_height * 3)
+        frame_size = self.video_meta_data.video_width * self.video_meta_data.video_height * (3 if self.frame_format == 'bgr24' else 1.5)
+        max_frames_in_frame_restoration_queue = int((512 * 1024 * 1024) // frame_size)
         self.frame_restoration_queue = queue.Queue(maxsize=max_frames_in_frame_restoration_queue)
 
         # limit queue size to approx 512MB
@@ -73,14 +97,15 @@ class FrameRestorer:
         # no queue size limit needed, elements are tiny
         self.frame_detection_queue = queue.Queue()
 
-        self.mosaic_detector = MosaicDetector(self.mosaic_detection_model, self.video_meta_data.video_file,
-                                              frame_detection_queue=self.frame_detection_queue,
-                                              mosaic_clip_queue=self.mosaic_clip_queue,
-                                              device=self.device,
-                                              max_clip_length=self.max_clip_length,
-                                              pad_mode=self.preferred_pad_mode,
-                                              preserve_relative_scale=self.preserve_relative_scale,
-                                              dont_preserve_relative_scale=(not self.preserve_relative_scale))
+        self.mosaic_detector = create_mosaic_detector(pipeline_executor, self.mosaic_detection_model, self.video_file,
+                                                     frame_detection_queue=self.frame_detection_queue,
+                                                     mosaic_clip_queue=self.mosaic_clip_queue,
+                                                     device=self.device,
+                                                     max_clip_length=self.max_clip_length,
+                                                     pad_mode=self.preferred_pad_mode,
+                                                     preserve_relative_scale=self.preserve_relative_scale,
+                                                     dont_preserve_relative_scale=(not self.preserve_relative_scale),
+                                                     detection_stride=detection_stride)
 
         self.clip_restoration_thread: threading.Thread | None = None
         self.frame_restoration_thread: threading.Thread | None = None
@@ -101,8 +126,10 @@ class FrameRestorer:
     def start(self, start_ns=0):
         assert self.frame_restoration_thread is None and self.clip_restoration_thread is None, "Illegal State: Tried to start FrameRestorer when it's already running. You need to stop it first"
 
+        assert self.frame_source is None or start_ns == 0, "Illegal State: FrameSource can't seek, start_ns must be 0"
         self.start_ns = start_ns
-        self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
+        self.eof = False
+        self.start_frame, self.keyframe_index = keyframe_index.get_start_frame(self.video_file, self.start_ns, self.video_meta_data.video_fps_exact)
         self.stop_requested = False
         self.frame_restoration_thread_should_be_running = True
         self.clip_restoration_thread_should_be_running = True
@@ -121,6 +148,9 @@ class FrameRestorer:
         self.clip_restoration_thread_should_be_running = False
         self.frame_restoration_thread_should_be_running = False
 
+        if self.frame_source is not None:
+            # unblock readers
+            self.frame_source.close()
         self.mosaic_detector.stop()
 
         # unblock consumer
@@ -174,6 +204,14 @@ class FrameRestorer:
                 frame_feeder_queue/wait-time-put: {self.mosaic_detector.queue_stats["frame_feeder_queue_wait_time_put"]:.0f}
                 frame_feeder_queue/max-qsize: {self.mosaic_detector.queue_stats["frame_feeder_queue_max_size"]}/{self.mosaic_detector.frame_feeder_queue.maxsize}"""))
 
+        buffer_pool_stats = self.buffer_pool.stats
+        logger.debug(textwrap.dedent(f"""\
+            FrameRestorer: Buffer pool stats:
+                acquired: {buffer_pool_stats["acquired"]}
+                allocated: {buffer_pool_stats["allocated"]} ({buffer_pool_stats["allocated_bytes"] / 1024 / 1024:.0f} MB)
+                released: {buffer_pool_stats["released"]}
+                dropped: {buffer_pool_stats["dropped"]}"""))
+
 
     def _restore_clip_frames(self, images):
         if self.mosaic_restoration_model_name.startswith("deepmosaics"):
@@ -200,8 +238,18 @@ class FrameRestorer:
             clip_mask = image_utils.resize(clip_mask, orig_crop_shape[:2],interpolation=cv2.INTER_NEAREST)
             t, l, b, r = orig_clip_box
             blend_mask = mask_utils.create_blend_mask(clip_mask)
-            blended_img = (frame[t:b + 1, l:r + 1, :] * (1 - blend_mask[..., None]) + clip_img * (blend_mask[..., None])).clip(0, 255).astype(np.uint8)
-            frame[t:b + 1, l:r + 1, :] = blended_img
+            if self.frame_format == 'yuv420p':
+                yuv_utils.blend_bgr_patch(frame, orig_clip_box, clip_img, blend_mask)
+                continue
+            # blend in-place: frame + (clip - frame) * blend_mask, using a pooled temporary instead of several new float64 arrays
+            frame_region = frame[t:b + 1, l:r + 1, :]
+            blended_img = self.buffer_pool.acquire(frame_region.shape, np.float32)
+            np.subtract(clip_img, frame_region, out=blended_img, dtype=np.float32)
+            np.multiply(blended_img, blend_mask[..., None], out=blended_img, casting='unsafe')
+            np.add(blended_img, frame_region, out=blended_img)
+            np.clip(blended_img, 0, 255, out=blended_img)
+            np.copyto(frame_region, blended_img, casting='unsafe')
+            self.buffer_pool.release(blended_img)
 
     def _restore_clip(self, clip):
         """
@@ -219,6 +267,12 @@ class FrameRestorer:
             assert clip.data[i][0].shape == restored_clip_images[i].shape
             clip.data[i] = restored_clip_images[i], clip.data[i][1], clip.data[i][2], clip.data[i][3], clip.data[i][4]
 
+    def release_frame(self, frame: np.ndarray):
+        """
+        Consumers can hand back frames they don't need anymore so their buffers will be reused for the next frames
+        """
+        self.buffer_pool.release(frame)
+
     def _collect_garbage(self, clip_buffer):
         processed_clips = list(filter(lambda _clip: len(_clip) == 0, clip_buffer))
         for processed_clip in processed_clips:
@@ -280,7 +334,12 @@ class FrameRestorer:
 
     def _read_next_clip(self, current_frame_num, clip_buffer) -> bool:
         s = time.time()
+        if self.frame_source is not None:
+            # the clip can end after more frames than the source buffers by default, detection must be able to get there
+            self.frame_source.set_unbounded(True)
         clip = self.restored_clip_queue.get()
+        if self.frame_source is not None:
+            self.frame_source.set_unbounded(False)
         self.queue_stats["restored_clip_queue_wait_time_get"] += time.time() - s
         if self.stop_requested:
             logger.debug("frame restoration worker: restored_clip_queue consumer unblocked")
@@ -292,11 +351,13 @@ class FrameRestorer:
 
     def _frame_restoration_worker(self):
         logger.debug("frame restoration worker: started")
-        with video_utils.VideoReader(self.video_meta_data.video_file) as video_reader:
-            if self.start_ns > 0:
+        with frame_source.open_video_reader(self.video_file, prefetch_frames=8) as video_reader:
+            if self.keyframe_index is not None:
+                video_reader.seek_frame(self.start_frame, self.keyframe_index)
+            elif self.start_ns > 0:
                 video_reader.seek(self.start_ns)
 
-            video_frames_generator = video_reader.frames()
+            video_frames_generator = video_reader.frames() if self.frame_format == 'bgr24' else video_reader.yuv420p_frames(self.buffer_pool)
 
             frame_num = self.start_frame
             clips_remaining = True
@@ -0,0 +1,236 @@
+import itertools
+import logging
+import sys
+import threading
+from collections import deque
+from fractions import Fraction
+from typing import BinaryIO, Iterable
+
+import av
+import numpy as np
+
+from lada import LOG_LEVEL, DECODE_THREADS
+from lada.lib import VideoMetadata, video_utils
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+class FrameSource:
+    """
+    Video which can only be read once, like a pipe (e.g. stdin) or a Python iterator of frames. Can be passed to
+    FrameRestorer instead of a file path, see open_frame_source() and from_ndarrays().
+
+    Mosaic detection and frame restoration each read all frames with their own reader (see open_reader()). Frames are
+    decoded once and buffered until all num_readers readers got them. Detection runs ahead of restoration so the leading
+    reader waits if max_buffered_frames are buffered. This limit is lifted via set_unbounded() while restoration waits
+    for restored clips as those can span more frames than that.
+    Seeking is not supported.
+    """
+    def __init__(self, frames: Iterable[av.VideoFrame], video_meta_data: VideoMetadata, num_readers: int = 2, max_buffered_frames: int | None = None):
+        self.video_meta_data = video_meta_data
+        self.num_readers = num_readers
+        if max_buffered_frames is None:
+            # limit buffer size to approx 512MB of yuv420p frames
+            frame_size = video_meta_data.video_width * video_meta_data.video_height * 1.5
+            max_buffered_frames = max(32, int((512 * 1024 * 1024) // frame_size))
+        self.max_buffered_frames = max_buffered_frames
+        self._frames = iter(frames)
+        self._container: av.container.InputContainer | None = None
+        self._buffer: deque[av.VideoFrame] = deque()
+        # frame number of the first frame in _buffer
+        self._buffer_start = 0
+        # frame number of the next frame of each reader, None if the reader has been closed
+        self._positions: list[int | None] = []
+        self._eof = False
+        self._closed = False
+        self._unbounded = False
+        self._decoding = False
+        self._condition = threading.Condition()
+
+    def open_reader(self) -> 'FrameSourceReader':
+        return FrameSourceReader(self)
+
+    def set_unbounded(self, unbounded: bool):
+        with self._condition:
+            self._unbounded = unbounded
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Unblocks all readers, they will not receive any more frames
+        """
+        with self._condition:
+            self._closed = True
+            self._buffer.clear()
+            self._condition.notify_all()
+            if not self._decoding:
+                self._close_container()
+
+    def _close_container(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+    def _register_reader(self) -> int:
+        with self._condition:
+            assert len(self._positions) < self.num_readers, f"FrameSource supports only {self.num_readers} readers"
+            self._positions.append(self._buffer_start)
+            return len(self._positions) - 1
+
+    def _unregister_reader(self, reader_idx: int):
+        with self._condition:
+            self._positions[reader_idx] = None
+            self._drop_consumed_frames()
+
+    def _drop_consumed_frames(self):
+        if len(self._positions) < self.num_readers:
+            # readers which haven't been opened yet need all frames
+            return
+        positions = [position for position in self._positions if position is not None]
+        min_position = min(positions) if len(positions) > 0 else self._buffer_start + len(self._buffer)
+        while self._buffer_start < min_position and len(self._buffer) > 0:
+            self._buffer.popleft()
+            self._buffer_start += 1
+            self._condition.notify_all()
+
+    def _read(self, reader_idx: int) -> av.VideoFrame | None:
+        with self._condition:
+            while True:
+                if self._closed:
+                    return None
+                position = self._positions[reader_idx]
+                if position < self._buffer_start + len(self._buffer):
+                    frame = self._buffer[position - self._buffer_start]
+                    self._positions[reader_idx] = position + 1
+                    self._drop_consumed_frames()
+                    return frame
+                if self._eof:
+                    return None
+                if self._decoding or (len(self._buffer) >= self.max_buffered_frames and not self._unbounded):
+                    self._condition.wait()
+                    continue
+                # decode without holding the lock so other readers can get buffered frames meanwhile
+                self._decoding = True
+                self._condition.release()
+                try:
+                    frame = next(self._frames, None)
+                finally:
+                    self._condition.acquire()
+                    self._decoding = False
+                    self._condition.notify_all()
+                if frame is None:
+                    self._eof = True
+                    self._close_container()
+                elif self._closed:
+                    self._close_container()
+                else:
+                    self._buffer.append(frame)
+
+class FrameSourceReader(video_utils.VideoReader):
+    """
+    VideoReader for a FrameSource, frames(), lazy_frames() and yuv420p_frames() work the same as for files
+    """
+    def __init__(self, frame_source: FrameSource):
+        super().__init__(None)
+        self.frame_source = frame_source
+        self._reader_idx: int | None = None
+
+    def __enter__(self):
+        self._reader_idx = self.frame_source._register_reader()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.frame_source._unregister_reader(self._reader_idx)
+
+    def _decode_container(self):
+        while (frame := self.frame_source._read(self._reader_idx)) is not None:
+            yield frame
+
+    def seek(self, offset_ns):
+        raise NotImplementedError("FrameSource doesn't support seeking")
+
+    def seek_frame(self, frame_num: int, keyframe_index):
+        raise NotImplementedError("FrameSource doesn't support seeking")
+
+def open_frame_source(file: str | BinaryIO, decode_threads: int = DECODE_THREADS) -> FrameSource:
+    """
+    file: "-" for stdin or a readable binary file object. The container format needs to be streamable,
+    e.g. MPEG-TS, Matroska or fragmented MP4.
+    The number of frames and duration are unknown (0) in the video metadata.
+    """
+    video_file = file if isinstance(file, str) else getattr(file, 'name', '<stream>')
+    container = av.open(sys.stdin.buffer if file == '-' else file, 'r')
+    if len(container.streams.video) == 0:
+        container.close()
+        raise Exception(f"error opening {video_file}: no video stream")
+    stream = container.streams.video[0]
+    stream.thread_type = 'AUTO'
+    stream.codec_context.thread_count = decode_threads
+    fps_exact = stream.base_rate or stream.average_rate
+    video_meta_data = VideoMetadata(
+        video_file=video_file,
+        video_height=stream.codec_context.height,
+        video_width=stream.codec_context.width,
+        video_fps=float(fps_exact),
+        average_fps=float(stream.average_rate or fps_exact),
+        video_fps_exact=Fraction(fps_exact),
+        codec_name=stream.codec_context.codec.canonical_name,
+        frames_count=0,
+        duration=0.,
+        time_base=Fraction(stream.time_base),
+        start_pts=stream.start_time if stream.start_time is not None else 0
+    )
+    frame_source = FrameSource(container.decode(stream), video_meta_data)
+    frame_source._container = container
+    return frame_source
+
+def from_ndarrays(frames: Iterable[tuple[np.ndarray, int]], fps: float | Fraction, time_base: Fraction | None = None, name: str = '<frames>') -> FrameSource:
+    """
+    frames: BGR images and their pts (in units of time_base, by default 1/fps), e.g. from a live source.
+    The number of frames and duration are unknown (0) in the video metadata.
+    """
+    frames = iter(frames)
+    first_frame = next(frames, None)
+    if first_frame is None:
+        raise ValueError("no frames")
+    height, width = first_frame[0].shape[:2]
+    fps_exact = Fraction(fps).limit_denominator(1001)
+    time_base = time_base or 1 / fps_exact
+
+    def to_video_frames():
+        for img, pts in itertools.chain([first_frame], frames):
+            frame = av.VideoFrame.from_ndarray(img, format='bgr24')
+            frame.pts = pts
+            frame.time_base = time_base
+            yield frame
+
+    video_meta_data = VideoMetadata(
+        video_file=name,
+        video_height=height,
+        video_width=width,
+        video_fps=float(fps_exact),
+        average_fps=float(fps_exact),
+        video_fps_exact=fps_exact,
+        codec_name='rawvideo',
+        frames_count=0,
+        duration=0.,
+        time_base=time_base,
+        start_pts=first_frame[1] if first_frame[1] is not None else 0
+    )
+    return FrameSource(to_video_frames(), video_meta_data)
+
+"""
+Input of FrameRestorer and MosaicDetector: path of a video file or a FrameSource
+"""
+type VideoSource = str | FrameSource
+
+def get_video_meta_data(video: VideoSource) -> VideoMetadata:
+    if isinstance(video, FrameSource):
+        return video.video_meta_data
+    return video_utils.get_video_meta_data(video)
+
+def open_video_reader(video: VideoSource, prefetch_frames: int = 0) -> video_utils.VideoReader:
+    if isinstance(video, FrameSource):
+        # frames of a FrameSource are decoded once by whichever reader needs them first, no prefetching
+        return video.open_reader()
+    return video_utils.VideoReader(video, prefetch_frames=prefetch_frames)
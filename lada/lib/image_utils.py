@@ -1,3 +1,4 @@
+import concurrent.futures as concurrent_futures
 import math
 import os
 
@@ -179,6 +180,78 @@ def resize(img: Image, size: int|tuple[int, int], interpolation=cv2.INTER_LINEAR
     assert size == max(resized_img.shape[:2]) if type(size) == int else size == resized_img.shape[:2]
     return resized_img
 
+_resize_thread_pool: concurrent_futures.ThreadPoolExecutor | None = None
+
+def _get_resize_thread_pool() -> concurrent_futures.ThreadPoolExecutor:
+    global _resize_thread_pool
+    if _resize_thread_pool is None:
+        _resize_thread_pool = concurrent_futures.ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="resize")
+    return _resize_thread_pool
+
+def _resize_batch_on_device(imgs: list[Image], resize_shapes: list[tuple[int, int]], interpolation, device, chunk_size=16) -> list[Image]:
+    """
+    Resizes images of different shapes with a single grid_sample call per chunk. Images are placed into a common canvas
+    and each output pixel samples its own image with the same source coordinates cv2.resize would use (replicated border).
+    """
+    resized_imgs = []
+    for chunk_start in range(0, len(imgs), chunk_size):
+        chunk_imgs = imgs[chunk_start:chunk_start + chunk_size]
+        chunk_shapes = resize_shapes[chunk_start:chunk_start + chunk_size]
+        n, c = len(chunk_imgs), chunk_imgs[0].shape[2]
+        canvas_h, canvas_w = max(img.shape[0] for img in chunk_imgs), max(img.shape[1] for img in chunk_imgs)
+        out_h, out_w = max(shape[0] for shape in chunk_shapes), max(shape[1] for shape in chunk_shapes)
+        canvas = np.zeros((n, canvas_h, canvas_w, c), dtype=chunk_imgs[0].dtype)
+        for i, img in enumerate(chunk_imgs):
+            canvas[i, :img.shape[0], :img.shape[1]] = img
+        canvas = torch.from_numpy(canvas).to(device).permute(0, 3, 1, 2).float()
+
+        # per image scale factors, shape (n, 1)
+        in_h = torch.tensor([img.shape[0] for img in chunk_imgs], device=device, dtype=torch.float32).unsqueeze(1)
+        in_w = torch.tensor([img.shape[1] for img in chunk_imgs], device=device, dtype=torch.float32).unsqueeze(1)
+        scale_h = in_h / torch.tensor([shape[0] for shape in chunk_shapes], device=device, dtype=torch.float32).unsqueeze(1)
+        scale_w = in_w / torch.tensor([shape[1] for shape in chunk_shapes], device=device, dtype=torch.float32).unsqueeze(1)
+        ys = torch.arange(out_h, device=device, dtype=torch.float32).unsqueeze(0)
+        xs = torch.arange(out_w, device=device, dtype=torch.float32).unsqueeze(0)
+        if interpolation == cv2.INTER_NEAREST:
+            src_y = torch.minimum(torch.floor(ys * scale_h), in_h - 1)
+            src_x = torch.minimum(torch.floor(xs * scale_w), in_w - 1)
+            mode = 'nearest'
+        else:
+            src_y = torch.clamp((ys + 0.5) * scale_h - 0.5, min=0.).minimum(in_h - 1)
+            src_x = torch.clamp((xs + 0.5) * scale_w - 0.5, min=0.).minimum(in_w - 1)
+            mode = 'bilinear'
+        grid_y = ((src_y + 0.5) / canvas_h * 2 - 1).unsqueeze(2).expand(n, out_h, out_w)
+        grid_x = ((src_x + 0.5) / canvas_w * 2 - 1).unsqueeze(1).expand(n, out_h, out_w)
+        grid = torch.stack((grid_x, grid_y), dim=-1)
+        resized = F.grid_sample(canvas, grid, mode=mode, padding_mode='border', align_corners=False)
+        resized = resized.round_().clamp_(0, 255).to(torch.uint8).permute(0, 2, 3, 1).cpu().numpy()
+        for i, shape in enumerate(chunk_shapes):
+            resized_imgs.append(resized[i, :shape[0], :shape[1]])
+    return resized_imgs
+
+def resize_and_pad_images(imgs: list[Image], resize_shapes: list[tuple[int, int]], size: int, pad_mode='zero', interpolation=cv2.INTER_LINEAR, device=None) -> tuple[list[Image], list[Pad]]:
+    """
+    Batched version of resize() followed by pad_image() to size x size for lists of uint8 images with shape (H, W, C).
+    If device is a GPU, images will be resized together on the device. Otherwise, they're resized with cv2 in a thread pool
+    (cv2 releases the GIL so this runs in parallel and doesn't block other pipeline threads).
+    """
+    if len(imgs) == 0:
+        return [], []
+    if device is not None and torch.device(device).type != 'cpu':
+        with torch.inference_mode():
+            resized_imgs = _resize_batch_on_device(imgs, resize_shapes, interpolation, torch.device(device))
+    else:
+        def _resize(img, shape):
+            resized_img = resize(img, shape, interpolation=interpolation)
+            return resized_img.reshape(*resized_img.shape[:2], img.shape[2])
+        resized_imgs = list(_get_resize_thread_pool().map(_resize, imgs, resize_shapes))
+    padded_imgs, pads = [], []
+    for resized_img in resized_imgs:
+        padded_img, pad = pad_image(resized_img, size, size, mode=pad_mode)
+        padded_imgs.append(padded_img)
+        pads.append(pad)
+    return padded_imgs, pads
+
 def resize_simple(img: Image, size: int, interpolation=cv2.INTER_LINEAR):
     h, w = img.shape[:2]
     if np.min((w,h)) == size:
@@ -0,0 +1,139 @@
+import bisect
+import logging
+import math
+import os
+import threading
+from dataclasses import dataclass
+from fractions import Fraction
+
+import av
+
+from lada import LOG_LEVEL, CACHE_DIR
+from lada.lib import video_utils, cache_utils
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+KEYFRAME_INDEX_VERSION = 2
+KEYFRAME_INDEX_CACHE_DIR = os.path.join(CACHE_DIR, "keyframe_index")
+
+@dataclass
+class KeyframeIndex:
+    """
+    Presentation timestamps of all frames and keyframes of the first video stream of a file.
+    frame_pts[n] is the pts of frame number n (in presentation order), pts are in units of time_base.
+    keyframe_pos is the byte position of the keyframe packet in the file (-1 if unknown).
+    keyframe_closed is False for keyframes of an open GOP: Frames following it in decoding order are shown before it
+    (leading pictures like after a HEVC CRA frame), so the video can't be split at this keyframe.
+    """
+    time_base: Fraction
+    frame_pts: list[int]
+    keyframe_pts: list[int]
+    keyframe_pos: list[int]
+    keyframe_closed: list[bool]
+
+    @property
+    def frames_count(self) -> int:
+        return len(self.frame_pts)
+
+    def frame_num_at(self, offset_ns: int) -> int:
+        """
+        Number of the frame shown at offset_ns (relative to the first frame). Correct for variable frame rate videos as well
+        """
+        target_pts = self.frame_pts[0] + int(Fraction(offset_ns, 1_000_000_000) / self.time_base)
+        return max(0, bisect.bisect_right(self.frame_pts, target_pts) - 1)
+
+    def frame_offset_ns(self, frame_num: int) -> int:
+        # rounded up so that frame_num_at(frame_offset_ns(n)) == n
+        return math.ceil((self.frame_pts[frame_num] - self.frame_pts[0]) * self.time_base * 1_000_000_000)
+
+    def keyframe_for_frame(self, frame_num: int) -> tuple[int, int]:
+        """
+        Returns pts and byte position of the last keyframe at or before the given frame.
+        Decoding needs to start there to get the given frame.
+        """
+        idx = max(0, bisect.bisect_right(self.keyframe_pts, self.frame_pts[frame_num]) - 1)
+        return self.keyframe_pts[idx], self.keyframe_pos[idx]
+
+    def to_dict(self) -> dict:
+        return dict(time_base=str(self.time_base), frame_pts=self.frame_pts, keyframe_pts=self.keyframe_pts, keyframe_pos=self.keyframe_pos,
+                    keyframe_closed=self.keyframe_closed)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'KeyframeIndex':
+        return cls(time_base=Fraction(data['time_base']), frame_pts=data['frame_pts'], keyframe_pts=data['keyframe_pts'], keyframe_pos=data['keyframe_pos'],
+                   keyframe_closed=data['keyframe_closed'])
+
+def build_keyframe_index(path: str) -> KeyframeIndex | None:
+    """
+    Scans all packets of the video stream, nothing is decoded.
+    Returns None if the container doesn't provide timestamps for all packets.
+    """
+    frame_pts = []
+    keyframes = []
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        time_base = stream.time_base
+        for packet in container.demux(stream):
+            if packet.size == 0:
+                # flush packet at the end of the stream
+                continue
+            if packet.pts is None:
+                logger.info(f"can't create keyframe index for {path}: packets without pts")
+                return None
+            frame_pts.append(packet.pts)
+            if packet.is_keyframe:
+                keyframes.append([packet.pts, packet.pos if packet.pos is not None else -1, True])
+            elif len(keyframes) > 0 and packet.pts < keyframes[-1][0]:
+                # leading picture, shown before the keyframe it follows in decoding order
+                keyframes[-1][2] = False
+    if len(frame_pts) == 0 or len(keyframes) == 0:
+        return None
+    frame_pts.sort()
+    keyframes.sort()
+    return KeyframeIndex(time_base=time_base, frame_pts=frame_pts,
+                         keyframe_pts=[pts for pts, _, _ in keyframes], keyframe_pos=[pos for _, pos, _ in keyframes],
+                         keyframe_closed=[closed for _, _, closed in keyframes])
+
+_keyframe_indices: dict[cache_utils.FileKey, KeyframeIndex | None] = {}
+_keyframe_indices_lock = threading.Lock()
+# one lock per file so a file is only indexed once while other files can be looked up or indexed meanwhile
+_keyframe_index_file_locks: dict[cache_utils.FileKey, threading.Lock] = {}
+
+def get_keyframe_index(path: str) -> KeyframeIndex | None:
+    """
+    Returns the keyframe index of the given video file. It is created once by scanning the file and then cached in
+    memory and on disk (in KEYFRAME_INDEX_CACHE_DIR). The index will be recreated if the file has been modified.
+    """
+    file_key = cache_utils.get_file_key(path)
+    with _keyframe_indices_lock:
+        if file_key in _keyframe_indices:
+            return _keyframe_indices[file_key]
+        file_lock = _keyframe_index_file_locks.setdefault(file_key, threading.Lock())
+    with file_lock:
+        with _keyframe_indices_lock:
+            if file_key in _keyframe_indices:
+                return _keyframe_indices[file_key]
+        cached = cache_utils.load_cached_json(KEYFRAME_INDEX_CACHE_DIR, file_key, KEYFRAME_INDEX_VERSION)
+        keyframe_index = KeyframeIndex.from_dict(cached) if cached is not None else None
+        if keyframe_index is None:
+            logger.info(f"creating keyframe index for {path}")
+            keyframe_index = build_keyframe_index(path)
+            if keyframe_index is not None:
+                cache_utils.save_cached_json(KEYFRAME_INDEX_CACHE_DIR, file_key, KEYFRAME_INDEX_VERSION, keyframe_index.to_dict())
+        with _keyframe_indices_lock:
+            _keyframe_indices[file_key] = keyframe_index
+            del _keyframe_index_file_locks[file_key]
+        return keyframe_index
+
+def get_start_frame(path: str, start_ns: int, video_fps_exact: Fraction) -> tuple[int, KeyframeIndex | None]:
+    """
+    Number of the frame shown at start_ns and the keyframe index to seek to it with VideoReader.seek_frame().
+    Falls back to a constant frame rate calculation if no keyframe index can be created for the file.
+    """
+    if start_ns <= 0:
+        return 0, None
+    keyframe_index = get_keyframe_index(path)
+    if keyframe_index is None:
+        return video_utils.offset_ns_to_frame_num(start_ns, video_fps_exact), None
+    return keyframe_index.frame_num_at(start_ns), keyframe_index
@@ -70,3 +70,34 @@ def create_blend_mask(crop_mask):
     blend_mask = cv2.blur(blend_mask, (blur_size, blur_size))
     assert blend_mask.shape == crop_mask.shape
     return blend_mask
+
+def _get_box_mask_overlap(box_mask: Mask, box: Box, crop_box: Box) -> tuple[tuple[slice, slice], tuple[slice, slice]] | None:
+    t, l = box[0], box[1]
+    b, r = t + box_mask.shape[0] - 1, l + box_mask.shape[1] - 1
+    crop_t, crop_l, crop_b, crop_r = crop_box
+    overlap_t, overlap_l, overlap_b, overlap_r = max(t, crop_t), max(l, crop_l), min(b, crop_b), min(r, crop_r)
+    if overlap_b < overlap_t or overlap_r < overlap_l:
+        return None
+    box_mask_slices = slice(overlap_t - t, overlap_b - t + 1), slice(overlap_l - l, overlap_r - l + 1)
+    crop_slices = slice(overlap_t - crop_t, overlap_b - crop_t + 1), slice(overlap_l - crop_l, overlap_r - crop_l + 1)
+    return box_mask_slices, crop_slices
+
+def crop_box_mask(box_mask: Mask, box: Box, crop_box: Box) -> Mask:
+    """
+    Box-local masks only cover the area of their detection box, its top-left pixel is located at (box[0], box[1]) of the frame.
+    Returns the mask for the region crop_box of the frame, pixels not covered by box_mask are 0.
+    """
+    crop_t, crop_l, crop_b, crop_r = crop_box
+    cropped_mask = np.zeros((crop_b - crop_t + 1, crop_r - crop_l + 1, *box_mask.shape[2:]), dtype=box_mask.dtype)
+    paste_box_mask(cropped_mask, crop_box, box_mask, box)
+    return cropped_mask
+
+def paste_box_mask(target_mask: Mask, target_box: Box, box_mask: Mask, box: Box):
+    """
+    Merges box-local mask into box-local target_mask (in place). Both boxes are in frame coordinates.
+    """
+    overlap = _get_box_mask_overlap(box_mask, box, target_box)
+    if overlap is None:
+        return
+    box_mask_slices, target_slices = overlap
+    np.maximum(target_mask[target_slices], box_mask[box_mask_slices], out=target_mask[target_slices])
@@ -1,21 +1,47 @@
+import json
 import threading
 
 import torch
+import torch.nn.functional as F
 from ultralytics.utils.checks import check_imgsz
 import numpy as np
 from ultralytics.data.augment import LetterBox
 from ultralytics.utils import ops
-from ultralytics.engine.results import Results
+from ultralytics.engine.results import Results, Boxes
 from ultralytics.nn.autobackend import AutoBackend
 from ultralytics.cfg import get_cfg
 from ultralytics.utils import DEFAULT_CFG
 from ultralytics import YOLO
-from lada.lib import Image
+from lada.lib import Image, Mask, Box
+from lada.lib.ultralytics_utils import convert_yolo_boxes
+from lada.lib.safetensors_utils import is_safetensors_file, load_safetensors
+
+def load_yolo_model(model_path: str) -> tuple[torch.nn.Module, str, dict]:
+    """
+    Loads YOLO model either from an ultralytics checkpoint (.pt) or from exported weights in safetensors format.
+    Returns model, task and overrides (model args stored in the checkpoint)
+    """
+    if is_safetensors_file(model_path):
+        from ultralytics.nn.tasks import SegmentationModel
+        state_dict, metadata = load_safetensors(model_path)
+        assert metadata.get('task') == 'segment'
+        model = SegmentationModel(json.loads(metadata['yaml']), verbose=False)
+        model.load_state_dict(state_dict, strict=True)
+        # ultralytics checkpoints are saved with gradients disabled, a freshly built model has them enabled
+        model.requires_grad_(False).eval()
+        model.names = {int(k): v for k, v in json.loads(metadata['names']).items()}
+        return model, metadata['task'], json.loads(metadata['overrides'])
+    else:
+        yolo_model = YOLO(model_path)
+        return yolo_model.model, yolo_model.task, yolo_model.overrides
 
 class MosaicDetectionModel:
     def __init__(self, model_path: str, device, imgsz=640, **kwargs):
-        yolo_model = YOLO(model_path)
-        assert yolo_model.task == 'segment'
+        model, task, overrides = load_yolo_model(model_path)
+        assert task == 'segment'
+        # needed to load another instance of this model in a worker process
+        self.model_path = model_path
+        self.model_kwargs = dict(imgsz=imgsz, **kwargs)
         self.stride = 32
         self.imgsz = check_imgsz(imgsz, stride=self.stride, min_dim=2)
         self.letterbox = LetterBox(
@@ -25,11 +51,11 @@ class MosaicDetectionModel:
         )
 
         custom = {"conf": 0.25, "batch": 1, "save": False, "mode": "predict", "device": device}
-        args = {**yolo_model.overrides, **custom, **kwargs}  # highest priority args on the right
+        args = {**overrides, **custom, **kwargs}  # highest priority args on the right
         self.args = get_cfg(DEFAULT_CFG, args)
 
         self.model = AutoBackend(
-            weights=yolo_model.model,
+            weights=model,
             device=torch.device(device),
             dnn=self.args.dnn,
             data=self.args.data,
@@ -43,10 +69,39 @@ class MosaicDetectionModel:
         self.model.eval()
         self.model.warmup(imgsz=(1, 3, *self.imgsz))
 
-        self.is_segmentation_model = yolo_model.task == 'segment'
+        self.is_segmentation_model = task == 'segment'
         self._lock = threading.Lock()
 
-    def preprocess(self, imgs):
+    def get_letterbox_shape(self, img_shape: tuple[int, ...]) -> tuple[tuple[int, int], tuple[int, int, int, int]]:
+        """
+        Same resize and padding as ultralytics LetterBox(auto=True, center=True).
+        Returns resize shape (h, w) and padding (top, bottom, left, right).
+        """
+        h, w = img_shape[:2]
+        new_h, new_w = self.imgsz
+        r = min(new_h / h, new_w / w)
+        resize_h, resize_w = int(round(h * r)), int(round(w * r))
+        dh, dw = ((new_h - resize_h) % self.stride) / 2, ((new_w - resize_w) % self.stride) / 2
+        return (resize_h, resize_w), (int(round(dh - 0.1)), int(round(dh + 0.1)), int(round(dw - 0.1)), int(round(dw + 0.1)))
+
+    def preprocess(self, imgs: list[Image]) -> torch.Tensor:
+        """
+        On GPU devices frames are uploaded once as uint8 and resized, padded and normalized as a batch on the device.
+        All images must be of the same shape (frames of a video). On the CPU ultralytics LetterBox (cv2) is faster.
+        """
+        if self.device.type == 'cpu':
+            return self._preprocess_cpu(imgs)
+        (resize_h, resize_w), (top, bottom, left, right) = self.get_letterbox_shape(imgs[0].shape)
+        im = torch.from_numpy(np.stack(imgs)).to(self.device, non_blocking=True)
+        im = im.permute(0, 3, 1, 2).float()  # BHWC to BCHW, (n, 3, h, w)
+        if im.shape[2:] != (resize_h, resize_w):
+            # cv2.INTER_LINEAR: half-pixel centers, no antialiasing, rounded back to uint8 values
+            im = F.interpolate(im, size=(resize_h, resize_w), mode='bilinear', align_corners=False).round_().clamp_(0, 255)
+        im = F.pad(im, (left, right, top, bottom), value=114.)
+        im /= 255  # 0 - 255 to 0.0 - 1.0
+        return im.contiguous()
+
+    def _preprocess_cpu(self, imgs: list[Image]) -> torch.Tensor:
         im = np.stack([self.letterbox(image=x) for x in imgs])
         im = im.transpose((0, 3, 1, 2))  # BHWC to BCHW, (n, 3, h, w)
         im = np.ascontiguousarray(im)  # contiguous
@@ -57,10 +112,15 @@ class MosaicDetectionModel:
         return im
 
     def inference(self, image_batch: torch.Tensor):
-        with self._lock:
+        # not inference_mode(): postprocess() (ultralytics NMS) modifies the predictions in-place
+        with self._lock, torch.no_grad():
             return self.model(image_batch, augment=False, visualize=False, embed=False)
 
-    def postprocess(self, preds, img, orig_imgs):
+    def postprocess(self, preds, img, orig_imgs) -> list[tuple[Results, list[Mask]]]:
+        """
+        Returns for each image its detection Results (without masks) and box-local masks, one for each detected box.
+        See crop_box_masks()
+        """
         protos = preds[1][-1]
         preds = ops.non_max_suppression(
             preds,
@@ -74,13 +134,47 @@ class MosaicDetectionModel:
         )
         return [self.construct_result(pred, img, orig_img, proto) for pred, orig_img, proto in zip(preds, orig_imgs, protos)]
 
-    def construct_result(self, preds: torch.tensor, img: torch.tensor, orig_img: list[Image], proto: torch.tensor):
+    def construct_result(self, preds: torch.tensor, img: torch.tensor, orig_img: Image, proto: torch.tensor) -> tuple[Results, list[Mask]]:
         if not len(preds):  # save empty boxes
-            masks = None
-        else:
-            masks = ops.process_mask(proto, preds[:, 6:], preds[:, :4], img.shape[2:], upsample=True)  # HWC
-            preds[:, :4] = ops.scale_boxes(img.shape[2:], preds[:, :4], orig_img.shape)
-        if masks is not None:
-            keep = masks.sum((-2, -1)) > 0  # only keep predictions with masks
-            preds, masks = preds[keep], masks[keep]
-        return Results(orig_img, path='', names=self.model.names, boxes=preds[:, :6], masks=masks)
+            return Results(orig_img, path='', names=self.model.names, boxes=preds[:, :6]), []
+        preds[:, :4] = ops.scale_boxes(img.shape[2:], preds[:, :4], orig_img.shape)
+        boxes = convert_yolo_boxes(Boxes(preds[:, :6], orig_img.shape), orig_img.shape)
+        masks = crop_box_masks(proto, preds[:, 6:], boxes, img.shape[2:], orig_img.shape)
+        keep = [mask is not None for mask in masks]  # only keep predictions with masks
+        preds = preds[torch.tensor(keep, device=preds.device)]
+        masks = [mask for mask in masks if mask is not None]
+        return Results(orig_img, path='', names=self.model.names, boxes=preds[:, :6]), masks
+
+def crop_box_masks(protos: torch.Tensor, masks_in: torch.Tensor, boxes: list[Box], img_shape: tuple[int, int], orig_shape: tuple[int, ...]) -> list[Mask | None]:
+    """
+    Like ultralytics.utils.ops.process_mask(..., upsample=True) followed by scaling masks to the original image size but
+    only the pixels within each box are sampled from the prototype masks (on the device). Outside the box process_mask would
+    zero out the mask anyway, so the box-local masks are lossless but their size scales with the box area instead of the frame size.
+
+    Returns box-local masks of shape (box height, box width, 1) (clipped to the image). Its top-left pixel corresponds to
+    the top-left pixel of the box in the original image. Masks without any foreground pixels are returned as None.
+    """
+    c, mh, mw = protos.shape
+    ih, iw = img_shape
+    oh, ow = orig_shape[:2]
+    # letterbox parameters, see ultralytics.utils.ops.scale_boxes
+    gain = min(ih / oh, iw / ow)
+    pad_x, pad_y = round((iw - ow * gain) / 2 - 0.1), round((ih - oh * gain) / 2 - 0.1)
+    mask_logits = (masks_in @ protos.float().view(c, -1)).view(-1, 1, mh, mw)
+    masks = []
+    for i, (t, l, b, r) in enumerate(boxes):
+        b, r = min(b, oh - 1), min(r, ow - 1)
+        if b < t or r < l:
+            masks.append(None)
+            continue
+        # pixel centers of the box in normalized coordinates of the letterboxed image (which the prototype masks cover)
+        ys = ((torch.arange(t, b + 1, device=protos.device, dtype=torch.float32) + 0.5) * gain + pad_y) / ih * 2 - 1
+        xs = ((torch.arange(l, r + 1, device=protos.device, dtype=torch.float32) + 0.5) * gain + pad_x) / iw * 2 - 1
+        grid_y, grid_x = torch.meshgrid(ys, xs, indexing='ij')
+        grid = torch.stack((grid_x, grid_y), dim=-1).unsqueeze(0)
+        mask = F.grid_sample(mask_logits[i:i+1], grid, mode='bilinear', align_corners=False)[0, 0] > 0.
+        if not mask.any():
+            masks.append(None)
+            continue
+        masks.append((mask.to(torch.uint8) * 255).unsqueeze(-1).cpu().numpy())
+    return masks
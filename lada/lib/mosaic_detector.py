@@ -9,20 +9,26 @@ import numpy as np
 import torch
 from ultralytics.engine.results import Results
 from lada.lib import Box, Mask, Image, VideoMetadata, threading_utils
-from lada.lib import image_utils
+from lada.lib import image_utils, mask_utils
 from lada.lib.mosaic_detection_model import MosaicDetectionModel
-from lada.lib.scene_utils import crop_to_box_v3
-from lada.lib import video_utils
+from lada.lib.scene_utils import get_crop_box_v3, box_iou
+from lada.lib import video_utils, keyframe_index, frame_source
 from lada import LOG_LEVEL
-from lada.lib.ultralytics_utils import convert_yolo_box, convert_yolo_mask
+from lada.lib.ultralytics_utils import convert_yolo_box
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=LOG_LEVEL)
 
 class Scene:
-    def __init__(self, file_path: Path, video_meta_data: VideoMetadata):
+    """
+    Detections of a mosaic region over consecutive frames. To keep memory usage independent of the video resolution only
+    the region of each frame which will be needed to create a Clip is stored, not the full frame. See get_crop_box_v3()
+    """
+    def __init__(self, file_path: Path, video_meta_data: VideoMetadata, crop_size=256, crop_border_size=0.06):
         self.file_path = file_path
         self.video_meta_data = video_meta_data
+        self.crop_size = crop_size
+        self.crop_border_size = crop_border_size
         self.data: list = []
         self.frame_start: int | None = None
         self.frame_end: int | None = None
@@ -31,17 +37,30 @@ class Scene:
     def __len__(self):
         return len(self.data)
 
+    def _crop(self, img: Image, box: Box) -> tuple[Image, Box]:
+        crop_box, _ = get_crop_box_v3(box, img.shape, (self.crop_size, self.crop_size), max_box_expansion_factor=1., border_size=self.crop_border_size)
+        t, l, b, r = crop_box
+        # copy so the full frame can be released after detection
+        return img[t:b + 1, l:r + 1].copy(), crop_box
+
     def add_frame(self, frame_num: int, img: Image, mask: Mask, box: Box):
+        """
+        img is the full frame, mask is box-local: It only covers the area of box (see mask_utils.crop_box_mask)
+        """
+        cropped_img, crop_box = self._crop(img, box)
         if self.frame_start is None:
             self.frame_start = frame_num
             self.frame_end = frame_num
-            self.data.append((img, mask, box))
+            self.data.append((cropped_img, mask, box, crop_box))
         else:
             assert frame_num == self.frame_end + 1
             self.frame_end = frame_num
-            self.data.append((img, mask, box))
+            self.data.append((cropped_img, mask, box, crop_box))
 
-    def merge_mask_box(self, mask: Mask, box: Box):
+    def merge_mask_box(self, img: Image, mask: Mask, box: Box):
+        """
+        Merges another detection of the last added frame. img is the full frame
+        """
         assert self.belongs(box)
         current_box = self.data[-1][2]
         t = min(current_box[0], box[0])
@@ -51,18 +70,29 @@ class Scene:
         new_box = (t, l, b, r)
 
         current_mask = self.data[-1][1]
-        new_mask = np.maximum(current_mask, mask)
+        new_mask = np.zeros((min(b, self.video_meta_data.video_height - 1) - t + 1, min(r, self.video_meta_data.video_width - 1) - l + 1, 1), dtype=np.uint8)
+        mask_utils.paste_box_mask(new_mask, new_box, current_mask, current_box)
+        mask_utils.paste_box_mask(new_mask, new_box, mask, box)
+
+        # the crop of the merged box can be larger than the crop of the current box, crop again from the full frame
+        cropped_img, crop_box = self._crop(img, new_box)
 
-        self.data[-1] = self.data[-1][0], new_mask, new_box
+        self.data[-1] = cropped_img, new_mask, new_box, crop_box
 
     def get_images(self):
-        return [img for img, _, _ in self.data]
+        """
+        Returns the cropped frames, see get_crop_boxes()
+        """
+        return [img for img, _, _, _ in self.data]
 
     def get_masks(self):
-        return [mask for _, mask, _ in self.data]
+        return [mask for _, mask, _, _ in self.data]
 
     def get_boxes(self):
-        return [box for _, _, box in self.data]
+        return [box for _, _, box, _ in self.data]
+
+    def get_crop_boxes(self):
+        return [crop_box for _, _, _, crop_box in self.data]
 
     def box_overlaps(self, box1: Box, box2: Box) -> bool:
         y_overlaps = (box1[0] <= box2[0] <= box1[2] or box1[0] <= box2[2] <= box1[2]) or (box2[0] <= box1[0] <= box2[2] or box2[0] <= box1[2] <= box2[2])
@@ -88,7 +118,7 @@ class Scene:
 
 
 class Clip:
-    def __init__(self, scene: Scene, size, pad_mode, id, preserve_relative_scale):
+    def __init__(self, scene: Scene, size, pad_mode, id, preserve_relative_scale, device=None):
         self.id = id
         self.file_path = scene.file_path
         self.frame_start = scene.frame_start
@@ -98,15 +128,12 @@ class Clip:
         self.pad_mode = pad_mode
         self.data = []
         self._index: int = 0
-        scene_masks = scene.get_masks()
-        scene_images = scene.get_images()
-        scene_boxes = scene.get_boxes()
+        assert scene.crop_size == size
         pad_after_resize = (0, 0, 0, 0)
 
-        # crop scene
-        for i in range(len(scene)):
-            img, mask, box = scene_images[i], scene_masks[i], scene_boxes[i]
-            cropped_img, cropped_mask, cropped_box, _ = crop_to_box_v3(box, img, mask, (size, size), max_box_expansion_factor=1., border_size=0.06)
+        # scene images are already cropped, masks are still box-local
+        for cropped_img, mask, box, cropped_box in scene.data:
+            cropped_mask = mask_utils.crop_box_mask(mask, box, cropped_box)
             self.data.append((cropped_img, cropped_mask, cropped_box, cropped_img.shape, pad_after_resize))
 
         # resize crops to out_size
@@ -116,19 +143,33 @@ class Clip:
         else:
             scale_width, scale_height = 1, 1
 
-        for i, (cropped_img, cropped_mask, cropped_box, _, _) in enumerate(self.data):
-            crop_shape = cropped_img.shape
-
-            resize_shape = (int(crop_shape[0] * scale_height), int(crop_shape[1] * scale_width))
-            cropped_img = image_utils.resize(cropped_img, resize_shape, interpolation=cv2.INTER_LINEAR)
-            cropped_mask = image_utils.resize(cropped_mask, resize_shape, interpolation=cv2.INTER_NEAREST)
-            assert cropped_mask.shape[:2] == cropped_img.shape[:2], f"{cropped_mask.shape[:2]}, {cropped_img.shape[:2]}"
-            assert cropped_img.shape[0] <= size or cropped_img.shape[1] <= size
-
-            cropped_img, pad_after_resize = image_utils.pad_image(cropped_img, size, size, mode=self.pad_mode)
-            cropped_mask, _ = image_utils.pad_image(cropped_mask, size, size, mode='zero')
-
-            self.data[i] = (cropped_img, cropped_mask, cropped_box, crop_shape, pad_after_resize)
+        crop_shapes = [cropped_img.shape for cropped_img, _, _, _, _ in self.data]
+        resize_shapes = [(int(crop_shape[0] * scale_height), int(crop_shape[1] * scale_width)) for crop_shape in crop_shapes]
+        assert all(shape[0] <= size or shape[1] <= size for shape in resize_shapes)
+        # resize and pad all frames of the clip at once
+        cropped_imgs, pads_after_resize = image_utils.resize_and_pad_images([cropped_img for cropped_img, _, _, _, _ in self.data], resize_shapes, size,
+                                                                            pad_mode=self.pad_mode, interpolation=cv2.INTER_LINEAR, device=device)
+        cropped_masks, _ = image_utils.resize_and_pad_images([cropped_mask for _, cropped_mask, _, _, _ in self.data], resize_shapes, size,
+                                                             pad_mode='zero', interpolation=cv2.INTER_NEAREST, device=device)
+
+        for i, (_, _, cropped_box, _, _) in enumerate(self.data):
+            self.data[i] = (cropped_imgs[i], cropped_masks[i], cropped_box, crop_shapes[i], pads_after_resize[i])
+
+    @classmethod
+    def from_data(cls, id, file_path, frame_start, frame_end, size, pad_mode, data: list) -> "Clip":
+        """
+        Re-creates a clip from already cropped data, e.g. after it has been transferred from another process
+        """
+        clip = cls.__new__(cls)
+        clip.id = id
+        clip.file_path = file_path
+        clip.frame_start = frame_start
+        clip.frame_end = frame_end
+        clip.size = size
+        clip.pad_mode = pad_mode
+        clip.data = data
+        clip._index = 0
+        return clip
 
     def get_max_width_height(self):
         max_width = 0
@@ -172,8 +213,47 @@ class Clip:
     def __getitem__(self, item):
         return self.data[item]
 
+class DynamicBatchSize:
+    """
+    Picks the number of frames of the next detection batch based on the depth of the queue it will be put into and the
+    time it took to read and preprocess previous frames.
+    If the queue fills up the consumer (inference) is the bottleneck and larger batches will increase throughput (exports).
+    If the consumer is waiting for frames, batches get smaller so results are available sooner (GUI preview).
+    Batches are never larger than what can be read within max_latency seconds.
+    """
+    def __init__(self, min_batch_size=1, max_batch_size=8, max_latency=0.2):
+        assert 0 < min_batch_size <= max_batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.batch_size = min_batch_size
+        self.frame_time: float | None = None
+
+    def next(self, q: queue.Queue) -> int:
+        if q.qsize() >= max(1, q.maxsize // 2):
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+        elif q.qsize() == 0:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        if self.frame_time:
+            self.batch_size = max(self.min_batch_size, min(self.batch_size, int(self.max_latency / self.frame_time)))
+        return self.batch_size
+
+    def update(self, batch_size: int, duration: float):
+        frame_time = duration / batch_size
+        self.frame_time = frame_time if self.frame_time is None else 0.8 * self.frame_time + 0.2 * frame_time
+
 class MosaicDetector:
-    def __init__(self, model: MosaicDetectionModel, video_file, frame_detection_queue: queue.Queue, mosaic_clip_queue: queue.Queue, max_clip_length=30, clip_size=256, device=None, pad_mode='reflect', preserve_relative_scale=False, dont_preserve_relative_scale=False, batch_size=4):
+    def __init__(self, model: MosaicDetectionModel, video_file, frame_detection_queue: queue.Queue, mosaic_clip_queue: queue.Queue, max_clip_length=30, clip_size=256, device=None, pad_mode='reflect', preserve_relative_scale=False, dont_preserve_relative_scale=False, batch_size=None,
+                 detection_stride=1, tracking_residual_threshold=0.5, max_batch_size=8, max_batch_latency=0.2):
+        """
+        batch_size: Number of frames run through the detection model at once. If None, the batch size will be adjusted
+        dynamically between 1 and max_batch_size, see DynamicBatchSize.
+
+        detection_stride: Run the detection model only on every detection_stride-th frame. Boxes and masks of frames in between
+        will be interpolated between the neighbouring detected frames as long as their detections can be matched and didn't move
+        too much (tracking residual: 1 - IoU of the matched boxes higher than tracking_residual_threshold).
+        Otherwise, the frames in between will be detected as well.
+        """
         self.model = model
         self.video_file = video_file
         self.device = torch.device(device) if device is not None else device
@@ -186,11 +266,16 @@ class MosaicDetector:
         self.clip_counter = 0
         self.start_ns = 0
         self.start_frame = 0
-        self.video_meta_data = video_utils.get_video_meta_data(self.video_file)
+        self.keyframe_index: keyframe_index.KeyframeIndex | None = None
+        self.video_meta_data = frame_source.get_video_meta_data(self.video_file)
         self.frame_detection_queue = frame_detection_queue
         self.mosaic_clip_queue = mosaic_clip_queue
-        self.frame_feeder_queue = queue.Queue(maxsize=8)
-        self.inference_queue = queue.Queue(maxsize=8)
+        self.batch_size = batch_size
+        self.max_batch_size = batch_size if batch_size is not None else max_batch_size
+        self.max_batch_latency = max_batch_latency
+        # larger batches and detection_stride increase the number of frames per queue item, keep the number of frames in flight about the same
+        self.frame_feeder_queue = queue.Queue(maxsize=max(2, 32 // (self.max_batch_size * detection_stride)))
+        self.inference_queue = queue.Queue(maxsize=max(2, 32 // (self.max_batch_size * detection_stride)))
         self.frame_detector_thread: threading.Thread | None = None
         self.frame_feeder_thread: threading.Thread | None = None
         self.inference_thread: threading.Thread | None = None
@@ -198,7 +283,15 @@ class MosaicDetector:
         self.frame_detector_thread_should_be_running = False
         self.inference_worker_thread_should_be_running = False
         self.stop_requested = False
-        self.batch_size = batch_size
+        assert detection_stride > 0
+        self.detection_stride = detection_stride
+        self.tracking_residual_threshold = tracking_residual_threshold
+
+        self.detection_stats = {}
+        self.detection_stats["frames_detected"] = 0
+        self.detection_stats["frames_interpolated"] = 0
+        self.detection_stats["frames_detected_residual"] = 0
+        self.detection_stats["batches"] = 0
 
         self.queue_stats = {}
         self.queue_stats["frame_detection_queue_wait_time_put"] = 0
@@ -214,7 +307,7 @@ class MosaicDetector:
 
     def start(self, start_ns):
         self.start_ns = start_ns
-        self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
+        self.start_frame, self.keyframe_index = keyframe_index.get_start_frame(self.video_file, self.start_ns, self.video_meta_data.video_fps_exact)
         self.stop_requested = False
         self.frame_detector_thread_should_be_running = True
         self.frame_feeder_thread_should_be_running = True
@@ -269,6 +362,7 @@ class MosaicDetector:
         threading_utils.empty_out_queue(self.frame_feeder_queue, "frame_feeder_queue")
 
         logger.debug(f"MosaicDetector: stopped, took: {time.time() - start}")
+        logger.debug(f"MosaicDetector: detection stats: {self.detection_stats}")
 
     def _create_clips_for_completed_scenes(self, scenes, frame_num, eof):
         completed_scenes = []
@@ -282,20 +376,20 @@ class MosaicDetector:
 
         for completed_scene in sorted(completed_scenes, key=lambda s: s.frame_start):
             if self.preserve_relative_scale and self.dont_preserve_relative_scale:
-                clip_v1 = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, True)
-                clip_v2 = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, False)
+                clip_v1 = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, True, device=self.device)
+                clip_v2 = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, False, device=self.device)
                 self.queue_stats["mosaic_clip_queue_max_size"] = max(self.mosaic_clip_queue.qsize()+1, self.queue_stats["mosaic_clip_queue_max_size"])
                 s = time.time()
                 self.mosaic_clip_queue.put((clip_v1, clip_v2))
                 self.queue_stats["mosaic_clip_queue_wait_time_put"] += time.time() - s
             elif self.preserve_relative_scale:
-                clip = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, True)
+                clip = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, True, device=self.device)
                 self.queue_stats["mosaic_clip_queue_max_size"] = max(self.mosaic_clip_queue.qsize()+1, self.queue_stats["mosaic_clip_queue_max_size"])
                 s = time.time()
                 self.mosaic_clip_queue.put(clip)
                 self.queue_stats["mosaic_clip_queue_wait_time_put"] += time.time() - s
             elif self.dont_preserve_relative_scale:
-                clip = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, False)
+                clip = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter, False, device=self.device)
                 self.queue_stats["mosaic_clip_queue_max_size"] = max(self.mosaic_clip_queue.qsize()+1, self.queue_stats["mosaic_clip_queue_max_size"])
                 s = time.time()
                 self.mosaic_clip_queue.put(clip)
@@ -307,8 +401,71 @@ class MosaicDetector:
             scenes.remove(completed_scene)
             self.clip_counter += 1
 
-    def _create_or_append_scenes_based_on_prediction_result(self, results: Results, scenes: list[Scene], frame_num):
-        mosaic_detected = len(results.boxes) > 0
+    def _get_detections(self, results: Results, masks: list[Mask]) -> list[tuple[Box, Mask]]:
+        detections = []
+        for i in range(len(results.boxes)):
+            box = convert_yolo_box(results.boxes[i], results.orig_shape)
+            if self.model.is_segmentation_model:
+                mask = masks[i]
+            else:
+                t, l, b, r = box
+                mask = np.zeros((min(b, results.orig_shape[0] - 1) - t + 1, min(r, results.orig_shape[1] - 1) - l + 1, 1), dtype=np.uint8)
+            detections.append((box, mask))
+        return detections
+
+    def _get_detection_images(self, frames: list[video_utils.LazyVideoFrame]) -> list[Image]:
+        """
+        The detection model only needs images of the letterbox size, scale them directly from the decoded frames.
+        """
+        (resize_h, resize_w), _ = self.model.get_letterbox_shape(frames[0].shape)
+        return [frame.to_resized_ndarray(resize_h, resize_w) for frame in frames]
+
+    def _detect(self, frames: list[video_utils.LazyVideoFrame]) -> list[list[tuple[Box, Mask]]]:
+        """
+        Runs the whole detection (pre-processing, inference, post-processing) in the calling thread
+        """
+        detections = []
+        for i in range(0, len(frames), self.max_batch_size):
+            frames_batch = self.model.preprocess(self._get_detection_images(frames[i:i + self.max_batch_size]))
+            batch_prediction_results = self.model.postprocess(self.model.inference(frames_batch), frames_batch, frames[i:i + self.max_batch_size])
+            detections.extend(self._get_detections(results, masks) for results, masks in batch_prediction_results)
+        return detections
+
+    def _interpolate_detections(self, frame_num_a, detections_a: list[tuple[Box, Mask]], frame_num_b, detections_b: list[tuple[Box, Mask]], frame_nums: list[int]) -> list[list[tuple[Box, Mask]]] | None:
+        """
+        Interpolates boxes of frames between two detected frames assuming constant velocity. Masks are taken from the
+        closer detected frame and resized to the interpolated box.
+        Returns None if detections can't be tracked reliably between both frames.
+        """
+        if len(detections_a) != len(detections_b):
+            return None
+        matches = []
+        unmatched_b = list(range(len(detections_b)))
+        for box_a, mask_a in detections_a:
+            if len(unmatched_b) == 0:
+                return None
+            idx_b = max(unmatched_b, key=lambda idx: box_iou(box_a, detections_b[idx][0]))
+            if 1. - box_iou(box_a, detections_b[idx_b][0]) > self.tracking_residual_threshold:
+                return None
+            unmatched_b.remove(idx_b)
+            matches.append(((box_a, mask_a), detections_b[idx_b]))
+
+        interpolated_detections = []
+        height, width = self.video_meta_data.video_height, self.video_meta_data.video_width
+        for frame_num in frame_nums:
+            weight = (frame_num - frame_num_a) / (frame_num_b - frame_num_a)
+            detections = []
+            for (box_a, mask_a), (box_b, mask_b) in matches:
+                t, l, b, r = [round(a + (b - a) * weight) for a, b in zip(box_a, box_b)]
+                mask = mask_a if weight < 0.5 else mask_b
+                mask_shape = (min(b, height - 1) - t + 1, min(r, width - 1) - l + 1)
+                mask = image_utils.resize(mask, mask_shape, interpolation=cv2.INTER_NEAREST).reshape(*mask_shape, 1)
+                detections.append(((t, l, b, r), mask))
+            interpolated_detections.append(detections)
+        return interpolated_detections
+
+    def _create_or_append_scenes_based_on_detections(self, img: video_utils.LazyVideoFrame, detections: list[tuple[Box, Mask]], scenes: list[Scene], frame_num):
+        mosaic_detected = len(detections) > 0
         self.queue_stats["frame_detection_queue_max_size"] = max(self.frame_detection_queue.qsize()+1, self.queue_stats["frame_detection_queue_max_size"])
         s = time.time()
         self.frame_detection_queue.put((frame_num, mosaic_detected))
@@ -316,49 +473,53 @@ class MosaicDetector:
         if self.stop_requested:
             logger.debug("frame detector worker: frame_detection_queue producer unblocked")
             return
-        for i in range(len(results.boxes)):
-            if self.model.is_segmentation_model:
-                mask = convert_yolo_mask(results.masks[i], results.orig_shape)
-            else:
-                # TODO: we currently don't use mosaic masks in the restoration pipeline, so we could also remove it
-                mask = np.zeros(results.orig_shape, dtype=np.uint8)
-            box = convert_yolo_box(results.boxes[i], results.orig_shape)
-
+        for box, mask in detections:
             current_scene = None
             for scene in scenes:
                 if scene.belongs(box):
                     if scene.frame_end == frame_num:
                         current_scene = scene
-                        current_scene.merge_mask_box(mask, box)
+                        current_scene.merge_mask_box(img, mask, box)
                     else:
                         current_scene = scene
-                        current_scene.add_frame(frame_num, results.orig_img, mask, box)
+                        current_scene.add_frame(frame_num, img, mask, box)
                     break
             if current_scene is None:
-                current_scene = Scene(self.video_file, self.video_meta_data)
+                current_scene = Scene(self.video_meta_data.video_file, self.video_meta_data, crop_size=self.clip_size)
                 scenes.append(current_scene)
-                current_scene.add_frame(frame_num, results.orig_img, mask, box)
+                current_scene.add_frame(frame_num, img, mask, box)
 
     def _frame_feeder_worker(self):
         logger.debug("frame feeder: started")
-        with video_utils.VideoReader(self.video_file) as video_reader:
-            if self.start_ns > 0:
+        with frame_source.open_video_reader(self.video_file, prefetch_frames=8) as video_reader:
+            if self.keyframe_index is not None:
+                video_reader.seek_frame(self.start_frame, self.keyframe_index)
+            elif self.start_ns > 0:
                 video_reader.seek(self.start_ns)
-            video_frames_generator = video_reader.frames()
+            # full resolution images will only be created for frames with detections, see Scene.add_frame()
+            video_frames_generator = video_reader.lazy_frames()
             frame_num = self.start_frame
             eof = False
+            dynamic_batch_size = DynamicBatchSize(max_batch_size=self.max_batch_size, max_latency=self.max_batch_latency) if self.batch_size is None else None
             while self.frame_feeder_thread_should_be_running:
+                batch_size = dynamic_batch_size.next(self.frame_feeder_queue) if dynamic_batch_size else self.batch_size
+                s = time.time()
                 try:
                     frames = []
-                    for i in range(self.batch_size):
+                    for i in range(batch_size * self.detection_stride):
                         frame, _ = next(video_frames_generator)
                         frames.append(frame)
                 except StopIteration:
                     eof = True
                     self.frame_feeder_thread_should_be_running = False
                 if len(frames) > 0:
-                    frames_batch = self.model.preprocess(frames)
-                    data = (frames_batch, frames, frame_num)
+                    # only key frames will be run through the detection model, see detection_stride
+                    keyframe_idxs = [i for i in range(len(frames)) if (frame_num + i - self.start_frame) % self.detection_stride == 0]
+                    frames_batch = self.model.preprocess(self._get_detection_images([frames[i] for i in keyframe_idxs])) if len(keyframe_idxs) > 0 else None
+                    if dynamic_batch_size:
+                        dynamic_batch_size.update(max(1, len(keyframe_idxs)), time.time() - s)
+                    self.detection_stats["batches"] += 1
+                    data = (frames_batch, frames, frame_num, keyframe_idxs)
                     self.queue_stats["frame_feeder_queue_max_size"] = max(self.frame_feeder_queue.qsize()+1, self.queue_stats["frame_feeder_queue_max_size"])
                     s = time.time()
                     self.frame_feeder_queue.put(data)
@@ -396,11 +557,11 @@ class MosaicDetector:
                 if self.stop_requested:
                     logger.debug("inference worker: inference_queue producer unblocked")
                 break
-            frames_batch, frames, frame_num = frames_data
+            frames_batch, frames, frame_num, keyframe_idxs = frames_data
             inference_results = self.model.inference(frames_batch) if frames_batch is not None else None
             self.queue_stats["inference_queue_max_size"] = max(self.inference_queue.qsize()+1, self.queue_stats["inference_queue_max_size"])
             s = time.time()
-            self.inference_queue.put((inference_results, frames_batch, frames, frame_num))
+            self.inference_queue.put((inference_results, frames_batch, frames, frame_num, keyframe_idxs))
             self.queue_stats["inference_queue_wait_time_put"] += time.time() - s
             if self.stop_requested:
                 logger.debug("inference worker: inference_queue producer unblocked")
@@ -412,6 +573,30 @@ class MosaicDetector:
         scenes: list[Scene] = []
         frame_num = self.start_frame
         eof = False
+        # frames between two key frames waiting for the detections of the next key frame, see detection_stride
+        pending_frames: list[tuple[int, video_utils.LazyVideoFrame]] = []
+        last_keyframe: tuple[int, list[tuple[Box, Mask]]] | None = None
+
+        def process_frame(frame_num, img, detections):
+            self._create_or_append_scenes_based_on_detections(img, detections, scenes, frame_num)
+            self._create_clips_for_completed_scenes(scenes, frame_num, eof=False)
+
+        def process_pending_frames(next_keyframe: tuple[int, list[tuple[Box, Mask]]] | None):
+            if len(pending_frames) == 0:
+                return
+            pending_frame_nums = [pending_frame_num for pending_frame_num, _ in pending_frames]
+            detections = None
+            if last_keyframe is not None and next_keyframe is not None:
+                detections = self._interpolate_detections(*last_keyframe, *next_keyframe, pending_frame_nums)
+            if detections is None:
+                detections = self._detect([img for _, img in pending_frames])
+                self.detection_stats["frames_detected_residual"] += len(pending_frames)
+            else:
+                self.detection_stats["frames_interpolated"] += len(pending_frames)
+            for (pending_frame_num, img), frame_detections in zip(pending_frames, detections):
+                process_frame(pending_frame_num, img, frame_detections)
+            pending_frames.clear()
+
         while self.frame_detector_thread_should_be_running:
             s = time.time()
             inference_data = self.inference_queue.get()
@@ -421,6 +606,8 @@ class MosaicDetector:
             if inference_data is None:
                 eof = True
             if eof:
+                if not self.stop_requested:
+                    process_pending_frames(next_keyframe=None)
                 self._create_clips_for_completed_scenes(scenes, frame_num, eof=True)
                 self.queue_stats["frame_detection_queue_max_size"] = max(self.frame_detection_queue.qsize()+1, self.queue_stats["frame_detection_queue_max_size"])
                 s = time.time()
@@ -436,13 +623,25 @@ class MosaicDetector:
                     logger.debug("frame detector worker: mosaic_clip_queue producer unblocked")
                 self.frame_detector_thread_should_be_running = False
             else:
-                inference_results, preprocessed_frames, orig_frames, _frame_num = inference_data
+                inference_results, preprocessed_frames, orig_frames, _frame_num, keyframe_idxs = inference_data
                 assert frame_num == _frame_num, "frame detector worker out of sync with frame reader"
-                batch_prediction_results = self.model.postprocess(inference_results, preprocessed_frames, orig_frames)
-                assert preprocessed_frames.shape[0] == len(batch_prediction_results)
-                for i, results in enumerate(batch_prediction_results):
-                    self._create_or_append_scenes_based_on_prediction_result(results, scenes, frame_num)
-                    self._create_clips_for_completed_scenes(scenes, frame_num, eof=False)
+                if preprocessed_frames is not None:
+                    batch_prediction_results = self.model.postprocess(inference_results, preprocessed_frames, [orig_frames[i] for i in keyframe_idxs])
+                    assert preprocessed_frames.shape[0] == len(batch_prediction_results)
+                    keyframe_detections = {idx: self._get_detections(results, masks) for idx, (results, masks) in zip(keyframe_idxs, batch_prediction_results)}
+                else:
+                    keyframe_detections = {}
+                self.detection_stats["frames_detected"] += len(keyframe_detections)
+                for i, img in enumerate(orig_frames):
+                    if i in keyframe_detections:
+                        detections = keyframe_detections[i]
+                        process_pending_frames(next_keyframe=(frame_num, detections))
+                        process_frame(frame_num, img, detections)
+                        last_keyframe = (frame_num, detections)
+                    else:
+                        pending_frames.append((frame_num, img))
+                    if self.stop_requested:
+                        break
                     frame_num += 1
         if eof:
             logger.debug("frame detector worker: stopped itself, EOF")
@@ -0,0 +1,169 @@
+import bisect
+import logging
+import time
+from dataclasses import dataclass
+
+import av
+
+from lada import LOG_LEVEL, DECODE_THREADS
+from lada.lib import Image
+from lada.lib.keyframe_index import KeyframeIndex, get_keyframe_index
+from lada.lib.mosaic_detection_model import MosaicDetectionModel
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+@dataclass
+class MosaicScanResult:
+    """
+    ranges: (start_ns, end_ns) of the parts of the video containing mosaics, end_ns is exclusive
+    """
+    ranges: list[tuple[int, int]]
+    video_duration: float
+    frames_count: int
+    frames_detected: int
+    duration: float
+
+    @property
+    def compute_seconds_per_hour(self) -> float:
+        return self.duration / self.video_duration * 3600 if self.video_duration > 0 else 0.
+
+    def to_dict(self) -> dict:
+        return dict(ranges=[(start_ns / 1_000_000_000, end_ns / 1_000_000_000) for start_ns, end_ns in self.ranges],
+                    video_duration=self.video_duration, frames_count=self.frames_count, frames_detected=self.frames_detected,
+                    duration=self.duration)
+
+class MosaicScanner:
+    """
+    Finds the time ranges of a video containing mosaics without running detection on every frame.
+    Only keyframes (at most one every sample_interval seconds) are decoded and run through the detection model.
+    Between two neighbouring samples with different results, the frame where mosaics appear or disappear is narrowed
+    down by binary search to precision seconds.
+    Mosaics which appear and disappear between two samples will be missed.
+    """
+    def __init__(self, model: MosaicDetectionModel, video_file: str, sample_interval: float = 0., precision: float = 0.5,
+                 batch_size: int = 8, decode_threads: int = DECODE_THREADS):
+        self.model = model
+        self.video_file = video_file
+        self.sample_interval = sample_interval
+        self.precision = precision
+        self.batch_size = batch_size
+        self.decode_threads = decode_threads
+        self.frames_detected = 0
+
+    def _open(self) -> av.container.InputContainer:
+        container = av.open(self.video_file)
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        stream.codec_context.thread_count = self.decode_threads
+        return container
+
+    def _get_detection_image(self, frame: av.VideoFrame) -> Image:
+        (resize_h, resize_w), _ = self.model.get_letterbox_shape((frame.height, frame.width))
+        return frame.reformat(width=resize_w, height=resize_h, format='bgr24', interpolation='BILINEAR').to_ndarray()
+
+    def _detect(self, imgs: list[Image]) -> list[bool]:
+        self.frames_detected += len(imgs)
+        batch = self.model.preprocess(imgs)
+        return [len(results.boxes) > 0 for results, _ in self.model.postprocess(self.model.inference(batch), batch, imgs)]
+
+    def _get_sample_frame_nums(self, keyframe_index: KeyframeIndex) -> list[int]:
+        sample_frame_nums = []
+        next_sample_ns = 0
+        for keyframe_pts in keyframe_index.keyframe_pts:
+            frame_num = bisect.bisect_left(keyframe_index.frame_pts, keyframe_pts)
+            offset_ns = keyframe_index.frame_offset_ns(frame_num)
+            if offset_ns >= next_sample_ns:
+                sample_frame_nums.append(frame_num)
+                next_sample_ns = offset_ns + int(self.sample_interval * 1_000_000_000)
+        return sample_frame_nums
+
+    def _detect_samples(self, keyframe_index: KeyframeIndex, sample_frame_nums: list[int]) -> list[tuple[int, bool]]:
+        """
+        Decodes only keyframes, the decoder skips all other frames
+        """
+        samples = set(sample_frame_nums)
+        results = []
+        frame_nums = []
+        imgs = []
+        with self._open() as container:
+            stream = container.streams.video[0]
+            stream.codec_context.skip_frame = 'NONKEY'
+            for frame in container.decode(stream):
+                if frame.pts is None:
+                    continue
+                frame_num = bisect.bisect_left(keyframe_index.frame_pts, frame.pts)
+                if frame_num not in samples:
+                    continue
+                frame_nums.append(frame_num)
+                imgs.append(self._get_detection_image(frame))
+                if len(imgs) == self.batch_size:
+                    results.extend(zip(frame_nums, self._detect(imgs)))
+                    frame_nums, imgs = [], []
+            if len(imgs) > 0:
+                results.extend(zip(frame_nums, self._detect(imgs)))
+        return sorted(results)
+
+    def _find_transition(self, container: av.container.InputContainer, keyframe_index: KeyframeIndex, frame_num_a: int, frame_num_b: int, detected_b: bool, precision_frames: int) -> int:
+        """
+        Binary search for the first frame after frame_num_a with the detection result of frame_num_b
+        """
+        stream = container.streams.video[0]
+        decoder = None
+        decoded_frame_num = None
+
+        def detect_frame(frame_num: int) -> bool:
+            nonlocal decoder, decoded_frame_num
+            keyframe_pts, _ = keyframe_index.keyframe_for_frame(frame_num)
+            # continue decoding if the frame comes later in the current GOP, otherwise seek to its keyframe
+            if decoder is None or decoded_frame_num >= frame_num or keyframe_index.frame_pts[decoded_frame_num] < keyframe_pts:
+                container.seek(keyframe_pts, stream=stream, backward=True, any_frame=False)
+                decoder = container.decode(stream)
+            target_pts = keyframe_index.frame_pts[frame_num]
+            for frame in decoder:
+                if frame.pts is None or frame.pts < target_pts:
+                    continue
+                decoded_frame_num = frame_num
+                return self._detect([self._get_detection_image(frame)])[0]
+            raise Exception(f"error scanning {self.video_file}: could not decode frame {frame_num}")
+
+        lo, hi = frame_num_a, frame_num_b
+        while hi - lo > precision_frames:
+            mid = (lo + hi) // 2
+            if detect_frame(mid) == detected_b:
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+    def scan(self) -> MosaicScanResult:
+        s = time.time()
+        self.frames_detected = 0
+        keyframe_index = get_keyframe_index(self.video_file)
+        if keyframe_index is None:
+            raise Exception(f"error scanning {self.video_file}: keyframes could not be indexed")
+        frames_count = keyframe_index.frames_count
+        fps = (frames_count - 1) / (keyframe_index.frame_offset_ns(frames_count - 1) / 1_000_000_000) if frames_count > 1 else 1.
+        precision_frames = max(1, round(self.precision * fps))
+        video_end_ns = keyframe_index.frame_offset_ns(frames_count - 1) + round(1_000_000_000 / fps)
+
+        samples = self._detect_samples(keyframe_index, self._get_sample_frame_nums(keyframe_index))
+        ranges = []
+        range_start_ns = 0 if len(samples) > 0 and samples[0][1] else None
+        with self._open() as container:
+            for (frame_num_a, detected_a), (frame_num_b, detected_b) in zip(samples, samples[1:]):
+                if detected_a == detected_b:
+                    continue
+                transition_ns = keyframe_index.frame_offset_ns(self._find_transition(container, keyframe_index, frame_num_a, frame_num_b, detected_b, precision_frames))
+                if detected_b:
+                    range_start_ns = transition_ns
+                else:
+                    ranges.append((range_start_ns, transition_ns))
+                    range_start_ns = None
+        if range_start_ns is not None:
+            ranges.append((range_start_ns, video_end_ns))
+
+        duration = time.time() - s
+        logger.info(f"scanned {self.video_file}: {len(samples)} samples, detection on {self.frames_detected}/{frames_count} frames, {duration:.1f}s")
+        return MosaicScanResult(ranges=ranges, video_duration=video_end_ns / 1_000_000_000, frames_count=frames_count,
+                                frames_detected=self.frames_detected, duration=duration)
@@ -0,0 +1,162 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+from lada import LOG_LEVEL
+from lada.lib.mosaic_detection_model import MosaicDetectionModel
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+def _split_batch(output, sizes: list[int]) -> list:
+    """
+    Splits (nested tuples/lists of) batch-first tensors into one output per request.
+    """
+    if isinstance(output, torch.Tensor):
+        return list(torch.split(output, sizes, dim=0))
+    elif isinstance(output, (tuple, list)):
+        return [type(output)(parts) for parts in zip(*[_split_batch(o, sizes) for o in output])]
+    else:
+        return [output] * len(sizes)
+
+class BatchingQueue:
+    """
+    Merges batched calls of fn from multiple threads into fewer calls with larger batches.
+    Inputs are batch-first tensors, only inputs of the same shape (besides batch dim), dtype and device will be merged.
+    Callers block until the result for their part of the batch is available.
+    """
+    def __init__(self, fn, max_batch_size: int, max_wait_time: float = 0.005, name: str = "batching_queue"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.name = name
+        self.request_queue = queue.Queue()
+        self.worker_thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self.worker_thread.start()
+
+        self.stats = {}
+        self.stats["calls"] = 0
+        self.stats["requests"] = 0
+        self.stats["batch_size_sum"] = 0
+
+    def __call__(self, batch: torch.Tensor):
+        future = Future()
+        self.request_queue.put((batch, future))
+        return future.result()
+
+    def stop(self):
+        self.request_queue.put(None)
+        self.worker_thread.join()
+
+    def _collect_requests(self) -> list | None:
+        request = self.request_queue.get()
+        if request is None:
+            return None
+        requests = [request]
+        batch_size = request[0].shape[0]
+        deadline = time.time() + self.max_wait_time
+        while batch_size < self.max_batch_size:
+            try:
+                request = self.request_queue.get(timeout=max(0., deadline - time.time()))
+            except queue.Empty:
+                break
+            if request is None:
+                self.request_queue.put(None)
+                break
+            requests.append(request)
+            batch_size += request[0].shape[0]
+        return requests
+
+    def _worker(self):
+        while True:
+            requests = self._collect_requests()
+            if requests is None:
+                break
+            groups: dict[tuple, list] = {}
+            for request in requests:
+                batch = request[0]
+                groups.setdefault((tuple(batch.shape[1:]), batch.dtype, batch.device), []).append(request)
+            for group in groups.values():
+                self._run(group)
+
+    def _run(self, requests: list):
+        batches = [batch for batch, _ in requests]
+        futures = [future for _, future in requests]
+        try:
+            # grad mode is thread-local, the callers' torch.no_grad() doesn't apply in this worker thread.
+            # Not inference_mode(): callers modify outputs in-place (e.g. NMS, tensor2img) which fails for inference tensors
+            with torch.no_grad():
+                if len(batches) == 1:
+                    outputs = [self.fn(batches[0])]
+                else:
+                    output = self.fn(torch.cat(batches, dim=0))
+                    outputs = _split_batch(output, [batch.shape[0] for batch in batches])
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        self.stats["calls"] += 1
+        self.stats["requests"] += len(requests)
+        self.stats["batch_size_sum"] += sum(batch.shape[0] for batch in batches)
+
+class BatchingMosaicDetectionModel:
+    """
+    MosaicDetectionModel which can be shared by multiple MosaicDetectors. Inference batches of all detectors will be
+    merged so the device runs fewer but larger batches. Pre- and postprocessing still run in the thread of each detector.
+    """
+    def __init__(self, model: MosaicDetectionModel, max_batch_size: int = 16, max_wait_time: float = 0.005):
+        self.model = model
+        self.batching_queue = BatchingQueue(model.inference, max_batch_size, max_wait_time, name="detection batching queue")
+
+    def inference(self, image_batch: torch.Tensor):
+        return self.batching_queue(image_batch)
+
+    def __getattr__(self, item):
+        return getattr(self.model, item)
+
+class BatchingRestorationModel:
+    """
+    BasicVSR++ restoration model which can be shared by multiple FrameRestorers. Clips of all restorers will be merged
+    into a single batch if they have the same length (clips reaching max_clip_length are the common case for long scenes).
+    """
+    def __init__(self, model: torch.nn.Module, max_batch_size: int = 2, max_wait_time: float = 0.005):
+        self.model = model
+        self.batching_queue = BatchingQueue(model, max_batch_size, max_wait_time, name="restoration batching queue")
+
+    def __call__(self, clip_batch: torch.Tensor):
+        return self.batching_queue(clip_batch)
+
+    def __getattr__(self, item):
+        return getattr(self.model, item)
+
+class MultiStreamEngine:
+    """
+    Runs multiple FrameRestorer pipelines in the same process. All of them share the same detection and restoration model
+    and their inference requests will be batched across streams.
+    """
+    def __init__(self, device, mosaic_restoration_model_name, mosaic_detection_model: MosaicDetectionModel, mosaic_restoration_model, preferred_pad_mode,
+                 max_detection_batch_size=16, max_restoration_batch_size=2):
+        self.device = device
+        self.mosaic_restoration_model_name = mosaic_restoration_model_name
+        self.preferred_pad_mode = preferred_pad_mode
+        self.mosaic_detection_model = BatchingMosaicDetectionModel(mosaic_detection_model, max_batch_size=max_detection_batch_size)
+        if mosaic_restoration_model_name.startswith("basicvsrpp"):
+            self.mosaic_restoration_model = BatchingRestorationModel(mosaic_restoration_model, max_batch_size=max_restoration_batch_size)
+        else:
+            # DeepMosaics restores clips frame by frame with its own batching, we can only share the model
+            self.mosaic_restoration_model = mosaic_restoration_model
+
+    def stop(self):
+        batching_queues = [self.mosaic_detection_model.batching_queue]
+        if isinstance(self.mosaic_restoration_model, BatchingRestorationModel):
+            batching_queues.append(self.mosaic_restoration_model.batching_queue)
+        for batching_queue in batching_queues:
+            batching_queue.stop()
+            stats = batching_queue.stats
+            if stats["calls"] > 0:
+                logger.debug(f"{batching_queue.name}: {stats['requests']} requests merged into {stats['calls']} calls, average batch size {stats['batch_size_sum'] / stats['calls']:.1f}")
@@ -0,0 +1,262 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import weakref
+
+from lada import LOG_LEVEL
+from lada.lib import threading_utils
+from lada.lib.frame_source import FrameSource
+from lada.lib.mosaic_detection_model import MosaicDetectionModel
+from lada.lib.mosaic_detector import MosaicDetector, Clip
+from lada.lib.shared_memory_ring import SharedMemoryRing
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+"""
+thread: all pipeline stages run as threads in the current process.
+process: MosaicDetector (decoding, detection pre- and postprocessing, scene and clip creation) runs in a separate process,
+clips are sent back through shared memory. Its Python-heavy parts then don't compete for the GIL with restoration,
+compositing and encoding. The worker process loads its own copy of the detection model.
+"""
+PIPELINE_EXECUTORS = ('thread', 'process')
+
+def create_mosaic_detector(executor: str, model: MosaicDetectionModel, video_file, frame_detection_queue: queue.Queue, mosaic_clip_queue: queue.Queue, **kwargs):
+    if executor == 'process' and isinstance(video_file, FrameSource):
+        logger.warning("pipeline executor process can't read from a FrameSource, using thread")
+        executor = 'thread'
+    if executor == 'thread':
+        return MosaicDetector(model, video_file, frame_detection_queue, mosaic_clip_queue, **kwargs)
+    elif executor == 'process':
+        return ProcessMosaicDetector(model, video_file, frame_detection_queue, mosaic_clip_queue, **kwargs)
+    else:
+        raise NotImplementedError(f"unsupported pipeline executor: {executor}")
+
+def _clips_to_arrays(item: Clip | tuple[Clip, Clip]) -> tuple[list, tuple]:
+    clips = item if isinstance(item, tuple) else (item,)
+    arrays = []
+    clips_metadata = []
+    for clip in clips:
+        for img, mask, _, _, _ in clip.data:
+            arrays.append(img)
+            arrays.append(mask)
+        clips_metadata.append(dict(id=clip.id, file_path=clip.file_path, frame_start=clip.frame_start, frame_end=clip.frame_end,
+                                   size=clip.size, pad_mode=clip.pad_mode,
+                                   data=[(box, crop_shape, pad) for _, _, box, crop_shape, pad in clip.data]))
+    return arrays, (isinstance(item, tuple), clips_metadata)
+
+def _clips_from_arrays(arrays: list, metadata: tuple) -> Clip | tuple[Clip, Clip]:
+    is_tuple, clips_metadata = metadata
+    clips = []
+    idx = 0
+    for clip_metadata in clips_metadata:
+        data = []
+        for box, crop_shape, pad in clip_metadata.pop('data'):
+            data.append((arrays[idx], arrays[idx + 1], box, crop_shape, pad))
+            idx += 2
+        clips.append(Clip.from_data(data=data, **clip_metadata))
+    return tuple(clips) if is_tuple else clips[0]
+
+def _mosaic_detector_process(model_path, model_kwargs, device, video_file, detector_kwargs, control_queue, ack_queue, detections_queue, clip_ring: SharedMemoryRing):
+    model = MosaicDetectionModel(model_path, device, **model_kwargs)
+    frame_detection_queue = queue.Queue()
+    # the shared memory ring buffers clips, no need for a large local queue
+    mosaic_clip_queue = queue.Queue(maxsize=1)
+    mosaic_detector = MosaicDetector(model, video_file, frame_detection_queue, mosaic_clip_queue, device=device, **detector_kwargs)
+    stop_forwarding = threading.Event()
+    forwarder_threads: list[threading.Thread] = []
+    ack_queue.put(("ready", None))
+
+    def forward_detections(generation):
+        while not stop_forwarding.is_set():
+            try:
+                item = frame_detection_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            detections_queue.put((generation, item))
+            if item is None:
+                break
+
+    def forward_clips(generation):
+        while not stop_forwarding.is_set():
+            try:
+                item = mosaic_clip_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if item is None:
+                clip_ring.put_metadata((generation, None))
+                break
+            arrays, metadata = _clips_to_arrays(item)
+            if not clip_ring.put(arrays, (generation, metadata), should_stop=stop_forwarding.is_set):
+                break
+
+    def stop():
+        stop_forwarding.set()
+        mosaic_detector.stop()
+        for forwarder_thread in forwarder_threads:
+            forwarder_thread.join()
+        forwarder_threads.clear()
+        threading_utils.empty_out_queue(frame_detection_queue, "frame_detection_queue")
+        threading_utils.empty_out_queue(mosaic_clip_queue, "mosaic_clip_queue")
+
+    while True:
+        command, generation, start_ns = control_queue.get()
+        if command == "start":
+            stop_forwarding.clear()
+            mosaic_detector.start(start_ns=start_ns)
+            forwarder_threads.extend([threading.Thread(target=forward_detections, args=(generation,)),
+                                      threading.Thread(target=forward_clips, args=(generation,))])
+            for forwarder_thread in forwarder_threads:
+                forwarder_thread.start()
+        elif command == "stop":
+            stop()
+            ack_queue.put(("stopped", dict(mosaic_detector.queue_stats)))
+        elif command == "exit":
+            stop()
+            break
+    clip_ring.close()
+
+def _shutdown_worker_process(process, control_queue, clip_ring: SharedMemoryRing):
+    if process.is_alive():
+        control_queue.put(("exit", None, None))
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    clip_ring.close()
+    clip_ring.unlink()
+
+class ProcessMosaicDetector:
+    """
+    Same interface as MosaicDetector but runs it in a separate process. Detection results and clips will be put into the
+    given queues in this process. The worker process is kept alive across start() / stop() (e.g. seeking) so the model
+    only needs to be loaded once.
+    """
+    def __init__(self, model: MosaicDetectionModel, video_file, frame_detection_queue: queue.Queue, mosaic_clip_queue: queue.Queue, max_clip_length=30, clip_size=256, device=None, pad_mode='reflect', preserve_relative_scale=False, dont_preserve_relative_scale=False, batch_size=None,
+                 detection_stride=1, tracking_residual_threshold=0.5, max_batch_size=8, max_batch_latency=0.2, clip_ring_slots=2):
+        self.frame_detection_queue = frame_detection_queue
+        self.mosaic_clip_queue = mosaic_clip_queue
+        # only used for queue stats, frames will be fed in the worker process
+        self.frame_feeder_queue = queue.Queue(maxsize=max(2, 32 // ((batch_size or max_batch_size) * detection_stride)))
+        self.stop_requested = False
+        self.generation = 0
+        self.detections_pump_thread: threading.Thread | None = None
+        self.clips_pump_thread: threading.Thread | None = None
+
+        mp_context = multiprocessing.get_context('spawn')
+        clip_variants = int(preserve_relative_scale) + int(dont_preserve_relative_scale)
+        clip_ring_slot_size = max_clip_length * clip_size * clip_size * 4 * clip_variants # 4 = 3 color channels + mask
+        self.clip_ring = SharedMemoryRing(clip_ring_slots, clip_ring_slot_size, mp_context)
+        self.control_queue = mp_context.Queue()
+        self.ack_queue = mp_context.Queue()
+        self.detections_queue = mp_context.Queue()
+        detector_kwargs = dict(max_clip_length=max_clip_length, clip_size=clip_size, pad_mode=pad_mode, preserve_relative_scale=preserve_relative_scale,
+                               dont_preserve_relative_scale=dont_preserve_relative_scale, batch_size=batch_size,
+                               detection_stride=detection_stride, tracking_residual_threshold=tracking_residual_threshold,
+                               max_batch_size=max_batch_size, max_batch_latency=max_batch_latency)
+        self.process = mp_context.Process(target=_mosaic_detector_process, name="mosaic detector", daemon=True,
+                                          args=(model.model_path, model.model_kwargs, str(device) if device is not None else None, video_file, detector_kwargs,
+                                                self.control_queue, self.ack_queue, self.detections_queue, self.clip_ring))
+        self.process.start()
+        self._finalizer = weakref.finalize(self, _shutdown_worker_process, self.process, self.control_queue, self.clip_ring)
+        self._wait_for_ack("ready")
+
+        self.queue_stats = {}
+        self.queue_stats["frame_detection_queue_wait_time_put"] = 0
+        self.queue_stats["frame_detection_queue_max_size"] = 0
+        self.queue_stats["mosaic_clip_queue_wait_time_put"] = 0
+        self.queue_stats["mosaic_clip_queue_max_size"] = 0
+        self.queue_stats["frame_feeder_queue_wait_time_put"] = 0
+        self.queue_stats["frame_feeder_queue_wait_time_get"] = 0
+        self.queue_stats["frame_feeder_queue_max_size"] = 0
+        self.queue_stats["inference_queue_wait_time_put"] = 0
+        self.queue_stats["inference_queue_wait_time_get"] = 0
+        self.queue_stats["inference_queue_max_size"] = 0
+
+    def _wait_for_ack(self, expected):
+        while True:
+            try:
+                ack, data = self.ack_queue.get(timeout=0.5)
+                assert ack == expected, f"Illegal state: expected {expected} from mosaic detector process but received {ack}"
+                return data
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"mosaic detector process died with exit code {self.process.exitcode}")
+
+    def start(self, start_ns):
+        self.stop_requested = False
+        self.generation += 1
+        self.control_queue.put(("start", self.generation, start_ns))
+        self.detections_pump_thread = threading.Thread(target=self._detections_pump, args=(self.generation,))
+        self.clips_pump_thread = threading.Thread(target=self._clips_pump, args=(self.generation,))
+        self.detections_pump_thread.start()
+        self.clips_pump_thread.start()
+
+    def stop(self):
+        logger.debug("ProcessMosaicDetector: stopping...")
+        start = time.time()
+        self.stop_requested = True
+        self.control_queue.put(("stop", self.generation, None))
+        # unblock producers
+        clean_up_threads = [
+            threading_utils.empty_out_queue_until_producer_is_done(self.mosaic_clip_queue, "mosaic_clip_queue", self.clips_pump_thread),
+            threading_utils.empty_out_queue_until_producer_is_done(self.frame_detection_queue, "frame_detection_queue", self.detections_pump_thread)]
+        for pump_thread in (self.clips_pump_thread, self.detections_pump_thread):
+            if pump_thread:
+                pump_thread.join()
+        for clean_up_thread in clean_up_threads:
+            clean_up_thread.join()
+        self.clips_pump_thread = None
+        self.detections_pump_thread = None
+        if self.process.is_alive():
+            worker_queue_stats = self._wait_for_ack("stopped")
+            for key, value in worker_queue_stats.items():
+                if not (key.startswith("mosaic_clip_queue") or key.startswith("frame_detection_queue")):
+                    self.queue_stats[key] = value
+        logger.debug(f"ProcessMosaicDetector: stopped, took: {time.time() - start}")
+
+    def _put(self, q: queue.Queue, item, debug_queue_name):
+        self.queue_stats[f"{debug_queue_name}_max_size"] = max(q.qsize() + 1, self.queue_stats[f"{debug_queue_name}_max_size"])
+        s = time.time()
+        q.put(item)
+        self.queue_stats[f"{debug_queue_name}_wait_time_put"] += time.time() - s
+
+    def _worker_died(self, debug_queue_name) -> bool:
+        if self.process.is_alive():
+            return False
+        logger.error(f"mosaic detector process died with exit code {self.process.exitcode}, closing {debug_queue_name}")
+        return True
+
+    def _detections_pump(self, generation):
+        while not self.stop_requested:
+            try:
+                item_generation, item = self.detections_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._worker_died("frame_detection_queue"):
+                    self._put(self.frame_detection_queue, None, "frame_detection_queue")
+                    break
+                continue
+            if item_generation != generation:
+                # left over from before the last seek
+                continue
+            self._put(self.frame_detection_queue, item, "frame_detection_queue")
+            if item is None:
+                break
+
+    def _clips_pump(self, generation):
+        while not self.stop_requested:
+            try:
+                arrays, (item_generation, metadata) = self.clip_ring.get(timeout=0.1)
+            except queue.Empty:
+                if self._worker_died("mosaic_clip_queue"):
+                    self._put(self.mosaic_clip_queue, None, "mosaic_clip_queue")
+                    break
+                continue
+            if item_generation != generation:
+                # left over from before the last seek
+                continue
+            item = None if metadata is None else _clips_from_arrays(arrays, metadata)
+            self._put(self.mosaic_clip_queue, item, "mosaic_clip_queue")
+            if item is None:
+                break
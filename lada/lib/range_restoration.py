@@ -0,0 +1,173 @@
+import bisect
+import logging
+import re
+import subprocess
+from dataclasses import dataclass
+
+import av
+
+from lada import LOG_LEVEL
+from lada.lib.keyframe_index import KeyframeIndex
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+"""
+Codecs whose stream-copied and re-encoded segments can be joined: MPEG-TS segments carry their parameter sets in-band
+"""
+SUPPORTED_CODECS = ('h264', 'hevc')
+
+"""
+Profiles of the source stream and the encoder profile producing them
+"""
+ENCODER_PROFILES = {
+    'h264': {'Baseline': 'baseline', 'Constrained Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+             'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'},
+    'hevc': {'Main': 'main', 'Main 10': 'main10'},
+}
+
+_TIME_REGEX = re.compile(r"^(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d*)?)$")
+
+def parse_time(text: str) -> int:
+    """
+    Parses [[hh:]mm:]ss[.fff] into nanoseconds
+    """
+    match = _TIME_REGEX.match(text.strip())
+    if match is None:
+        raise ValueError(f"invalid time: {text}, expected [[hh:]mm:]ss[.fff]")
+    hours, minutes, seconds = match.groups()
+    return round((int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)) * 1_000_000_000)
+
+def format_time(offset_ns: int) -> str:
+    seconds = offset_ns / 1_000_000_000
+    return f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}"
+
+def parse_time_ranges(text: str) -> list[tuple[int, int]]:
+    """
+    Parses comma separated time ranges like "00:10:00-00:12:30,01:00:00-01:02:00" into (start_ns, end_ns) tuples,
+    sorted and with overlapping ranges merged
+    """
+    ranges = []
+    for range_text in text.split(','):
+        if not range_text.strip():
+            continue
+        parts = range_text.split('-')
+        if len(parts) != 2:
+            raise ValueError(f"invalid time range: {range_text}, expected <start>-<end>")
+        start_ns, end_ns = parse_time(parts[0]), parse_time(parts[1])
+        if end_ns <= start_ns:
+            raise ValueError(f"invalid time range: {range_text}, end must be after start")
+        ranges.append((start_ns, end_ns))
+    ranges.sort()
+    merged_ranges = []
+    for start_ns, end_ns in ranges:
+        if merged_ranges and start_ns <= merged_ranges[-1][1]:
+            merged_ranges[-1] = (merged_ranges[-1][0], max(merged_ranges[-1][1], end_ns))
+        else:
+            merged_ranges.append((start_ns, end_ns))
+    return merged_ranges
+
+def get_encoder_format(video_file: str) -> tuple[str, dict[str, str]]:
+    """
+    Pixel format and encoder options (profile, level) for restored segments so they match the parameters of the
+    stream-copied segments. Raises ValueError if the encoder can't produce a matching stream.
+    """
+    with av.open(video_file) as container:
+        codec_context = container.streams.video[0].codec_context
+        codec_name, pix_fmt, profile, level = codec_context.codec.canonical_name, codec_context.pix_fmt, codec_context.profile, codec_context.level
+    encoder = av.codec.Codec(codec_name, 'w')
+    if pix_fmt not in {video_format.name for video_format in encoder.video_formats or []}:
+        raise ValueError(f"pixel format {pix_fmt} is not supported by encoder {encoder.name}")
+    encoder_profile = ENCODER_PROFILES.get(codec_name, {}).get(profile)
+    if encoder_profile is None:
+        raise ValueError(f"{codec_name} profile {profile} is not supported by encoder {encoder.name}")
+    encoder_options = {'profile': encoder_profile}
+    # level_idc of h264 is the level times 10, 1b and unknown levels are left to the encoder
+    if codec_name == 'h264' and level is not None and level > 9:
+        encoder_options['level'] = f"{level // 10}.{level % 10}"
+    return pix_fmt, encoder_options
+
+@dataclass
+class Segment:
+    """
+    Frames frame_start (inclusive) to frame_end (exclusive). Both are closed GOP keyframes (or the end of the video) so
+    the segment can be stream-copied or re-encoded on its own.
+    """
+    frame_start: int
+    frame_end: int
+    restore: bool
+
+    @property
+    def frames_count(self) -> int:
+        return self.frame_end - self.frame_start
+
+def plan_segments(keyframe_index: KeyframeIndex, ranges: list[tuple[int, int]]) -> list[Segment]:
+    """
+    Splits the video into segments which will be restored (covering the given time ranges, extended to the surrounding
+    keyframes) and segments which will be stream-copied.
+    Only keyframes of closed GOPs are used as split points as frames around open GOP keyframes depend on both sides.
+    """
+    keyframe_nums = sorted({0} | {bisect.bisect_left(keyframe_index.frame_pts, pts)
+                                  for pts, closed in zip(keyframe_index.keyframe_pts, keyframe_index.keyframe_closed) if closed})
+    frames_count = keyframe_index.frames_count
+
+    def keyframe_at_or_before(frame_num: int) -> int:
+        return keyframe_nums[max(0, bisect.bisect_right(keyframe_nums, frame_num) - 1)]
+
+    def keyframe_after(frame_num: int) -> int:
+        idx = bisect.bisect_right(keyframe_nums, frame_num)
+        return keyframe_nums[idx] if idx < len(keyframe_nums) else frames_count
+
+    restore_segments = []
+    for start_ns, end_ns in ranges:
+        frame_start = keyframe_at_or_before(keyframe_index.frame_num_at(start_ns))
+        # end_ns is exclusive, the last frame of the range is the one shown right before it
+        frame_end = keyframe_after(keyframe_index.frame_num_at(max(start_ns, end_ns - 1)))
+        if frame_start >= frames_count:
+            continue
+        if restore_segments and frame_start <= restore_segments[-1].frame_end:
+            restore_segments[-1].frame_end = max(restore_segments[-1].frame_end, frame_end)
+        else:
+            restore_segments.append(Segment(frame_start, frame_end, restore=True))
+
+    segments = []
+    frame_num = 0
+    for segment in restore_segments:
+        if segment.frame_start > frame_num:
+            segments.append(Segment(frame_num, segment.frame_start, restore=False))
+        segments.append(segment)
+        frame_num = segment.frame_end
+    if frame_num < frames_count:
+        segments.append(Segment(frame_num, frames_count, restore=False))
+    return segments
+
+def copy_segment(input_path: str, output_path: str, keyframe_index: KeyframeIndex, segment: Segment):
+    """
+    Stream-copies the video packets of the segment into a MPEG-TS file. Timestamps are kept.
+    """
+    start_pts = keyframe_index.frame_pts[segment.frame_start]
+    end_pts = keyframe_index.frame_pts[segment.frame_end] if segment.frame_end < keyframe_index.frames_count else None
+    with av.open(input_path) as input_container, av.open(output_path, 'w', format='mpegts') as output_container:
+        input_stream = input_container.streams.video[0]
+        output_stream = output_container.add_stream_from_template(input_stream)
+        input_container.seek(start_pts, stream=input_stream, backward=True, any_frame=False)
+        for packet in input_container.demux(input_stream):
+            if packet.size == 0 or packet.pts is None:
+                continue
+            # packets are in decoding order and pts >= dts: no packets of this segment will follow
+            if end_pts is not None and packet.dts is not None and packet.dts >= end_pts:
+                break
+            if packet.pts < start_pts or (end_pts is not None and packet.pts >= end_pts):
+                continue
+            packet.stream = output_stream
+            output_container.mux(packet)
+
+def concat_segments(segment_paths: list[str], output_path: str):
+    """
+    Joins MPEG-TS segments into a single video file (format based on file extension) without re-encoding
+    """
+    cmd = ["ffmpeg", "-y", "-loglevel", "quiet"]
+    cmd += ["-i", "concat:" + "|".join(segment_paths)]
+    cmd += ["-map", "0:v:0", "-c", "copy"]
+    cmd += [output_path]
+    subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
@@ -0,0 +1,39 @@
+import json
+import os
+
+import torch
+
+SAFETENSORS_FILE_EXTENSION = ".safetensors"
+
+def is_safetensors_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() == SAFETENSORS_FILE_EXTENSION
+
+def prefer_safetensors_file(path: str) -> str:
+    """
+    Returns path of the .safetensors variant of the given model weights file if it exists next to it, otherwise the given path.
+    """
+    safetensors_path = os.path.splitext(path)[0] + SAFETENSORS_FILE_EXTENSION
+    return safetensors_path if os.path.exists(safetensors_path) else path
+
+def save_safetensors(state_dict: dict[str, torch.Tensor], path: str, metadata: dict | None = None):
+    from safetensors.torch import save_file
+    # safetensors only supports str -> str metadata. Values which are not strings will be stored JSON encoded
+    metadata = {k: v if isinstance(v, str) else json.dumps(v) for k, v in (metadata or {}).items()}
+    save_file({k: v.detach().contiguous() for k, v in state_dict.items()}, path, metadata=metadata)
+
+def load_safetensors(path: str, device='cpu', prefix: str = '') -> tuple[dict[str, torch.Tensor], dict[str, str]]:
+    """
+    Memory-maps the safetensors file and only reads tensors whose names start with prefix (prefix will be removed from the returned keys).
+    Tensors are placed directly on the given device, there is no unpickling / intermediate copy of the whole checkpoint.
+
+    If device is the CPU, then load the returned state dict via `module.load_state_dict(state_dict, assign=True)`
+    so parameters will reference the loaded tensors instead of being copied once more.
+    """
+    from safetensors import safe_open
+    state_dict = {}
+    with safe_open(path, framework="pt", device=str(device)) as f:
+        metadata = f.metadata() or {}
+        for key in f.keys():
+            if key.startswith(prefix):
+                state_dict[key[len(prefix):]] = f.get_tensor(key)
+    return state_dict, metadata
@@ -11,27 +11,27 @@ def box_overlap(box1: Box, box2: Box):
     r = min(r1, r2)
     return r > l and b > t
 
-def crop_to_box_v3(box: Box, img: Image, mask_img: Mask, target_size: tuple[int, int], max_box_expansion_factor=1.0, border_size=0):
+def box_iou(box1: Box, box2: Box) -> float:
+    t1, l1, b1, r1 = box1
+    t2, l2, b2, r2 = box2
+    intersection = max(0, min(b1, b2) - max(t1, t2) + 1) * max(0, min(r1, r2) - max(l1, l2) + 1)
+    area1 = (b1 - t1 + 1) * (r1 - l1 + 1)
+    area2 = (b2 - t2 + 1) * (r2 - l2 + 1)
+    return intersection / (area1 + area2 - intersection)
+
+def get_crop_box_v3(box: Box, img_shape: tuple[int, ...], target_size: tuple[int, int], max_box_expansion_factor=1.0, border_size=0) -> tuple[Box, float]:
     """
-    Crops Mask and Image by using Box. Will try to grow Box to better fit target size
-    Parameters
-    ----------
-    box
-    img
-    mask_img
-    target_size
-    max_box_expansion_factor: Limits how much to grow the Box before cropping. Could be useful for tiny Boxes (compared to given target size)
-    border_size: includes area outside of box. useful to additional context outside the box detection
+    Calculates the Box which crop_to_box_v3 would use to crop an image of shape img_shape.
 
     Returns
     -------
-    img, mask_img, cropped_box, scale_factor
+    cropped_box, scale_factor
     """
     target_width, target_height = target_size
     t, l, b, r = box
     width, height = r - l + 1,  b - t + 1
     border_size = max(20, int(max(width, height) * border_size)) if border_size > 0. else 0
-    t, l, b, r = max(0, t-border_size), max(0, l-border_size), min(img.shape[0]-1, b+border_size), min(img.shape[1]-1, r+border_size)
+    t, l, b, r = max(0, t-border_size), max(0, l-border_size), min(img_shape[0]-1, b+border_size), min(img_shape[1]-1, r+border_size)
     width, height = r - l + 1,  b - t + 1
     down_scale_factor = min(target_width / width, target_height / height)
     if down_scale_factor > 1.0:
@@ -40,9 +40,9 @@ def crop_to_box_v3(box: Box, img: Image, mask_img: Mask, target_size: tuple[int,
     missing_width, missing_height = int((target_width - (width * down_scale_factor)) / down_scale_factor), int((target_height - (height * down_scale_factor)) / down_scale_factor)
 
     available_width_l = l
-    available_width_r = (img.shape[1]-1) - r
+    available_width_r = (img_shape[1]-1) - r
     available_height_t = t
-    available_height_b = (img.shape[0]-1) - b
+    available_height_b = (img_shape[0]-1) - b
 
     budget_width = int(max_box_expansion_factor * width)
     budget_height = int(max_box_expansion_factor * height)
@@ -59,8 +59,6 @@ def crop_to_box_v3(box: Box, img: Image, mask_img: Mask, target_size: tuple[int,
             r + math.ceil(expand_width_lr/2) + expand_width_r)
     t, b = (t - math.floor(expand_height_tb/2) - expand_height_t,
             b + math.ceil(expand_height_tb/2) + expand_height_b)
-    img = img[t:b + 1, l:r + 1]
-    mask_img = mask_img[t:b + 1, l:r + 1]
 
     width, height = r - l + 1,  b - t + 1
     if down_scale_factor <= 1.0:
@@ -69,6 +67,28 @@ def crop_to_box_v3(box: Box, img: Image, mask_img: Mask, target_size: tuple[int,
         scale_factor = min(target_width / width, target_height / height)
 
     cropped_box = t, l, b, r
+    return cropped_box, scale_factor
+
+def crop_to_box_v3(box: Box, img: Image, mask_img: Mask, target_size: tuple[int, int], max_box_expansion_factor=1.0, border_size=0):
+    """
+    Crops Mask and Image by using Box. Will try to grow Box to better fit target size
+    Parameters
+    ----------
+    box
+    img
+    mask_img
+    target_size
+    max_box_expansion_factor: Limits how much to grow the Box before cropping. Could be useful for tiny Boxes (compared to given target size)
+    border_size: includes area outside of box. useful to additional context outside the box detection
+
+    Returns
+    -------
+    img, mask_img, cropped_box, scale_factor
+    """
+    cropped_box, scale_factor = get_crop_box_v3(box, img.shape, target_size, max_box_expansion_factor, border_size)
+    t, l, b, r = cropped_box
+    img = img[t:b + 1, l:r + 1]
+    mask_img = mask_img[t:b + 1, l:r + 1]
+
     assert img.shape[:2] == mask_img.shape[:2] == (cropped_box[2]-cropped_box[0]+1, cropped_box[3]-cropped_box[1]+1)
     return img, mask_img, cropped_box, scale_factor
-
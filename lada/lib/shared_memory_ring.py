@@ -0,0 +1,69 @@
+import queue
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+
+class SharedMemoryRing:
+    """
+    Passes numpy arrays between processes through a fixed number of equally sized slots in shared memory.
+    Only the slot index, array shapes and small metadata go through a multiprocessing queue, array data is copied once
+    into the slot by the producer and once out of it by the consumer instead of being pickled and sent through a pipe.
+    Items which don't fit into a slot will be sent pickled through the queue.
+
+    The ring is created by the parent process and can be passed as argument to a child process.
+    """
+    def __init__(self, slot_count: int, slot_size: int, mp_context):
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_count * slot_size)
+        self.free_slots = mp_context.Queue()
+        for slot in range(slot_count):
+            self.free_slots.put(slot)
+        self.items = mp_context.Queue()
+
+    def put(self, arrays: list[np.ndarray], metadata, should_stop: Callable[[], bool] = lambda: False) -> bool:
+        """
+        Blocks until a slot is free. Returns False if should_stop() returned True while waiting.
+        """
+        if sum(array.nbytes for array in arrays) > self.slot_size:
+            self.items.put((None, metadata, arrays))
+            return True
+        while True:
+            try:
+                slot = self.free_slots.get(timeout=0.05)
+                break
+            except queue.Empty:
+                if should_stop():
+                    return False
+        offset = slot * self.slot_size
+        layout = []
+        for array in arrays:
+            np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf, offset=offset)[...] = array
+            layout.append((array.shape, array.dtype.str, offset))
+            offset += array.nbytes
+        self.items.put((slot, metadata, layout))
+        return True
+
+    def put_metadata(self, metadata):
+        """
+        Send item without any array data, e.g. end of stream markers
+        """
+        self.items.put((None, metadata, []))
+
+    def get(self, timeout: float | None = None) -> tuple[list[np.ndarray], object]:
+        """
+        Returns copies of the arrays, slot is free to be reused by the producer afterward. Raises queue.Empty on timeout.
+        """
+        slot, metadata, layout = self.items.get(timeout=timeout)
+        if slot is None:
+            return layout, metadata
+        arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.shm.buf, offset=offset).copy() for shape, dtype, offset in layout]
+        self.free_slots.put(slot)
+        return arrays, metadata
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
@@ -1,17 +1,24 @@
-import json
+import copy
+import dataclasses
 import os
 import re
 import subprocess
 from contextlib import contextmanager
+from dataclasses import dataclass
 from fractions import Fraction
 from typing import Callable
 import pathlib
+import queue
+import threading
+import time
 
 import av
 import cv2
 import numpy as np
 
-from lada.lib import Image, Mask, VideoMetadata
+from lada import DECODE_THREADS, CACHE_DIR, PROBE_DISK_CACHE
+from lada.lib import Image, Mask, VideoMetadata, cache_utils, yuv_utils
+from lada.lib.buffer_pool import BufferPool, get_buffer_pool
 
 
 def read_video_frames(path: str, float32: bool = True, start_idx: int = 0, end_idx: int | None = None, normalize_neg1_pos1 = False, binary_frames=False) -> list[np.ndarray]:
@@ -66,74 +73,230 @@ def VideoReaderOpenCV(*args, **kwargs):
     finally:
         cap.release()
 
+class LazyVideoFrame:
+    """
+    Decoded video frame which will only be converted to a full resolution BGR image when its pixels are accessed.
+    shape and indexing behave like the converted image.
+    """
+    def __init__(self, frame: av.VideoFrame):
+        self.frame = frame
+        self.shape = (frame.height, frame.width, 3)
+        self._img: Image | None = None
+
+    def to_ndarray(self) -> Image:
+        if self._img is None:
+            self._img = self.frame.to_ndarray(format='bgr24')
+        return self._img
+
+    def to_resized_ndarray(self, height: int, width: int) -> Image:
+        """
+        Scales and converts the frame to BGR in a single swscale pass, the full resolution image will not be created
+        """
+        return self.frame.reformat(width=width, height=height, format='bgr24', interpolation='BILINEAR').to_ndarray()
+
+    def __getitem__(self, item):
+        return self.to_ndarray()[item]
+
 class VideoReader:
-    def __init__(self, file):
+    """
+    decode_threads: Number of threads FFmpeg uses for frame- and slice-threaded decoding. 0 lets FFmpeg choose based on
+    the number of CPU cores.
+    prefetch_frames: If > 0, frames will be decoded ahead in a separate thread and up to prefetch_frames decoded frames
+    will be buffered. Decoding then overlaps with the work of the consumer of frames().
+    """
+    def __init__(self, file, decode_threads: int = DECODE_THREADS, prefetch_frames: int = 0):
         self.file = file
         self.container = None
+        self.decode_threads = decode_threads
+        self.prefetch_frames = prefetch_frames
+        self._prefetch_thread: threading.Thread | None = None
+        self._prefetch_stop_requested: threading.Event | None = None
+        # frames before this pts will be dropped after a frame-accurate seek, see seek_frame()
+        self._skip_until_pts: int | None = None
 
     def __enter__(self):
         self.container = av.open(self.file)
+        stream = self.container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        stream.codec_context.thread_count = self.decode_threads
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        self._stop_prefetch_thread()
         self.container.close()
 
-    def frames(self):
+    def _decode_container(self):
         for frame in self.container.decode(video=0):
+            if self._skip_until_pts is not None:
+                if frame.pts is not None and frame.pts < self._skip_until_pts:
+                    continue
+                self._skip_until_pts = None
+            yield frame
+
+    def _decode(self):
+        if self.prefetch_frames <= 0:
+            yield from self._decode_container()
+            return
+        self._stop_prefetch_thread()
+        prefetch_queue = queue.Queue(maxsize=self.prefetch_frames)
+        stop_requested = threading.Event()
+        prefetch_thread = threading.Thread(target=self._prefetch_worker, args=(prefetch_queue, stop_requested), name="video decoder", daemon=True)
+        self._prefetch_thread, self._prefetch_stop_requested = prefetch_thread, stop_requested
+        prefetch_thread.start()
+        try:
+            while (item := prefetch_queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # generator of a previous frames() call may get closed after a new one was started
+            if self._prefetch_thread is prefetch_thread:
+                self._stop_prefetch_thread()
+
+    def _prefetch_worker(self, prefetch_queue: queue.Queue, stop_requested: threading.Event):
+        def put(item) -> bool:
+            while not stop_requested.is_set():
+                try:
+                    prefetch_queue.put(item, timeout=0.05)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for frame in self._decode_container():
+                if not put(frame):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    def _stop_prefetch_thread(self):
+        if self._prefetch_thread is not None:
+            self._prefetch_stop_requested.set()
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+            self._prefetch_stop_requested = None
+
+    def frames(self):
+        for frame in self._decode():
             frame_img = frame.to_ndarray(format='bgr24')
             yield frame_img, frame.pts
 
+    def yuv420p_frames(self, buffer_pool: BufferPool | None = None):
+        """
+        Frames as planar YUV 4:2:0 arrays, see yuv_utils.YUV420Image. Video width and height must be even.
+        Arrays are taken from the buffer pool, consumers can release them when they're done with them.
+        """
+        buffer_pool = buffer_pool or get_buffer_pool()
+        for frame in self._decode():
+            if frame.format.name != 'yuv420p':
+                frame = frame.reformat(format='yuv420p')
+            frame_img = buffer_pool.acquire((frame.height * 3 // 2, frame.width))
+            # copy planes directly into the buffer, rows of the planes can be padded for alignment
+            for plane, plane_img in zip(frame.planes, yuv_utils.get_planes(frame_img)):
+                plane_img[...] = np.frombuffer(plane, dtype=np.uint8).reshape(-1, plane.line_size)[:plane_img.shape[0], :plane_img.shape[1]]
+            yield frame_img, frame.pts
+
+    def lazy_frames(self):
+        for frame in self._decode():
+            yield LazyVideoFrame(frame), frame.pts
+
     def seek(self, offset_ns):
+        # the decoder thread must not access the container while seeking
+        self._stop_prefetch_thread()
+        self._skip_until_pts = None
         offset = int((offset_ns / 1_000_000_000) * av.time_base)
         self.container.seek(offset)
 
+    def seek_frame(self, frame_num: int, keyframe_index):
+        """
+        Frame-accurate seek using a KeyframeIndex (see keyframe_index.get_keyframe_index()): Seeks to the keyframe
+        the given frame depends on and drops decoded frames until the given frame.
+        """
+        self._stop_prefetch_thread()
+        keyframe_pts, _ = keyframe_index.keyframe_for_frame(frame_num)
+        self.container.seek(keyframe_pts, stream=self.container.streams.video[0], backward=True, any_frame=False)
+        self._skip_until_pts = keyframe_index.frame_pts[frame_num]
+
+PROBE_CACHE_VERSION = 2
+PROBE_CACHE_DIR = os.path.join(CACHE_DIR, "probe")
+
+@dataclass
+class ProbeResult:
+    video_metadata: VideoMetadata
+    audio_codec: str | None
+
+    def to_dict(self) -> dict:
+        video_metadata = {k: str(v) if isinstance(v, Fraction) else v for k, v in dataclasses.asdict(self.video_metadata).items()}
+        return dict(video_metadata=video_metadata, audio_codec=self.audio_codec)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ProbeResult':
+        video_metadata = data['video_metadata']
+        for field in ('video_fps_exact', 'time_base'):
+            video_metadata[field] = Fraction(video_metadata[field])
+        return cls(video_metadata=VideoMetadata(**video_metadata), audio_codec=data['audio_codec'])
+
+def _probe(path: str) -> ProbeResult:
+    with av.open(path) as container:
+        if len(container.streams.video) == 0:
+            raise Exception(f"error probing {path}: no video stream")
+        stream = container.streams.video[0]
+        time_base = stream.time_base
+        fps_exact = stream.base_rate or stream.average_rate
+        average_fps_exact = stream.average_rate or fps_exact
+        if stream.duration is not None:
+            duration = float(stream.duration * time_base)
+        else:
+            duration = container.duration / av.time_base
+        frame_count = stream.frames
+        if not frame_count:
+            # container doesn't store number of frames, estimate it like OpenCV CAP_PROP_FRAME_COUNT
+            frame_count = round(duration * average_fps_exact)
+        audio_codec = container.streams.audio[0].codec_context.codec.canonical_name.lower() if len(container.streams.audio) > 0 else None
+        video_metadata = VideoMetadata(
+            video_file=path,
+            video_height=stream.codec_context.height,
+            video_width=stream.codec_context.width,
+            video_fps=float(fps_exact),
+            average_fps=float(average_fps_exact),
+            video_fps_exact=Fraction(fps_exact),
+            codec_name=stream.codec_context.codec.canonical_name,
+            frames_count=int(frame_count),
+            duration=duration,
+            time_base=Fraction(time_base),
+            start_pts=stream.start_time if stream.start_time is not None else 0
+        )
+    return ProbeResult(video_metadata, audio_codec)
+
+_probe_results: dict[cache_utils.FileKey, ProbeResult] = {}
+_probe_results_lock = threading.Lock()
+
+def probe_video_file(path: str, disk_cache: bool = PROBE_DISK_CACHE) -> ProbeResult:
+    """
+    Reads video metadata and audio codec in a single open of the file (in-process, no ffprobe subprocess).
+    Results are memoized by path, modification time and size and, if disk_cache is enabled, also saved in PROBE_CACHE_DIR.
+    """
+    path = str(pathlib.Path(path).resolve())
+    file_key = cache_utils.get_file_key(path)
+    with _probe_results_lock:
+        probe_result = _probe_results.get(file_key)
+    if probe_result is None and disk_cache:
+        cached = cache_utils.load_cached_json(PROBE_CACHE_DIR, file_key, PROBE_CACHE_VERSION)
+        probe_result = ProbeResult.from_dict(cached) if cached is not None else None
+    if probe_result is None:
+        probe_result = _probe(path)
+        if disk_cache:
+            cache_utils.save_cached_json(PROBE_CACHE_DIR, file_key, PROBE_CACHE_VERSION, probe_result.to_dict())
+    with _probe_results_lock:
+        _probe_results[file_key] = probe_result
+    # callers may modify the returned metadata
+    return copy.deepcopy(probe_result)
+
 def get_video_meta_data(path: str) -> VideoMetadata:
-    # Convert path to Windows format with backslashes and ensure it's properly escaped
-    path = str(pathlib.Path(path).resolve()).replace('/', '\\')
-    cmd = ['ffprobe', '-of', 'json', '-select_streams', 'v', '-show_streams', '-show_format', path]
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, err =  p.communicate()
-    if p.returncode != 0:
-        raise Exception(f"error running ffprobe: {err.strip()}. Code: {p.returncode}, cmd: {cmd}")
-    json_output = json.loads(out)
-    json_video_stream = json_output["streams"][0]
-    json_video_format = json_output["format"]
-
-    value = [int(num) for num in json_video_stream['avg_frame_rate'].split("/")]
-    average_fps = value[0]/value[1] if len(value) == 2 else value[0]
-
-    value = [int(num) for num in json_video_stream['r_frame_rate'].split("/")]
-    fps = value[0]/value[1] if len(value) == 2 else value[0]
-    fps_exact = Fraction(value[0], value[1])
-
-    value = [int(num) for num in json_video_stream['time_base'].split("/")]
-    time_base = Fraction(value[0], value[1])
-
-    frame_count = json_video_stream.get('nb_frames')
-    if not frame_count:
-        # print("frame count ffmpeg", frame_count)
-        cap = cv2.VideoCapture(path)
-        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-        cap.release()
-        # print("frame count opencv", frame_count)
-    frame_count=int(frame_count)
-
-    start_pts = json_video_stream.get('start_pts')
-
-    metadata = VideoMetadata(
-        video_file=path,
-        video_height=int(json_video_stream['height']),
-        video_width=int(json_video_stream['width']),
-        video_fps=fps,
-        average_fps=average_fps,
-        video_fps_exact=fps_exact,
-        codec_name=json_video_stream['codec_name'],
-        frames_count=frame_count,
-        duration=float(json_video_stream.get('duration', json_video_format['duration'])),
-        time_base=time_base,
-        start_pts=start_pts
-    )
-    return metadata
+    return probe_video_file(path).video_metadata
 
 def offset_ns_to_frame_num(offset_ns, video_fps_exact):
     return int(Fraction(offset_ns, 1_000_000_000) * video_fps_exact)
@@ -220,6 +383,11 @@ def approx_max_length_by_memory_limit(video_metadata: VideoMetadata, limit_in_me
     max_length_seconds = int(max_length_frames / video_metadata.video_fps)
     return max_length_seconds
 
+STREAMING_FORMATS = ('fmp4', 'hls')
+
+def get_hls_segment_filename(output_path: str) -> str:
+    return f"{os.path.splitext(output_path)[0]}_%05d.ts"
+
 class VideoWriter:
     def parse_custom_options(self, custom_encoder_options):
         # squeeze spaces
@@ -249,8 +417,29 @@ class VideoWriter:
         encoder_defaults['hevc'] = libx265
         return encoder_defaults
 
-    def __init__(self, output_path, width, height, fps, codec, crf=None, preset=None, time_base=None, moov_front=False, custom_encoder_options=None):
-        container_options = {"movflags": "+frag_keyframe+empty_moov+faststart"} if moov_front else {}
+    def __init__(self, output_path, width, height, fps, codec, crf=None, preset=None, time_base=None, moov_front=False, custom_encoder_options=None,
+                 streaming_format: str | None = None, audio_source: str | None = None, hls_segment_duration: int = 4,
+                 pix_fmt: str | None = None, extra_encoder_options: dict[str, str] | None = None):
+        """
+        pix_fmt and extra_encoder_options (applied before custom_encoder_options) override the encoder defaults.
+        streaming_format 'fmp4' (fragmented MP4) or 'hls' (playlist and MPEG-TS segments, see get_hls_segment_filename())
+        writes the output progressively: It can be played or ingested while it's being written and there is no
+        finalization pass at the end.
+        If audio_source is given, the first audio stream of this file will be interleaved with the video. It's copied if
+        the container supports its codec, otherwise it's converted to AAC. Frame pts need to be the ones of the source file.
+        """
+        container_format = None
+        if streaming_format == 'fmp4':
+            container_format = 'mp4'
+            container_options = {"movflags": "+frag_keyframe+empty_moov+default_base_moof"}
+        elif streaming_format == 'hls':
+            container_format = 'hls'
+            container_options = {"hls_time": str(hls_segment_duration), "hls_playlist_type": "event",
+                                 "hls_segment_filename": get_hls_segment_filename(output_path)}
+        elif streaming_format is None:
+            container_options = {"movflags": "+frag_keyframe+empty_moov+faststart"} if moov_front else {}
+        else:
+            raise ValueError(f"unknown streaming format {streaming_format}, supported: {', '.join(STREAMING_FORMATS)}")
         encoder_defaults = self.get_default_encoder_options()
         encoder_options = encoder_defaults.get(codec, {})
 
@@ -263,13 +452,17 @@ class VideoWriter:
         if preset:
             encoder_options['preset'] = preset
 
+        if extra_encoder_options:
+            encoder_options.update(extra_encoder_options)
         if custom_encoder_options:
             encoder_options.update(self.parse_custom_options(custom_encoder_options))
 
-        output_container = av.open(output_path, "w", options=container_options)
+        output_container = av.open(output_path, "w", format=container_format, options=container_options)
         video_stream_out = output_container.add_stream(codec, fps)
         video_stream_out.width = width
         video_stream_out.height = height
+        if pix_fmt:
+            video_stream_out.pix_fmt = pix_fmt
         video_stream_out.thread_count = 0
         video_stream_out.thread_type = 3
         video_stream_out.time_base = time_base
@@ -277,6 +470,66 @@ class VideoWriter:
         self.output_container = output_container
         self.video_stream = video_stream_out
         self.time_base = time_base
+        self.fps = fps
+        self.preset = encoder_options.get('preset')
+        self._frame_pool: dict[str, av.VideoFrame] = {}
+
+        self.stats = {}
+        self.stats["frames"] = 0
+        self.stats["encode_duration"] = 0.
+
+        self._audio_input_container = None
+        self._audio_packets = None
+        self._pending_audio_packet = None
+        self._audio_stream_out = None
+        self._audio_transcode = False
+        if audio_source:
+            self._open_audio(audio_source)
+
+    def _open_audio(self, audio_source: str):
+        input_container = av.open(audio_source)
+        if len(input_container.streams.audio) == 0:
+            input_container.close()
+            return
+        audio_stream_in = input_container.streams.audio[0]
+        if audio_stream_in.codec_context.codec.canonical_name in self.output_container.supported_codecs:
+            self._audio_stream_out = self.output_container.add_stream_from_template(audio_stream_in)
+        else:
+            self._audio_stream_out = self.output_container.add_stream('aac', rate=audio_stream_in.rate, layout=audio_stream_in.layout.name)
+            self._audio_transcode = True
+        self._audio_input_container = input_container
+        self._audio_packets = input_container.demux(audio_stream_in)
+
+    def _mux_audio(self, until_time: float | None):
+        """
+        Muxes audio packets up to until_time (in seconds). All remaining packets if None.
+        """
+        while self._audio_packets is not None:
+            if self._pending_audio_packet is None:
+                self._pending_audio_packet = next(self._audio_packets, None)
+                if self._pending_audio_packet is None:
+                    self._close_audio()
+                    return
+            packet = self._pending_audio_packet
+            if until_time is not None and packet.pts is not None and packet.pts * packet.time_base > until_time:
+                return
+            self._pending_audio_packet = None
+            if packet.size == 0:
+                # flush packet at the end of the stream
+                continue
+            if self._audio_transcode:
+                for frame in packet.decode():
+                    self.output_container.mux(self._audio_stream_out.encode(frame))
+            else:
+                packet.stream = self._audio_stream_out
+                self.output_container.mux(packet)
+
+    def _close_audio(self):
+        if self._audio_transcode:
+            self.output_container.mux(self._audio_stream_out.encode(None))
+        self._audio_packets = None
+        self._audio_input_container.close()
+        self._audio_input_container = None
 
     def __enter__(self):
         return self
@@ -284,18 +537,60 @@ class VideoWriter:
     def __exit__(self, exc_type, exc_value, traceback):
         self.release()
 
-    def write(self, frame, frame_pts=None, bgr2rgb=False):
-        if bgr2rgb:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        out_frame = av.VideoFrame.from_ndarray(frame, format='rgb24')
-        if frame_pts:
-            out_frame.pts = frame_pts
+    def _get_out_frame(self, frame: Image, pix_fmt: str) -> av.VideoFrame:
+        """
+        Copies the image into a VideoFrame which is reused for all frames of the same pixel format.
+        The encoder converts it to its own pixel format (with a swscale context PyAV keeps across frames) before encoding,
+        so it doesn't hold a reference to the pooled frame. If no conversion is needed a new frame is created instead.
+        """
+        if self.video_stream.codec_context.pix_fmt == pix_fmt or pix_fmt not in ('bgr24', 'rgb24'):
+            return av.VideoFrame.from_ndarray(frame, format=pix_fmt)
+        out_frame = self._frame_pool.get(pix_fmt)
+        height, width = frame.shape[:2]
+        if out_frame is None or out_frame.width != width or out_frame.height != height:
+            out_frame = av.VideoFrame(width, height, pix_fmt)
+            self._frame_pool[pix_fmt] = out_frame
+        plane = out_frame.planes[0]
+        # rows of the plane can be padded for alignment
+        plane_array = np.frombuffer(plane, dtype=np.uint8).reshape(height, plane.line_size)
+        plane_array[:, :width * 3] = frame.reshape(height, width * 3)
+        return out_frame
+
+    def write(self, frame: Image, frame_pts=None, bgr2rgb=False):
+        """
+        frame is expected to be in RGB order. If bgr2rgb is set, frame is a BGR image (as decoded by VideoReader)
+        and will be passed as is to the encoder so there is only a single color conversion (BGR to the encoder's YUV format).
+        """
+        out_frame = self._get_out_frame(frame, 'bgr24' if bgr2rgb else 'rgb24')
+        out_frame.pts = frame_pts if frame_pts else None
+        self._encode(out_frame)
+
+    def write_yuv420p(self, frame, frame_pts=None):
+        """
+        frame is a planar YUV 4:2:0 array, see yuv_utils.YUV420Image. Usually the pixel format of the encoder, so there
+        is no color conversion at all.
+        """
+        out_frame = self._get_out_frame(frame, 'yuv420p')
+        out_frame.pts = frame_pts if frame_pts else None
+        self._encode(out_frame)
+
+    def _encode(self, out_frame: av.VideoFrame):
+        s = time.time()
         out_packet = self.video_stream.encode(out_frame)
         self.output_container.mux(out_packet)
+        self.stats["encode_duration"] += time.time() - s
+        self.stats["frames"] += 1
+        if self._audio_packets is not None:
+            if out_frame.pts is not None and self.time_base:
+                self._mux_audio(float(out_frame.pts * self.time_base))
+            else:
+                self._mux_audio(self.stats["frames"] / float(self.fps))
 
     def release(self):
         out_packet = self.video_stream.encode(None)
         self.output_container.mux(out_packet)
+        if self._audio_packets is not None:
+            self._mux_audio(None)
         self.output_container.close()
 
 def is_video_file(file_path):
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+
+from lada.lib import Image, Box
+
+"""
+Planar YUV 4:2:0 frame (yuv420p / I420) as returned by av.VideoFrame.to_ndarray(format='yuv420p') and used by
+cv2.COLOR_BGR2YUV_I420: Y plane followed by U and V plane (each of half width and half height) in a single array.
+Shape: (H * 3 / 2, W), H and W must be even.
+"""
+type YUV420Image = np.ndarray[np.uint8]
+
+def get_planes(frame: YUV420Image) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns views of the Y, U and V planes of the frame
+    """
+    h, w = frame.shape[0] * 2 // 3, frame.shape[1]
+    flat = frame.reshape(-1)
+    y = flat[:h * w].reshape(h, w)
+    u = flat[h * w:h * w + (h // 2) * (w // 2)].reshape(h // 2, w // 2)
+    v = flat[h * w + (h // 2) * (w // 2):].reshape(h // 2, w // 2)
+    return y, u, v
+
+def _align_box(box: Box, height: int, width: int) -> Box:
+    """
+    Extends box so it starts at even and ends at odd coordinates: The box then covers whole 2x2 chroma samples
+    """
+    t, l, b, r = box
+    return t - t % 2, l - l % 2, min(height - 1, b | 1), min(width - 1, r | 1)
+
+def blend_bgr_patch(frame: YUV420Image, box: Box, patch: Image, blend_mask: np.ndarray):
+    """
+    Blends the BGR patch covering box into the frame in-place: frame = frame * (1 - blend_mask) + patch * blend_mask.
+    Only the patch is converted (BT.601 limited range, like swscale's default for yuv420p <-> bgr24). As the conversion
+    is affine, blending in YUV is the same as blending in BGR. Chroma is blended with the mean of the blend mask of
+    each 2x2 block.
+    """
+    y, u, v = get_planes(frame)
+    height, width = y.shape
+    t, l, b, r = box
+    at, al, ab, ar = _align_box(box, height, width)
+    pad = ((t - at, ab - b), (l - al, ar - r))
+    patch = np.pad(patch, pad + ((0, 0),), mode='edge')
+    blend_mask = np.pad(blend_mask, pad, mode='constant', constant_values=0)
+
+    patch_y, patch_u, patch_v = get_planes(cv2.cvtColor(patch, cv2.COLOR_BGR2YUV_I420))
+    blend_mask_chroma = blend_mask.reshape(blend_mask.shape[0] // 2, 2, blend_mask.shape[1] // 2, 2).mean(axis=(1, 3))
+
+    def blend(plane: np.ndarray, plane_patch: np.ndarray, mask: np.ndarray, region: tuple[slice, slice]):
+        plane[region] = (plane[region] * (1 - mask) + plane_patch * mask).round().clip(0, 255).astype(np.uint8)
+
+    blend(y, patch_y, blend_mask, (slice(at, ab + 1), slice(al, ar + 1)))
+    chroma_region = (slice(at // 2, (ab + 1) // 2), slice(al // 2, (ar + 1) // 2))
+    blend(u, patch_u, blend_mask_chroma, chroma_region)
+    blend(v, patch_v, blend_mask_chroma, chroma_region)
+
+def to_bgr(frame: YUV420Image) -> Image:
+    return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)
@@ -0,0 +1,46 @@
+import json
+import urllib.error
+import urllib.request
+from typing import Iterator
+
+from lada.server.main import DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_SERVER_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+class ServerError(Exception):
+    pass
+
+def _request(server_url: str, method: str, path: str, body: dict | None = None, timeout: float | None = 30.):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(server_url.rstrip("/") + path, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        return urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get("error", e.reason)
+        except ValueError:
+            message = e.reason
+        raise ServerError(message) from e
+    except urllib.error.URLError as e:
+        raise ServerError(f"could not connect to lada-server at {server_url}: {e.reason}") from e
+
+def submit_job(server_url: str, input_path: str, output_path: str, priority: int = 0, options: dict | None = None) -> dict:
+    with _request(server_url, "POST", "/jobs", dict(input=input_path, output=output_path, priority=priority, options=options or {})) as response:
+        return json.loads(response.read())
+
+def get_job(server_url: str, job_id: str) -> dict:
+    with _request(server_url, "GET", f"/jobs/{job_id}") as response:
+        return json.loads(response.read())
+
+def cancel_job(server_url: str, job_id: str) -> dict:
+    with _request(server_url, "DELETE", f"/jobs/{job_id}") as response:
+        return json.loads(response.read())
+
+def stream_job_events(server_url: str, job_id: str) -> Iterator[dict]:
+    """
+    Yields job status updates until the job reached a final state (finished, failed or cancelled)
+    """
+    with _request(server_url, "GET", f"/jobs/{job_id}/events", timeout=None) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,322 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lada import MODEL_WEIGHTS_DIR, VERSION, LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8421
+
+"""
+Job options a client can set per job. Models are shared by all jobs so they can only be chosen when starting the server.
+"""
+JOB_OPTIONS = dict(
+    codec="h264",
+    crf=None,
+    preset=None,
+    moov_front=False,
+    custom_encoder_options=None,
+    max_clip_length=180,
+    preserve_relative_scale=True,
+    pipeline_executor="thread",
+    detection_stride=1,
+    frame_format="bgr24",
+)
+
+JOB_FINAL_STATES = ("finished", "failed", "cancelled")
+
+"""
+Jobs in a final state are dropped once they finished longer ago than this or if there are more of them than MAX_FINISHED_JOBS
+"""
+FINISHED_JOB_RETENTION_SECONDS = 24 * 3600
+MAX_FINISHED_JOBS = 1000
+
+@dataclass
+class Job:
+    input_path: str
+    output_path: str
+    priority: int = 0
+    options: dict = field(default_factory=dict)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    frames_processed: int = 0
+    frames_count: int = 0
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self) -> dict:
+        return dict(id=self.id, input=self.input_path, output=self.output_path, priority=self.priority, status=self.status,
+                    frames_processed=self.frames_processed, frames_count=self.frames_count, error=self.error,
+                    created=self.created, started=self.started, finished=self.finished)
+
+class JobServer:
+    """
+    Keeps mosaic detection and restoration models loaded and restores submitted jobs one after another.
+    Jobs with higher priority will be processed first, jobs with the same priority in the order they were submitted.
+    """
+    def __init__(self, device, mosaic_restoration_model_name, mosaic_restoration_model_path, mosaic_restoration_config_path, mosaic_detection_model_path):
+        from lada.lib.frame_restorer import load_models
+        self.device = device
+        self.mosaic_restoration_model_name = mosaic_restoration_model_name
+        self.mosaic_detection_model, self.mosaic_restoration_model, self.preferred_pad_mode = load_models(
+            device, mosaic_restoration_model_name, mosaic_restoration_model_path, mosaic_restoration_config_path, mosaic_detection_model_path
+        )
+        self.jobs: dict[str, Job] = {}
+        # request handlers run on their own threads
+        self._jobs_lock = threading.Lock()
+        self.job_queue = queue.PriorityQueue()
+        self._job_counter = itertools.count()
+        self._jobs_changed = threading.Condition()
+        self.worker_thread: threading.Thread | None = None
+        self.stop_requested = False
+
+    def start(self):
+        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
+        self.worker_thread.start()
+
+    def stop(self):
+        self.stop_requested = True
+        for job in self.list_jobs():
+            job.cancel_requested.set()
+        # wake up worker
+        self.job_queue.put((float('-inf'), -1, None))
+        if self.worker_thread:
+            self.worker_thread.join()
+
+    def submit(self, input_path: str, output_path: str, priority: int = 0, options: dict | None = None) -> Job:
+        unknown_options = set(options or {}) - set(JOB_OPTIONS)
+        if unknown_options:
+            raise ValueError(f"unknown job options: {', '.join(unknown_options)}")
+        if not os.path.isfile(input_path):
+            raise ValueError(f"input file {input_path} does not exist")
+        job = Job(input_path, output_path, priority=priority, options={**JOB_OPTIONS, **(options or {})})
+        self._prune_jobs()
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+        # PriorityQueue returns smallest entries first. Counter keeps submission order for jobs with same priority
+        self.job_queue.put((-priority, next(self._job_counter), job))
+        logger.info(f"job {job.id}: queued {input_path} (priority {priority})")
+        self._notify()
+        return job
+
+    def get_job(self, job_id: str) -> Job | None:
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> list[Job]:
+        with self._jobs_lock:
+            return list(self.jobs.values())
+
+    def _prune_jobs(self):
+        now = time.time()
+        with self._jobs_lock:
+            finished_jobs = sorted((job for job in self.jobs.values() if job.status in JOB_FINAL_STATES and job.finished is not None),
+                                   key=lambda job: job.finished, reverse=True)
+            for idx, job in enumerate(finished_jobs):
+                if idx >= MAX_FINISHED_JOBS or now - job.finished > FINISHED_JOB_RETENTION_SECONDS:
+                    del self.jobs[job.id]
+
+    def cancel(self, job: Job):
+        job.cancel_requested.set()
+        if job.status == "queued":
+            # will be dropped by worker once it's taken from the queue
+            self._update(job, status="cancelled", finished=time.time())
+        logger.info(f"job {job.id}: cancel requested")
+
+    def wait_for_update(self, timeout: float):
+        with self._jobs_changed:
+            self._jobs_changed.wait(timeout)
+
+    def _notify(self):
+        with self._jobs_changed:
+            self._jobs_changed.notify_all()
+
+    def _update(self, job: Job, **kwargs):
+        for key, value in kwargs.items():
+            setattr(job, key, value)
+        self._notify()
+
+    def _worker(self):
+        while not self.stop_requested:
+            _, _, job = self.job_queue.get()
+            if job is None or job.status != "queued":
+                continue
+            self._update(job, status="running", started=time.time())
+            logger.info(f"job {job.id}: started")
+            try:
+                success = self._restore(job)
+                if job.cancel_requested.is_set():
+                    self._update(job, status="cancelled")
+                else:
+                    self._update(job, status="finished" if success else "failed")
+            except Exception as e:
+                logger.error(f"job {job.id}: failed", exc_info=e)
+                self._update(job, status="failed", error=str(e))
+            self._update(job, finished=time.time())
+            logger.info(f"job {job.id}: {job.status}")
+            self._prune_jobs()
+
+    def _restore(self, job: Job) -> bool:
+        """
+        Runs the same restore loop as lada-cli, job options take the place of its command line arguments
+        """
+        from lada.cli.main import Job as RestoreJob, restore_video
+        from lada.lib.video_utils import get_video_meta_data
+
+        video_metadata = get_video_meta_data(job.input_path)
+        self._update(job, frames_count=video_metadata.frames_count)
+        args = argparse.Namespace(device=self.device, mosaic_restoration_model=self.mosaic_restoration_model_name,
+                                  ranges=None, streaming_output=None, **job.options)
+
+        def on_progress(frames_processed: int):
+            job.frames_processed = frames_processed
+            if frames_processed % 25 == 0:
+                self._notify()
+
+        return restore_video(args, RestoreJob(job.input_path, job.output_path), self.mosaic_detection_model, self.mosaic_restoration_model,
+                             self.preferred_pad_mode, video_metadata=video_metadata, cancel_event=job.cancel_requested,
+                             progress_callback=on_progress)
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API:
+        POST   /jobs              submit job {"input": ..., "output": ..., "priority": 0, "options": {...}}
+        GET    /jobs              list all jobs
+        GET    /jobs/<id>         job status
+        GET    /jobs/<id>/events  stream job status as newline-delimited JSON until job reached a final state
+        DELETE /jobs/<id>         cancel job
+    """
+    server_version = f"lada-server/{VERSION}"
+    protocol_version = "HTTP/1.0"
+
+    @property
+    def job_server(self) -> JobServer:
+        return self.server.job_server
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, obj, status=HTTPStatus.OK):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(dict(error=message), status=status)
+
+    def _get_job(self, job_id) -> Job | None:
+        job = self.job_server.get_job(job_id)
+        if job is None:
+            self._send_error(HTTPStatus.NOT_FOUND, f"job {job_id} not found")
+        return job
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            self._send_json([job.to_dict() for job in self.job_server.list_jobs()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            if job := self._get_job(parts[1]):
+                self._send_json(job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            if job := self._get_job(parts[1]):
+                self._stream_events(job)
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "not found")
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            self._send_error(HTTPStatus.NOT_FOUND, "not found")
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            job = self.job_server.submit(request["input"], request["output"], int(request.get("priority", 0)), request.get("options"))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, f"invalid job: {e}")
+            return
+        self._send_json(job.to_dict(), status=HTTPStatus.CREATED)
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "jobs":
+            if job := self._get_job(parts[1]):
+                self.job_server.cancel(job)
+                self._send_json(job.to_dict())
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "not found")
+
+    def _stream_events(self, job: Job):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        last_event = None
+        try:
+            while True:
+                event = job.to_dict()
+                if event != last_event:
+                    self.wfile.write(json.dumps(event).encode() + b"\n")
+                    self.wfile.flush()
+                    last_event = event
+                if job.status in JOB_FINAL_STATES:
+                    break
+                self.job_server.wait_for_update(timeout=1.)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug(f"job {job.id}: event stream client disconnected")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keeps models loaded and restores videos submitted by clients like 'lada-cli --server'")
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help="Only bind to other addresses than localhost if you trust your network. There is no authentication (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="(default: %(default)s)")
+    parser.add_argument('--device', type=str, default="cuda:0", help='torch device to run the models on. Use "cpu" or "cuda". If you have multiple GPUs you can select a specific one via index e.g. "cuda:0" (default: %(default)s)')
+    parser.add_argument('--mosaic-restoration-model', type=str, default="basicvsrpp-generic", help="(default: %(default)s)")
+    parser.add_argument('--mosaic-restoration-model-path', type=str, help="(default: model weights file of the selected --mosaic-restoration-model in %s)" % MODEL_WEIGHTS_DIR)
+    parser.add_argument('--mosaic-restoration-config-path', type=str)
+    parser.add_argument('--mosaic-detection-model-path', type=str, default=os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_detection_model_v3.pt'), help="(default: %(default)s)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    import torch
+    from lada.cli.main import get_default_mosaic_restoration_model_path
+    if args.device.startswith("cuda") and not torch.cuda.is_available():
+        print(f"GPU {args.device} selected but CUDA is not available")
+        exit(1)
+    if not args.mosaic_restoration_model_path:
+        args.mosaic_restoration_model_path = get_default_mosaic_restoration_model_path(args.mosaic_restoration_model)
+
+    job_server = JobServer(args.device, args.mosaic_restoration_model, args.mosaic_restoration_model_path,
+                           args.mosaic_restoration_config_path, args.mosaic_detection_model_path)
+    job_server.start()
+
+    http_server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    http_server.daemon_threads = True
+    http_server.job_server = job_server
+    print(f"lada-server listening on http://{args.host}:{args.port}")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        print("Ctrl-C, stopping server")
+    finally:
+        http_server.server_close()
+        job_server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ['torch', 'ultralytics', 'cv2', 'av', 'mmengine']
+
+def measure_startup(cli_args: list[str], runs: int) -> list[float]:
+    durations = []
+    for _ in range(runs):
+        s = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'lada.cli.main', *cli_args], check=True, stdout=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - s)
+    return durations
+
+def get_eagerly_imported_heavy_modules() -> list[str]:
+    code = "import sys; import lada.cli.main; print(','.join(m for m in %r if m in sys.modules))" % HEAVY_MODULES
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout.strip()
+    return [m for m in output.split(',') if m]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures how long it takes until lada-cli can answer --version and --help. Fails if it takes longer than --max-seconds or if heavy dependencies are imported before the pipeline starts")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=0.5, help="Upper bound for median startup time (default: %(default)s)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    failed = False
+
+    eagerly_imported = get_eagerly_imported_heavy_modules()
+    if eagerly_imported:
+        print(f"FAIL: importing lada.cli.main also imports {', '.join(eagerly_imported)}")
+        failed = True
+
+    for cli_args in (['--version'], ['--help']):
+        durations = measure_startup(cli_args, args.runs)
+        median = statistics.median(durations)
+        ok = median <= args.max_seconds
+        failed |= not ok
+        print(f"{'OK' if ok else 'FAIL'}: lada-cli {' '.join(cli_args)}: median {median:.3f}s, min {min(durations):.3f}s, max {max(durations):.3f}s ({args.runs} runs)")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+from lada import MODEL_WEIGHTS_DIR
+from lada.lib.frame_restorer import load_models, FrameRestorer
+from lada.lib.pipeline_executor import PIPELINE_EXECUTORS
+
+def benchmark(args, executor, models) -> tuple[int, float]:
+    mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode = models
+    frame_restorer = FrameRestorer(args.device, args.input, True, args.max_clip_length, args.mosaic_restoration_model,
+                                   mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode, pipeline_executor=executor)
+    frames_count = 0
+    # process executor loads its model in the constructor, don't count it
+    s = time.time()
+    frame_restorer.start()
+    try:
+        for elem in frame_restorer:
+            if elem is None:
+                raise RuntimeError("frame restorer stopped prematurely")
+            frames_count += 1
+            if args.max_frames and frames_count >= args.max_frames:
+                break
+    finally:
+        frame_restorer.stop()
+    return frames_count, time.time() - s
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compares throughput of the restoration pipeline running MosaicDetector in a thread vs in a separate process. Nothing is encoded")
+    parser.add_argument('--input', type=str, required=True, help="Path to video file")
+    parser.add_argument('--device', type=str, default="cuda:0")
+    parser.add_argument('--max-clip-length', type=int, default=180)
+    parser.add_argument('--max-frames', type=int, default=0, help="Stop after this many frames. 0 means whole file (default: %(default)s)")
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--mosaic-restoration-model', type=str, default="basicvsrpp-generic")
+    parser.add_argument('--mosaic-restoration-model-path', type=str, default=os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_restoration_model_generic_v1.2.pth'))
+    parser.add_argument('--mosaic-detection-model-path', type=str, default=os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_detection_model_v3.pt'))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    models = load_models(args.device, args.mosaic_restoration_model, args.mosaic_restoration_model_path, None, args.mosaic_detection_model_path)
+    print(f"CPU cores: {os.cpu_count()}")
+    for executor in PIPELINE_EXECUTORS:
+        results = [benchmark(args, executor, models) for _ in range(args.runs)]
+        best_fps = max(frames_count / duration for frames_count, duration in results)
+        print(f"{executor}: {best_fps:.1f} fps (best of {args.runs} runs, {results[0][0]} frames)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import queue
+import threading
+import time
+
+from lada import MODEL_WEIGHTS_DIR
+from lada.lib.mosaic_detection_model import MosaicDetectionModel
+from lada.lib.mosaic_detector import MosaicDetector
+from lada.lib.scene_utils import box_iou
+
+def detect(args, model, detection_stride) -> tuple[dict[int, bool], dict[int, list], dict, float]:
+    frame_detection_queue = queue.Queue()
+    mosaic_clip_queue = queue.Queue()
+    mosaic_detector = MosaicDetector(model, args.input, frame_detection_queue, mosaic_clip_queue, max_clip_length=args.max_clip_length,
+                                     device=args.device, dont_preserve_relative_scale=True, detection_stride=detection_stride)
+    boxes: dict[int, list] = {}
+
+    def collect_clips():
+        while (clip := mosaic_clip_queue.get()) is not None:
+            for i, (_, _, box, _, _) in enumerate(clip.data):
+                boxes.setdefault(clip.frame_start + i, []).append(box)
+
+    clip_collector_thread = threading.Thread(target=collect_clips)
+    clip_collector_thread.start()
+    detected = {}
+    s = time.time()
+    mosaic_detector.start(start_ns=0)
+    try:
+        while (elem := frame_detection_queue.get()) is not None:
+            frame_num, mosaic_detected = elem
+            detected[frame_num] = mosaic_detected
+            if args.max_frames and len(detected) >= args.max_frames:
+                break
+    finally:
+        mosaic_detector.stop()
+        duration = time.time() - s
+        clip_collector_thread.join()
+    return detected, boxes, dict(mosaic_detector.detection_stats), duration
+
+def mean_best_iou(reference_boxes: list, boxes: list) -> float:
+    if not reference_boxes and not boxes:
+        return 1.
+    if not reference_boxes or not boxes:
+        return 0.
+    return sum(max(box_iou(reference_box, box) for box in boxes) for reference_box in reference_boxes) / len(reference_boxes)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compares mosaic detections with --detection-stride against detecting every frame: "
+                                                 "frame level agreement, IoU of the clip boxes, number of frames run through the detection model and runtime")
+    parser.add_argument('--input', type=str, required=True, help="Path to video file")
+    parser.add_argument('--device', type=str, default="cuda:0")
+    parser.add_argument('--detection-strides', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--max-clip-length', type=int, default=180)
+    parser.add_argument('--max-frames', type=int, default=0, help="Stop after this many frames. 0 means whole file (default: %(default)s)")
+    parser.add_argument('--mosaic-detection-model-path', type=str, default=os.path.join(MODEL_WEIGHTS_DIR, 'lada_mosaic_detection_model_v3.pt'))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    model = MosaicDetectionModel(args.mosaic_detection_model_path, args.device, classes=[0], conf=0.2)
+    reference_detected, reference_boxes, reference_stats, reference_duration = detect(args, model, 1)
+    frames_count = len(reference_detected)
+    print(f"stride 1: {reference_stats['frames_detected']} frames detected, {reference_duration:.1f}s")
+    for detection_stride in args.detection_strides:
+        detected, boxes, stats, duration = detect(args, model, detection_stride)
+        frame_nums = [frame_num for frame_num in reference_detected if frame_num in detected]
+        agreement = sum(detected[frame_num] == reference_detected[frame_num] for frame_num in frame_nums) / max(1, len(frame_nums))
+        mosaic_frame_nums = [frame_num for frame_num in frame_nums if frame_num in reference_boxes or frame_num in boxes]
+        iou = sum(mean_best_iou(reference_boxes.get(frame_num, []), boxes.get(frame_num, [])) for frame_num in mosaic_frame_nums) / max(1, len(mosaic_frame_nums))
+        yolo_frames = stats['frames_detected'] + stats['frames_detected_residual']
+        print(f"stride {detection_stride}: frame agreement {agreement:.4f}, mean box IoU {iou:.4f}, "
+              f"{yolo_frames}/{frames_count} frames detected ({stats['frames_detected_residual']} due to tracking residual), "
+              f"{stats['frames_interpolated']} interpolated, {duration:.1f}s (speedup {reference_duration / duration:.2f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+import torch
+
+MODEL_WEIGHTS_IN_PATH = 'experiments/basicvsrpp/mosaic_restoration_fast_distill/iter_100000.pth'
+MODEL_WEIGHTS_OUT_PATH = 'experiments/basicvsrpp/mosaic_restoration_fast_distill/lada_mosaic_restoration_model_fast_v1.0.pth'
+
+checkpoint = torch.load(MODEL_WEIGHTS_IN_PATH, map_location='cpu', weights_only=False)
+state_dict = checkpoint.get('state_dict', checkpoint)
+
+# Keep only the student generator (drop teacher and training state). The student is stored as generator and
+# generator_ema so it can be loaded by the same BasicVSRPlusPlusGan inference model as the generic model.
+student_state_dict = {k[len('generator.'):]: v for k, v in state_dict.items() if k.startswith('generator.')}
+inference_state_dict = {}
+for prefix in ('generator.', 'generator_ema.'):
+    inference_state_dict.update({f"{prefix}{k}": v for k, v in student_state_dict.items()})
+
+torch.save(inference_state_dict, MODEL_WEIGHTS_OUT_PATH)
@@ -0,0 +1,40 @@
+import argparse
+import os
+
+from lada.lib.safetensors_utils import save_safetensors, SAFETENSORS_FILE_EXTENSION
+
+def export_basicvsrpp(input_path, output_path):
+    from lada.basicvsrpp.inference import load_generator_state_dict
+    # only the (EMA) generator is needed for inference, drop discriminator and non-EMA weights
+    state_dict = load_generator_state_dict(input_path)
+    save_safetensors(state_dict, output_path, metadata=dict(model='basicvsrpp'))
+
+def export_yolo(input_path, output_path):
+    from ultralytics import YOLO
+    yolo_model = YOLO(input_path)
+    model = yolo_model.model
+    save_safetensors(model.state_dict(), output_path, metadata=dict(
+        model='yolo',
+        task=yolo_model.task,
+        yaml=model.yaml,
+        names=model.names,
+        overrides=yolo_model.overrides))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export model weights into safetensors format which can be memory-mapped and loaded faster')
+    parser.add_argument('--model-type', type=str, choices=['basicvsrpp', 'yolo'], required=True, help="basicvsrpp: mosaic restoration model, yolo: mosaic detection model")
+    parser.add_argument('--input', type=str, required=True, help="Path to model weights .pth (basicvsrpp) or .pt file (yolo)")
+    parser.add_argument('--output', type=str, help="Path to safetensors file. (default: same as --input but with file extension .safetensors)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    output_path = args.output if args.output else os.path.splitext(args.input)[0] + SAFETENSORS_FILE_EXTENSION
+    if args.model_type == 'basicvsrpp':
+        export_basicvsrpp(args.input, output_path)
+    else:
+        export_yolo(args.input, output_path)
+    print(f"Exported weights to {output_path}")
+
+if __name__ == '__main__':
+    main()
@@ -8,13 +8,13 @@ setup(
     python_requires='>=3.12',
     packages=find_packages(where='.',include=['lada','lada.*']),
     # ultralytics pinned as we apply a custom patch. When upstream releases a new version, check if we can remove the patch
-    install_requires=['torch', 'ultralytics==8.3.92', 'numpy', 'opencv-python', 'tqdm', 'av>=14.3.0'],
+    install_requires=['torch', 'ultralytics==8.3.92', 'numpy', 'opencv-python', 'tqdm', 'av>=14.3.0', 'safetensors'],
     extras_require={
         'deepmosaics': ['scikit-image'],
-        'basicvsrpp': ['mmengine==0.10.7', 'torchvision'], # mmengine pinned as we apply a custom patch. When upstream releases a new version, check if we can remove the patch
+        'basicvsrpp': ['torchvision'],
         'gui': ['PyQt6'],
         'gui-dev': ['PyQt6-stubs'],
-        'training': ['torchvision', 'albumentations', 'tensorboard', 'standard-imghdr'],
+        'training': ['mmengine==0.10.7', 'torchvision', 'albumentations', 'tensorboard', 'standard-imghdr'], # mmengine pinned as we apply a custom patch. When upstream releases a new version, check if we can remove the patch
         'dataset-creation': ['lap>=0.5.12', 'timm', 'einops', 'torchvision', 'pillow']
     },
     include_package_data=True,
@@ -24,7 +24,8 @@ setup(
     entry_points={
         'console_scripts': [
             'lada = lada.gui.qt_main:main',
-            'lada-cli = lada.cli.main:main'
+            'lada-cli = lada.cli.main:main',
+            'lada-server = lada.server.main:main'
         ],
     }
 )